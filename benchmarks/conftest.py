@@ -0,0 +1,65 @@
+import pytest
+import sys
+import random
+import networkx as nx
+sys.path.append("./src/")
+
+import wikiLinkRetrieval as wiki
+from wikiFetcher import WikiFetcher
+from mockWikiServer import MockWikiServer
+
+WIKI = "https://en.wikipedia.org"
+
+############################## Synthetic Wiki ##############################
+
+def synthetic_graph(num_nodes : int, out_degree : int, vocabulary : list, seed : int = 0) -> nx.DiGraph:
+    """A random article graph whose titles are pairs of vocabulary words (so that the word2vec players
+    have something to embed, capitalized like real titles), every article links to out_degree random others."""
+    rng = random.Random(seed)
+    titles = set()
+    while len(titles) < num_nodes:
+        titles.add(f"{rng.choice(vocabulary).capitalize()}_{rng.choice(vocabulary)}")
+    urls = [f"{WIKI}/wiki/{title}" for title in sorted(titles)]
+
+    G = nx.DiGraph()
+    G.add_nodes_from(urls)
+    for url in urls:
+        G.add_edges_from((url, adj) for adj in rng.sample(urls, out_degree) if adj != url)
+    return G
+
+############################## Fixtures ##############################
+
+@pytest.fixture(scope="session")
+def vocabulary():
+    rng = random.Random(1)
+    return sorted({"".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))) for _ in range(300)})
+
+@pytest.fixture(scope="session")
+def wiki_graph(vocabulary) -> nx.DiGraph:
+    return synthetic_graph(2000, 15, vocabulary, seed=2)
+
+@pytest.fixture(scope="session")
+def mock_wiki(wiki_graph):
+    with MockWikiServer(wiki_graph) as server:
+        yield server
+
+@pytest.fixture
+def live_stub(mock_wiki, monkeypatch):
+    """routes every wikiLinkRetrieval fetch (without a cache) to the local mock wikipedia"""
+    monkeypatch.setattr(wiki, "default_mirror", mock_wiki.url)
+    monkeypatch.setattr(wiki, "default_cache", None)
+    with WikiFetcher(backoff_factor=0) as fetcher:
+        monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+        yield mock_wiki
+
+@pytest.fixture(scope="session")
+def game_pairs(wiki_graph):
+    """start/target pairs that are connected in the graph"""
+    rng = random.Random(3)
+    nodes = list(wiki_graph.nodes)
+    pairs = []
+    while len(pairs) < 5:
+        source, target = rng.sample(nodes, 2)
+        if nx.has_path(wiki_graph, source, target):
+            pairs.append((source, target))
+    return pairs
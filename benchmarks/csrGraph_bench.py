@@ -0,0 +1,86 @@
+import pytest
+import sys
+import pickle
+import random
+sys.path.append("./src/")
+
+from csrGraph import CSRGraph
+from landmarkIndex import LandmarkIndex
+from searchAlgorithms import bfs_length, landmark_search
+from conftest import synthetic_graph
+
+@pytest.fixture(scope="module")
+def saved_graph(tmp_path_factory, vocabulary):
+    """a graph of the size of the crawled country graphs saved both ways"""
+    G = synthetic_graph(20000, 25, vocabulary + [word.upper() for word in vocabulary], seed=4)
+    directory = tmp_path_factory.mktemp("graph")
+    with open(directory / "graph.pickle", 'wb') as f:
+        pickle.dump(G, f)
+    CSRGraph.from_networkx(G).save(str(directory / "csr"))
+    return directory
+
+@pytest.fixture(scope="module")
+def indexed(saved_graph):
+    """the saved graph, its landmark index and random pairs of its articles"""
+    graph = CSRGraph.load(str(saved_graph / "csr"))
+    index = LandmarkIndex.build(graph, num_landmarks=16)
+    rng = random.Random(1)
+    pairs = [(graph.url(rng.randrange(len(graph))), graph.url(rng.randrange(len(graph)))) for _ in range(20)]
+    return graph, index, pairs
+
+class BenchGraphLoading:
+
+    def bench_pickle(self, benchmark, saved_graph):
+        def load():
+            with open(saved_graph / "graph.pickle", 'rb') as f:
+                return pickle.load(f)
+        benchmark.group = "graph load"
+        benchmark.pedantic(load, rounds=3)
+
+    def bench_csr(self, benchmark, saved_graph):
+        benchmark.group = "graph load"
+        benchmark.pedantic(CSRGraph.load, args=(str(saved_graph / "csr"),), kwargs={'mmap' : False}, rounds=3)
+
+    def bench_csr_mmap(self, benchmark, saved_graph):
+        benchmark.group = "graph load"
+        benchmark.pedantic(CSRGraph.load, args=(str(saved_graph / "csr"),), rounds=3)
+
+    def bench_csr_mmap_without_urls(self, benchmark, saved_graph):
+        benchmark.group = "graph load"
+        benchmark(CSRGraph.load, str(saved_graph / "csr"), load_urls=False)
+
+class BenchNeighbourLookups:
+
+    def bench_successors(self, benchmark, saved_graph):
+        graph = CSRGraph.load(str(saved_graph / "csr"))
+        nodes = random.Random(0).sample(graph.nodes, 1000)
+        benchmark.group = "neighbour lookups"
+        benchmark(lambda: [list(graph.successors(node)) for node in nodes])
+
+    def bench_out_neighbors(self, benchmark, saved_graph):
+        graph = CSRGraph.load(str(saved_graph / "csr"))
+        ids = random.Random(0).sample(range(len(graph)), 1000)
+        benchmark.group = "neighbour lookups"
+        benchmark(lambda: [graph.out_neighbors(node) for node in ids])
+
+class BenchDistanceQueries:
+
+    def bench_bfs_length(self, benchmark, indexed):
+        graph, _, pairs = indexed
+        benchmark.group = "distance queries"
+        benchmark.pedantic(lambda: [bfs_length(source, target, graph) for source, target in pairs], rounds=3)
+
+    def bench_bfs_length_with_landmarks(self, benchmark, indexed):
+        graph, index, pairs = indexed
+        benchmark.group = "distance queries"
+        benchmark.pedantic(lambda: [bfs_length(source, target, graph, index) for source, target in pairs], rounds=3)
+
+    def bench_landmark_bounds(self, benchmark, indexed):
+        graph, index, pairs = indexed
+        benchmark.group = "distance queries"
+        benchmark(lambda: [index.bounds(source, target) for source, target in pairs])
+
+    def bench_landmark_search(self, benchmark, indexed):
+        graph, index, pairs = indexed
+        benchmark.group = "distance queries"
+        benchmark.pedantic(lambda: [landmark_search(source, target, graph, index) for source, target in pairs], rounds=3)
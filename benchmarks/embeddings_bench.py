@@ -0,0 +1,43 @@
+import pytest
+import sys
+import random
+import numpy as np
+from gensim.models import KeyedVectors
+sys.path.append("./src/")
+
+import wikiLinkRetrieval as wiki
+from embeddings import EmbeddingIndex, PhraseEmbedder, phrase_to_vec
+
+@pytest.fixture(scope="module")
+def word_vectors(vocabulary) -> KeyedVectors:
+    model = KeyedVectors(vector_size=300)
+    model.add_vectors(vocabulary, np.random.default_rng(0).normal(size=(len(vocabulary), 300)).astype(np.float32))
+    return model
+
+@pytest.fixture(scope="module")
+def candidates(wiki_graph):
+    """the neighbour lists of a few hundred articles, what a greedy player scores each step"""
+    rng = random.Random(5)
+    return [list(wiki_graph.successors(url)) for url in rng.sample(list(wiki_graph.nodes), 300)]
+
+class BenchEmbeddingLookups:
+
+    def bench_phrase_to_vec(self, benchmark, word_vectors, candidates):
+        benchmark.group = "embed neighbour lists"
+        benchmark(lambda: [np.stack([phrase_to_vec(wiki.clean_wiki_link(url), word_vectors) for url in urls]) for urls in candidates])
+
+    def bench_phrase_embedder(self, benchmark, word_vectors, candidates):
+        embedder = PhraseEmbedder(word_vectors, wiki.clean_wiki_link)
+        benchmark.group = "embed neighbour lists"
+        benchmark(lambda: [embedder.embed_many(urls) for urls in candidates])
+
+    def bench_index_matrix(self, benchmark, word_vectors, wiki_graph, candidates):
+        index = EmbeddingIndex.from_keyed_vectors(word_vectors, wiki_graph.nodes)
+        benchmark.group = "embed neighbour lists"
+        benchmark(lambda: [index.matrix(urls) for urls in candidates])
+
+    def bench_index_similarities(self, benchmark, word_vectors, wiki_graph, candidates):
+        index = EmbeddingIndex.from_keyed_vectors(word_vectors, wiki_graph.nodes)
+        target = next(iter(wiki_graph.nodes))
+        benchmark.group = "score neighbour lists"
+        benchmark(lambda: [index.similarities(urls, target) for urls in candidates])
@@ -0,0 +1,48 @@
+import pytest
+import sys
+import numpy as np
+from gensim.models import KeyedVectors
+sys.path.append("./src/")
+
+from searchAlgorithms import bfs_length, bfs_paths, word2vec_search
+from csrGraph import CSRGraph
+from embeddings import EmbeddingIndex
+
+@pytest.fixture(scope="module")
+def word_vectors(vocabulary) -> KeyedVectors:
+    model = KeyedVectors(vector_size=64)
+    model.add_vectors(vocabulary, np.random.default_rng(0).normal(size=(len(vocabulary), 64)).astype(np.float32))
+    return model
+
+class BenchOfflineSearch:
+
+    def bench_bfs_networkx(self, benchmark, wiki_graph, game_pairs):
+        benchmark.group = "offline bfs"
+        benchmark(lambda: [bfs_length(source, target, wiki_graph) for source, target in game_pairs])
+
+    def bench_bfs_csr(self, benchmark, wiki_graph, game_pairs):
+        graph = CSRGraph.from_networkx(wiki_graph)
+        benchmark.group = "offline bfs"
+        benchmark(lambda: [bfs_length(source, target, graph) for source, target in game_pairs])
+
+class BenchLiveSearch:
+    """the searches that fetch every page, against the local stub server"""
+
+    def bench_bfs_paths(self, benchmark, live_stub, wiki_graph, game_pairs):
+        source, target = game_pairs[0]
+        benchmark.group = "live search"
+        paths = benchmark.pedantic(bfs_paths, args=(source, target), rounds=3)
+        assert paths and len(paths[0]) - 1 == bfs_length(source, target, wiki_graph)
+
+    def bench_word2vec_search(self, benchmark, live_stub, word_vectors, game_pairs):
+        benchmark.group = "live search"
+        benchmark.pedantic(lambda: [word2vec_search(source, target, word_vectors) for source, target in game_pairs[:2]], rounds=2)
+
+    def bench_word2vec_search_prebuilt_index(self, benchmark, live_stub, wiki_graph, word_vectors, game_pairs):
+        index = EmbeddingIndex.from_keyed_vectors(word_vectors, wiki_graph.nodes)
+        benchmark.group = "live search"
+        benchmark.pedantic(lambda: [word2vec_search(source, target, word_vectors, index) for source, target in game_pairs[:2]], rounds=2)
+
+    def bench_word2vec_search_prefetch(self, benchmark, live_stub, word_vectors, game_pairs):
+        benchmark.group = "live search"
+        benchmark.pedantic(lambda: [word2vec_search(source, target, word_vectors, prefetch=3) for source, target in game_pairs[:2]], rounds=2)
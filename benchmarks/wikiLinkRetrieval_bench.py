@@ -0,0 +1,36 @@
+import pytest
+import sys
+import glob
+import os
+sys.path.append("./src/")
+
+from wikiLinkRetrieval import extract_links, stream_extract_links
+from mockWikiServer import render_page
+
+@pytest.fixture(scope="module")
+def corpus():
+    """the saved article fixtures"""
+    pages = {}
+    for path in sorted(glob.glob("test/fixtures/*.html")):
+        with open(path, 'rb') as file:
+            pages[os.path.basename(path)[:-len(".html")]] = file.read()
+    return pages
+
+@pytest.mark.parametrize("parser", [extract_links, stream_extract_links], ids=lambda parser: parser.__name__)
+class BenchExtraction:
+
+    def bench_corpus(self, benchmark, corpus, parser):
+        benchmark.group = "extract corpus"
+        benchmark(lambda: [parser(page) for page in corpus.values()])
+
+    @pytest.mark.parametrize("name", ["Sipsi", "Cornet", "Rusty breasted nunlet"])
+    def bench_page(self, benchmark, corpus, parser, name):
+        benchmark.group = f"extract {name}"
+        benchmark(parser, corpus[name])
+
+    def bench_hub_page(self, benchmark, parser):
+        # a synthetic page with as many links as the biggest hub articles
+        links = [f"https://en.wikipedia.org/wiki/Article_{i}" for i in range(5000)]
+        page = render_page("Hub", links)
+        benchmark.group = "extract hub page"
+        assert len(benchmark(parser, page)) == 5000
@@ -1,6 +1,6 @@
 import torch
 from torch import nn
-import torch.functional as F
+import torch.nn.functional as F
 import numpy as np
 import wikiLinkRetrieval as wiki
 import networkx as nx
@@ -30,44 +30,91 @@ class ActorNN(nn.Module):
             nn.Linear(hidden_dim // 2, 1)
         )
 
-    def forward(self, target_emb, current_emb, path_embs, action_embs_list):
-        batch_size = target_emb.shape[0]
-        
+    def forward(self, target_emb, current_emb, path_embs, action_embs, action_mask=None, path_lengths=None):
+        """Scores every candidate action of every state in one batched pass and gives the policy over them.
+
+        Args:
+            target_emb (torch.Tensor): (batch, dim) target article embeddings
+            current_emb (torch.Tensor): (batch, dim) current article embeddings
+            path_embs (torch.Tensor): (batch, path length, dim) visited article embeddings (padded if path_lengths is given)
+            action_embs (torch.Tensor | List[torch.Tensor]): (batch, max actions, dim) padded candidate embeddings,
+                                                             or the list of candidate embeddings of a single state
+            action_mask (torch.Tensor, optional): (batch, max actions) True for real actions. Defaults to every action.
+            path_lengths (torch.Tensor, optional): (batch,) the real path lengths when paths are padded. Defaults to None.
+
+        Returns:
+            torch.Tensor: (batch, max actions) action probabilities, zero for padding
+        """
+        if isinstance(action_embs, (list, tuple)):
+            action_embs, action_mask = pad_actions([action_embs])
+        batch_size, max_actions = action_embs.shape[0], action_embs.shape[1]
+        if action_mask is None:
+            action_mask = torch.ones(batch_size, max_actions, dtype=torch.bool, device=action_embs.device)
+
         target_hidden = self.embed_proj(target_emb)  # (batch_size, hidden_dim)
         current_hidden = self.embed_proj(current_emb)  # (batch_size, hidden_dim)
-        
-        if path_embs.shape[1] == 0:
-            path_context = torch.zeros(batch_size, self.hidden_dim, device=target_emb.device)
-        else:
-            path_encoded, (hidden_state, _) = self.path_encoder(path_embs)
-            path_context = hidden_state[-1]
-        
+        path_context = self.encode_path(path_embs, path_lengths)
+
         state_context = torch.cat([target_hidden, current_hidden, path_context], dim=1)
-        state_context = self.state_encoder(state_context)
-        
-        action_scores = []
-        for action_emb in action_embs_list:
-            action_hidden = self.embed_proj(action_emb.unsqueeze(0))
-            
-            if batch_size > 1:
-                action_hidden = action_hidden.repeat(batch_size, 1)
-            
-            state_action = torch.cat([state_context, action_hidden], dim=1)
-            
-            score = self.action_scorer(state_action)
-            action_scores.append(score)
-        
-        if action_scores:
-            action_scores = torch.cat(action_scores, dim=1)
-        else:
-            action_scores = torch.empty(batch_size, 0, device=target_emb.device)
-        
-        if action_scores.shape[1] > 0:
-            action_probs = F.softmax(action_scores, dim=1)
-        else:
-            action_probs = action_scores
-            
-        return action_probs
+        state_context = self.strategy_net(state_context)  # (batch_size, hidden_dim)
+
+        if max_actions == 0:
+            return torch.empty(batch_size, 0, device=target_emb.device)
+
+        # every (state, action) pair goes through the scorer in one call
+        action_hidden = self.embed_proj(action_embs)  # (batch_size, max_actions, hidden_dim)
+        state_action = torch.cat([state_context.unsqueeze(1).expand(-1, max_actions, -1), action_hidden], dim=2)
+        action_scores = self.score_action(state_action).squeeze(-1)  # (batch_size, max_actions)
+
+        action_scores = action_scores.masked_fill(~action_mask, float('-inf'))
+        action_probs = F.softmax(action_scores, dim=1)
+        # states without any action would be all NaN, they get all zero probabilities instead
+        return torch.where(action_mask.any(dim=1, keepdim=True), action_probs, torch.zeros_like(action_probs))
+
+    def encode_path(self, path_embs, path_lengths=None):
+        """
+        Returns:
+            torch.Tensor: (batch, hidden_dim) the last LSTM hidden state over each path (zeros for empty paths)
+        """
+        batch_size = path_embs.shape[0]
+        if path_embs.shape[1] == 0:
+            return torch.zeros(batch_size, self.hidden_dim, device=path_embs.device)
+        if path_lengths is None:
+            _, (hidden_state, _) = self.path_encoder(path_embs)
+            return hidden_state[-1]
+
+        # padded paths of different lengths are packed, empty ones are encoded as zeros
+        path_lengths = torch.as_tensor(path_lengths, device='cpu')
+        path_context = torch.zeros(batch_size, self.hidden_dim, device=path_embs.device)
+        nonempty = path_lengths > 0
+        if nonempty.any():
+            packed = nn.utils.rnn.pack_padded_sequence(path_embs[nonempty.to(path_embs.device)], path_lengths[nonempty],
+                                                       batch_first=True, enforce_sorted=False)
+            _, (hidden_state, _) = self.path_encoder(packed)
+            path_context[nonempty.to(path_embs.device)] = hidden_state[-1]
+        return path_context
+
+def pad_actions(action_embs_lists):
+    """Pads the candidate action embeddings of several states into one tensor.
+
+    Args:
+        action_embs_lists (List[List[torch.Tensor]]): for every state, the embeddings of its candidate actions
+
+    Returns:
+        Tuple[torch.Tensor,torch.Tensor]: the (batch, max actions, dim) padded embeddings and the (batch, max actions) mask
+    """
+    max_actions = max((len(actions) for actions in action_embs_lists), default=0)
+    reference = next((actions[0] for actions in action_embs_lists if len(actions)), None)
+    dim = reference.shape[-1] if reference is not None else 0
+    device = reference.device if reference is not None else None
+
+    padded = torch.zeros(len(action_embs_lists), max_actions, dim, device=device)
+    mask = torch.zeros(len(action_embs_lists), max_actions, dtype=torch.bool, device=device)
+    for i, actions in enumerate(action_embs_lists):
+        if len(actions):
+            padded[i, :len(actions)] = torch.stack(list(actions)) if isinstance(actions, (list, tuple)) else actions
+            mask[i, :len(actions)] = True
+    return padded, mask
     
 class CriticNN(nn.Module):
     def __init__(self, embedding_dim, hidden_dim=256):
@@ -80,8 +127,14 @@ class CriticNN(nn.Module):
             nn.Linear(hidden_dim, 1) 
         )
         
-    def forward(self, target_emb, current_emb, path_embs):
-        path_summary = path_embs.mean(dim=1) 
+    def forward(self, target_emb, current_emb, path_embs, path_lengths=None):
+        if path_lengths is None:
+            path_summary = path_embs.mean(dim=1) if path_embs.shape[1] > 0 else torch.zeros_like(target_emb)
+        else:
+            # mean over the real (unpadded) part of every path, empty paths summarize to zeros
+            path_lengths = torch.as_tensor(path_lengths, device=path_embs.device)
+            mask = torch.arange(path_embs.shape[1], device=path_embs.device)[None, :] < path_lengths[:, None]
+            path_summary = (path_embs * mask.unsqueeze(-1)).sum(dim=1) / path_lengths.clamp(min=1).unsqueeze(-1)
         state = torch.cat([target_emb, current_emb, path_summary], dim=1)
         return self.net(state)
 
@@ -3,9 +3,15 @@ from networkx import DiGraph     # typing for graph output
 import sys                       # used for interacting w/ system
 sys.path.append("./src")         # adds wikiLinkRetrieval to path
 import wikiLinkRetrieval as wiki # used for finding wikipedia links
-from typing import Set           # just needed for signatures/type hinting     
+from typing import Set,Iterator,Tuple,List,Callable,Awaitable # just needed for signatures/type hinting     
 import pickle                    # stores graph
 import time
+import os                        # crawl directory handling
+import json                      # crawl checkpoint
+import asyncio                   # needed for concurrency
+import aiohttp                   # needed for concurrent HTTP requests
+from wikiFetcher import DEFAULT_USER_AGENT
+from canonicalUrls import canonicalize  # merges redirects and other spellings of an article
     
 def sprawl(starts: Set[str],iterations: int) -> nx.DiGraph:
     """given a set of starting urls to wikipedia articles will essentially perform bfs for the specified number of iterations 
@@ -21,7 +27,7 @@ def sprawl(starts: Set[str],iterations: int) -> nx.DiGraph:
     """
     wikiGraph = nx.DiGraph()
 
-    s = starts
+    s = {canonicalize(url) for url in starts}
     original_iterations = iterations
 
     while (iterations > 0) and (len(s) != 0):
@@ -49,17 +55,233 @@ def sprawl(starts: Set[str],iterations: int) -> nx.DiGraph:
         internal_links = [adj for adj in final_adjacency[key] if wikiGraph.has_node(adj)]
         wikiGraph.add_edges_from([(key, adj) for adj in internal_links])
 
-    return wikiGraph
+    return merge_redirects(wikiGraph)
 
-# Some influential wikipedia lists
-most_referenced = "https://en.wikipedia.org/wiki/Wikipedia:Most-referenced_articles"
-countries =  "https://simple.wikipedia.org/wiki/List_of_countries"
-disciplines = "https://en.wikipedia.org/wiki/Outline_of_academic_disciplines"
+def merge_redirects(G : nx.DiGraph) -> nx.DiGraph:
+    """Merges every node that turned out to be a redirect (or another spelling of an article) into the article's
+    node, in place. Pages are only known to be redirects once fetched, so links to them found earlier in a crawl
+    made separate nodes.
 
-# start_set = set(most_referenced,countries,disciplines)
-start_time = time.time()
-G = sprawl(set({countries}),3)
-print(time.time()-start_time)
-print(len(G.nodes))
-with open('CountryGraphL3.pickle', 'wb') as file:
+    Args:
+        G (nx.DiGraph): a crawled graph
+
+    Returns:
+        nx.DiGraph: the same graph
+    """
+    mapping = {node : canonicalize(node) for node in G.nodes}
+    mapping = {node : article for node, article in mapping.items() if node != article}
+    if mapping:
+        nx.relabel_nodes(G, mapping, copy=False)
+        # a page linking to a redirect to itself
+        G.remove_edges_from([(node, node) for node in set(mapping.values()) if G.has_edge(node, node)])
+    return G
+
+class StreamingCrawler:
+    """Disk backed version of sprawl. Every layer lives in its own append only file (layer_<k>.txt) that is
+    streamed through a bounded work queue, and every crawled page is appended to an edge log (edges.log, one line
+    per page: the page followed by its links, tab separated) as soon as its response arrives. The current layer is
+    checkpointed in state.json so an interrupted crawl resumes where it stopped, and only the seen set is kept in
+    memory, the number of pages waiting or in flight is capped by queue_size and concurrency whatever the layer size.
+    """
+
+    def __init__(self,
+                 directory : str,
+                 concurrency : int = 20,
+                 queue_size : int = 1000,
+                 fetch_links : Callable[[str],Awaitable[Set[str]]] = None):
+        """
+        Args:
+            directory (str): where the layer files, edge log and checkpoint are kept
+            concurrency (int, optional): the number of pages requested at once. Defaults to 20.
+            queue_size (int, optional): the maximum number of pages waiting in the work queue. Defaults to 1000.
+            fetch_links (Callable[[str],Awaitable[Set[str]]], optional): coroutine giving the adjacent articles of a url,
+                                                                         defaults to wiki.async_fetch_adj_wiki over one session.
+        """
+        self.directory = directory
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.fetch_links = fetch_links
+        os.makedirs(directory, exist_ok=True)
+
+        self.edge_log_path = os.path.join(directory, "edges.log")
+        self.failed_path = os.path.join(directory, "failed.log")
+        self.state_path = os.path.join(directory, "state.json")
+
+    def layer_path(self, layer : int) -> str:
+        return os.path.join(self.directory, f"layer_{layer}.txt")
+
+    ############################## Checkpointing ##############################
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def save_state(self, layer : int, iterations : int, complete : bool = False):
+        # written to a temporary file and renamed so a crash never leaves a half written checkpoint
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'layer' : layer, 'iterations' : iterations, 'complete' : complete}, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _truncate_partial_line(path : str):
+        """drops whatever was written after the last newline (a record interrupted by a crash)"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != size:
+                f.truncate(position)
+
+    @staticmethod
+    def _iter_lines(path : str) -> Iterator[str]:
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+
+    ############################## Crawling ##############################
+
+    def sprawl(self, starts : Set[str], iterations : int):
+        """Crawls (or resumes crawling) the given number of layers away from the starting articles, with the same
+        last layer rule as sprawl (only edges pointing to articles already in the graph are kept).
+
+        Args:
+            starts (Set[str]): a set of starting article urls, ignored when resuming
+            iterations (int): the number of layers away from the starting articles to expand
+        """
+        asyncio.run(self.async_sprawl(starts, iterations))
+
+    async def async_sprawl(self, starts : Set[str], iterations : int):
+        state = self.load_state()
+        if state is None:
+            with open(self.layer_path(0), 'w', encoding='utf-8') as f:
+                f.writelines(canonicalize(url) + "\n" for url in starts)
+            self.save_state(0, iterations)
+            state = self.load_state()
+        if state['complete']:
+            return
+        iterations = state['iterations']
+
+        for path in [self.edge_log_path, *(self.layer_path(k) for k in range(state['layer'] + 2))]:
+            self._truncate_partial_line(path)
+
+        # every article discovered so far is in one of the layer files, every crawled one starts a line of the edge log
+        seen = set()
+        for layer in range(state['layer'] + 2):
+            seen.update(self._iter_lines(self.layer_path(layer)))
+        done = {line.split('\t', 1)[0] for line in self._iter_lines(self.edge_log_path)}
+
+        async with aiohttp.ClientSession(headers={"User-Agent" : DEFAULT_USER_AGENT}) as session:
+            fetch_links = self.fetch_links
+            if fetch_links is None:
+                async def fetch_links(url):
+                    # rate limited and retried, whatever still fails is logged with its reason
+                    result = await wiki.async_fetch_adj_wiki(url, session)
+                    if not result.ok:
+                        raise ConnectionError(f"{result.error} after {result.attempts} attempts")
+                    return result.links
+
+            with open(self.edge_log_path, 'a', encoding='utf-8') as edge_log, \
+                 open(self.failed_path, 'a', encoding='utf-8') as failed_log:
+                for layer in range(state['layer'], iterations + 1):
+                    await self._crawl_layer(layer, layer == iterations, seen, done, fetch_links, edge_log, failed_log)
+                    self.save_state(layer + 1, iterations, complete=(layer == iterations))
+
+    async def _crawl_layer(self, layer, final, seen, done, fetch_links, edge_log, failed_log):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+
+        with open(self.layer_path(layer + 1), 'a', encoding='utf-8') as next_layer:
+
+            async def worker():
+                while True:
+                    url = await queue.get()
+                    try:
+                        links = await fetch_links(url)
+                    except Exception as e:
+                        failed_log.write(f"{url}\t{type(e).__name__}\t{e}\n")
+                        failed_log.flush()
+                        queue.task_done()
+                        continue
+
+                    if final:
+                        # on the last layer only keep the edges pointing to articles already in the graph
+                        links = [adj for adj in links if adj in seen]
+                    else:
+                        new = [adj for adj in links if adj not in seen]
+                        seen.update(new)
+                        # the next layer is written before the edge log so a crash in between only refetches this page
+                        next_layer.writelines(adj + "\n" for adj in new)
+                        next_layer.flush()
+
+                    edge_log.write("\t".join([url, *links]) + "\n")
+                    edge_log.flush()
+                    done.add(url)
+                    queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                for url in self._iter_lines(self.layer_path(layer)):
+                    if url not in done:
+                        await queue.put(url)
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    ############################## Reading the crawl ##############################
+
+    def iter_edges(self) -> Iterator[Tuple[str,List[str]]]:
+        """
+        Yields:
+            Tuple[str,List[str]]: every crawled page along with the articles it links to, in the order they were crawled,
+                                  redirects learned since the page was logged are resolved
+        """
+        for line in self._iter_lines(self.edge_log_path):
+            source, *links = line.split('\t')
+            yield canonicalize(source), [canonicalize(link) for link in links]
+
+    def load_graph(self) -> nx.DiGraph:
+        """
+        Returns:
+            nx.DiGraph: the graph made from the edge log
+        """
+        wikiGraph = nx.DiGraph()
+        for source, links in self.iter_edges():
+            wikiGraph.add_node(source)
+            wikiGraph.add_edges_from((source, adj) for adj in links if adj != source)
+        return wikiGraph
+
+if __name__ == "__main__":
+    # Some influential wikipedia lists
+    most_referenced = "https://en.wikipedia.org/wiki/Wikipedia:Most-referenced_articles"
+    countries =  "https://simple.wikipedia.org/wiki/List_of_countries"
+    disciplines = "https://en.wikipedia.org/wiki/Outline_of_academic_disciplines"
+
+    # start_set = set(most_referenced,countries,disciplines)
+    start_time = time.time()
+    # crawls to disk as it goes, rerunning after an interruption resumes from the last checkpoint
+    crawler = StreamingCrawler("crawls/CountryGraphL3")
+    crawler.sprawl(set({countries}),3)
+    G = crawler.load_graph()
+    print(time.time()-start_time)
+    print(len(G.nodes))
+    with open('CountryGraphL3.pickle', 'wb') as file:
         pickle.dump(G, file)
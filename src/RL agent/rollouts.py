@@ -0,0 +1,447 @@
+import os                                     # graph/embedding directories
+import queue                                  # Full/Empty raised by the multiprocessing queues
+import numpy as np
+import torch
+import torch.nn.functional as F
+from typing import List,Dict,Iterator         # just needed for signatures/type hinting
+
+from agent import ActorNN,CriticNN
+from wikiGameEnvironment import BatchedWikiEnvironment
+from trainingMetrics import TrainingMetrics, timed
+
+import sys
+sys.path.append("./src")
+from csrGraph import CSRGraph
+
+# Trajectories travel between processes as compact id arrays instead of embeddings or networkx objects:
+#   path    (T+1,) int32  the visited article ids, path[t] is the article the t-th action was taken from
+#   target  int           the target article id
+#   actions (T,)   int32  the chosen neighbour indices
+#   rewards (T,)   float32
+#   log_probs (T,) float32 the log probabilities the acting policy gave the chosen actions
+#   version int           the number of weight broadcasts the worker had seen when the episode was played
+# and the learner rebuilds every state from the shared (memory mapped) graph and embedding arrays.
+
+############################## Shared Arrays ##############################
+
+def load_shared(graph_directory : str, embedding_directory : str):
+    """Memory maps the graph and the node embeddings, every process mapping the same files shares the pages
+    through the OS page cache instead of holding its own copy.
+
+    Args:
+        graph_directory (str): a directory written by CSRGraph.save
+        embedding_directory (str): a directory written by EmbeddingIndex.save over the graph's nodes (same order)
+
+    Returns:
+        Tuple[CSRGraph,np.ndarray]: the graph (without its url table) and the (num nodes, dim) unit embeddings
+    """
+    graph = CSRGraph.load(graph_directory, mmap=True, load_urls=False)
+    embeddings = np.load(os.path.join(embedding_directory, "vectors.npy"), mmap_mode='r')
+    if len(embeddings) < len(graph):
+        raise ValueError(f"{embedding_directory} has {len(embeddings)} vectors for a graph of {len(graph)} nodes")
+    return graph, embeddings
+
+def check_alignment(graph_directory : str, embedding_directory : str):
+    """Raises a ValueError unless row i of the embeddings belongs to node i of the graph."""
+    with open(os.path.join(graph_directory, "urls.txt"), 'r', encoding='utf-8') as f:
+        graph_urls = f.read().splitlines()
+    with open(os.path.join(embedding_directory, "urls.txt"), 'r', encoding='utf-8') as f:
+        embedding_urls = f.read().splitlines()
+    if embedding_urls[:len(graph_urls)] != graph_urls:
+        raise ValueError("the embedding rows don't follow the graph's node order, build the index over graph.nodes")
+
+############################## Tensors From Ids ##############################
+
+def path_tensor(embeddings : np.ndarray, paths : np.ndarray, lengths : np.ndarray) -> torch.Tensor:
+    """
+    Args:
+        embeddings (np.ndarray): (num nodes, dim) node embeddings
+        paths (np.ndarray): (batch, width) article ids, anything past a row's length is ignored
+        lengths (np.ndarray): (batch,) the number of real ids of each row
+
+    Returns:
+        torch.Tensor: (batch, max length, dim) embeddings, zero past each row's length
+    """
+    width = int(lengths.max(initial=0))
+    paths = paths[:, :width]
+    valid = np.arange(width)[None, :] < lengths[:, None]
+    path_embs = embeddings[np.where(valid, paths, 0)] * valid[..., None]
+    return torch.as_tensor(path_embs, dtype=torch.float32).reshape(len(lengths), width, embeddings.shape[1])
+
+def action_tensor(embeddings : np.ndarray, action_ids : np.ndarray, mask : np.ndarray):
+    """
+    Args:
+        embeddings (np.ndarray): (num nodes, dim) node embeddings
+        action_ids (np.ndarray): (batch, max actions) neighbour ids, -1 as padding
+        mask (np.ndarray): (batch, max actions) True for real actions
+
+    Returns:
+        Tuple[torch.Tensor,torch.Tensor]: the padded action embeddings and the mask, like pad_actions
+    """
+    action_embs = embeddings[np.where(mask, action_ids, 0)] * mask[..., None]
+    return torch.as_tensor(action_embs, dtype=torch.float32), torch.as_tensor(mask)
+
+def neighbour_actions(graph : CSRGraph, nodes : np.ndarray, max_actions : int = None):
+    """The padded action matrix of arbitrary articles, the same one BatchedWikiEnvironment.get_actions gives.
+
+    Args:
+        graph (CSRGraph): the graph
+        nodes (np.ndarray): (batch,) article ids
+        max_actions (int, optional): caps the number of actions. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: the (batch, max actions) neighbour ids (-1 as padding) and the mask
+    """
+    offsets = np.asarray(graph.offsets)
+    degrees = offsets[nodes + 1] - offsets[nodes]
+    if max_actions is not None:
+        degrees = np.minimum(degrees, max_actions)
+    columns = np.arange(max(int(degrees.max(initial=0)), 1))
+    mask = columns[None, :] < degrees[:, None]
+    positions = offsets[nodes][:, None] + columns[None, :]
+    action_ids = np.where(mask, np.asarray(graph.targets)[np.where(mask, positions, 0)], -1).astype(np.int32)
+    return action_ids, mask
+
+############################## Acting ##############################
+
+class EpisodeRunner:
+    """Plays the games of a BatchedWikiEnvironment with an actor, one batched forward pass per step, and records
+    every game's actions, rewards and log probabilities until it finishes as a compact trajectory."""
+
+    def __init__(self, env : BatchedWikiEnvironment, embeddings : np.ndarray, metrics : TrainingMetrics = None):
+        """
+        Args:
+            env (BatchedWikiEnvironment): the games being played
+            embeddings (np.ndarray): (num nodes, dim) node embeddings aligned with the env's graph
+            metrics (TrainingMetrics, optional): times the env/embedding/forward phases of every step. Defaults to None.
+        """
+        self.env = env
+        self.embeddings = embeddings
+        self.metrics = metrics
+        self.actions : List[List[int]] = [[] for _ in range(env.num_envs)]
+        self.rewards : List[List[float]] = [[] for _ in range(env.num_envs)]
+        self.log_probs : List[List[float]] = [[] for _ in range(env.num_envs)]
+        self.steps = 0
+
+    def step(self, actor : ActorNN) -> List[dict]:
+        """Takes one action in every unfinished game and restarts the games that finished.
+
+        Args:
+            actor (ActorNN): the acting policy
+
+        Returns:
+            List[dict]: the trajectories of the games that finished on this step
+        """
+        env, embeddings, metrics = self.env, self.embeddings, self.metrics
+        active = np.flatnonzero(~env.done)
+        with timed(metrics, "env"):
+            action_ids, mask = env.get_actions()
+        lengths = env.length[active] - 1
+        with torch.no_grad():
+            with timed(metrics, "embed"):
+                action_embs, action_mask = action_tensor(embeddings, action_ids[active], mask[active])
+                target_emb = torch.as_tensor(embeddings[env.target[active]], dtype=torch.float32)
+                current_emb = torch.as_tensor(embeddings[env.current[active]], dtype=torch.float32)
+                path_embs = path_tensor(embeddings, env.path[active], lengths)
+            with timed(metrics, "act_forward"):
+                action_probs = actor(target_emb, current_emb, path_embs, action_embs, action_mask,
+                                     path_lengths=torch.as_tensor(lengths))
+                action_dist = torch.distributions.Categorical(action_probs)
+                sampled = action_dist.sample()
+                sampled_log_probs = action_dist.log_prob(sampled).numpy()
+                sampled = sampled.numpy()
+
+        actions = np.zeros(env.num_envs, dtype=np.int64)
+        actions[active] = sampled
+        with timed(metrics, "env"):
+            _, rewards, done = env.step(actions)
+        self.steps += len(active)
+        if metrics is not None:
+            metrics.count_steps(len(active), mask[active].sum(axis=1))
+
+        finished = []
+        for game, action, log_prob in zip(active.tolist(), sampled.tolist(), sampled_log_probs.tolist()):
+            self.actions[game].append(action)
+            self.rewards[game].append(float(rewards[game]))
+            self.log_probs[game].append(log_prob)
+            if not done[game]:
+                continue
+            finished.append({'path' : env.path[game, :env.length[game]].copy(),
+                             'target' : int(env.target[game]),
+                             'actions' : np.asarray(self.actions[game], dtype=np.int32),
+                             'rewards' : np.asarray(self.rewards[game], dtype=np.float32),
+                             'log_probs' : np.asarray(self.log_probs[game], dtype=np.float32),
+                             'truncated' : bool(env.truncated[game])})
+            self.actions[game], self.rewards[game], self.log_probs[game] = [], [], []
+        with timed(metrics, "env"):
+            env.reset_done()
+        if metrics is not None and finished:
+            metrics.count_episodes(len(finished))
+        return finished
+
+def rollout_worker(worker_id : int,
+                   graph_directory : str,
+                   embedding_directory : str,
+                   actor_kwargs : dict,
+                   trajectory_queue,
+                   weight_queue,
+                   stop_event,
+                   envs_per_worker : int = 16,
+                   max_steps : int = 20,
+                   max_actions : int = None,
+                   seed : int = None):
+    """Plays episodes with its own copy of the actor on a BatchedWikiEnvironment and sends every finished one
+    to the learner. Runs until stop_event is set, picking up newly broadcast weights between steps.
+
+    Args:
+        worker_id (int): the index of the worker, offsets the seed
+        graph_directory (str): a directory written by CSRGraph.save
+        embedding_directory (str): a directory written by EmbeddingIndex.save over the graph's nodes
+        actor_kwargs (dict): the ActorNN constructor arguments
+        trajectory_queue (multiprocessing.Queue): where the finished episodes are sent
+        weight_queue (multiprocessing.Queue): where the learner broadcasts (version, state dict) pairs
+        stop_event (multiprocessing.Event): tells the worker to stop
+        envs_per_worker (int, optional): the number of games stepped together. Defaults to 16.
+        max_steps (int, optional): the number of jumps after which a game is over. Defaults to 20.
+        max_actions (int, optional): caps the number of actions. Defaults to None.
+        seed (int, optional): seeds the games and the action sampling. Defaults to None.
+    """
+    # the workers share the cores, intra-op threads would only fight over them
+    torch.set_num_threads(1)
+    # never block the exit on episodes the learner won't read anymore
+    trajectory_queue.cancel_join_thread()
+    worker_seed = None if seed is None else seed + worker_id
+    if worker_seed is not None:
+        torch.manual_seed(worker_seed)
+
+    graph, embeddings = load_shared(graph_directory, embedding_directory)
+    env = BatchedWikiEnvironment(graph, envs_per_worker, max_steps=max_steps, embeddings=embeddings,
+                                 max_actions=max_actions, seed=worker_seed)
+    runner = EpisodeRunner(env, embeddings)
+    actor = ActorNN(**actor_kwargs)
+    actor.eval()
+
+    # waits for the first weights so that no episode is played with a random actor
+    version = None
+    while version is None and not stop_event.is_set():
+        try:
+            version, state_dict = weight_queue.get(timeout=0.1)
+            actor.load_state_dict(state_dict)
+        except queue.Empty:
+            pass
+
+    while not stop_event.is_set():
+        try:
+            while True:
+                version, state_dict = weight_queue.get_nowait()
+                actor.load_state_dict(state_dict)
+        except queue.Empty:
+            pass
+
+        for trajectory in runner.step(actor):
+            trajectory['version'] = version
+            trajectory['worker'] = worker_id
+            while not stop_event.is_set():
+                try:
+                    trajectory_queue.put(trajectory, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+############################## Rollout Buffer ##############################
+
+def _discount_matrix(length : int, discount : float) -> np.ndarray:
+    """M[k,t] = discount**(k-t) for k >= t, so x @ M gives the discounted sums-to-go of every row of x"""
+    exponents = np.arange(length)[:, None] - np.arange(length)[None, :]
+    return np.where(exponents >= 0, float(discount) ** np.maximum(exponents, 0), 0).astype(np.float32)
+
+def discounted_returns(rewards : np.ndarray, gamma : float) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: the rewards-to-go of an episode
+    """
+    rewards = np.asarray(rewards, dtype=np.float32)
+    return rewards @ _discount_matrix(len(rewards), gamma)
+
+class RolloutBuffer:
+    """Collects whole episodes as flat per step id arrays (current article, target, index of the episode's path
+    and the chosen action), the embeddings are only gathered for the minibatch being trained on. Advantages are
+    computed with GAE over every episode at once and minibatches are drawn from the shuffled steps.
+    """
+
+    def __init__(self, graph : CSRGraph, embeddings : np.ndarray, max_actions : int = None):
+        """
+        Args:
+            graph (CSRGraph): the graph the episodes are played on
+            embeddings (np.ndarray): (num nodes, dim) node embeddings aligned with the graph
+            max_actions (int, optional): the action cap the episodes were played with. Defaults to None.
+        """
+        self.graph = graph
+        self.embeddings = embeddings
+        self.max_actions = max_actions
+        self.clear()
+
+    def clear(self):
+        self.trajectories : List[dict] = []
+        self.num_steps = 0
+        self.advantages : np.ndarray = None
+        self.returns : np.ndarray = None
+
+    def add(self, trajectory : dict):
+        self.trajectories.append(trajectory)
+        self.num_steps += len(trajectory['actions'])
+        self.advantages = self.returns = None
+
+    def __len__(self) -> int:
+        return self.num_steps
+
+    def _flatten(self):
+        steps = np.array([len(trajectory['actions']) for trajectory in self.trajectories], dtype=np.int64)
+        self.episode = np.repeat(np.arange(len(steps)), steps)
+        self.step_index = np.arange(self.num_steps) - np.repeat(np.cumsum(steps) - steps, steps)
+        self.current = np.concatenate([trajectory['path'][:-1] for trajectory in self.trajectories]).astype(np.int64)
+        self.target = np.repeat([trajectory['target'] for trajectory in self.trajectories], steps).astype(np.int64)
+        self.actions = np.concatenate([trajectory['actions'] for trajectory in self.trajectories]).astype(np.int64)
+        self.rewards = np.concatenate([trajectory['rewards'] for trajectory in self.trajectories]).astype(np.float32)
+        self.log_probs = np.concatenate([trajectory['log_probs'] for trajectory in self.trajectories]).astype(np.float32)
+        # the visited articles of every episode, a step's path is the prefix before its current article
+        self.paths = np.full((len(steps), int(steps.max(initial=0)) + 1), -1, dtype=np.int32)
+        for i, trajectory in enumerate(self.trajectories):
+            self.paths[i, :len(trajectory['path'])] = trajectory['path']
+        self.steps_per_episode = steps
+        self.truncated = np.array([trajectory.get('truncated', False) for trajectory in self.trajectories], dtype=bool)
+
+    def tensors(self, indices : np.ndarray) -> Dict[str,torch.Tensor]:
+        """Gathers the embeddings of a set of steps into the padded tensors the actor and critic take.
+
+        Args:
+            indices (np.ndarray): the step indices
+
+        Returns:
+            Dict[str,torch.Tensor]: the target/current/path/action tensors along with the chosen actions
+        """
+        lengths = self.step_index[indices]
+        action_ids, mask = neighbour_actions(self.graph, self.current[indices], self.max_actions)
+        action_embs, action_mask = action_tensor(self.embeddings, action_ids, mask)
+        return {'target' : torch.as_tensor(self.embeddings[self.target[indices]], dtype=torch.float32),
+                'current' : torch.as_tensor(self.embeddings[self.current[indices]], dtype=torch.float32),
+                'path' : path_tensor(self.embeddings, self.paths[self.episode[indices]], lengths),
+                'path_lengths' : torch.as_tensor(lengths),
+                'action_embs' : action_embs,
+                'action_mask' : action_mask,
+                'actions' : torch.as_tensor(self.actions[indices])}
+
+    def compute_advantages(self, critic : CriticNN, gamma : float = 0.99, gae_lambda : float = 0.95, chunk_size : int = 1024,
+                           metrics : TrainingMetrics = None):
+        """Evaluates the critic over every step (in chunks, without gradients) and computes the GAE advantages
+        and the returns (advantages + values). The last step of an episode is terminal unless it was truncated by
+        max_steps, those are bootstrapped with the critic's value of the article they stopped on.
+
+        Args:
+            critic (CriticNN): the value function
+            gamma (float, optional): the discount. Defaults to 0.99.
+            gae_lambda (float, optional): the GAE bias/variance trade off, 1 gives the plain rewards-to-go. Defaults to 0.95.
+            chunk_size (int, optional): the number of steps per critic call. Defaults to 1024.
+            metrics (TrainingMetrics, optional): times the embedding lookups and critic calls. Defaults to None.
+        """
+        self._flatten()
+        values = np.zeros(self.num_steps, dtype=np.float32)
+        with torch.no_grad():
+            for start in range(0, self.num_steps, chunk_size):
+                indices = np.arange(start, min(start + chunk_size, self.num_steps))
+                with timed(metrics, "embed"):
+                    batch = self.tensors(indices)
+                with timed(metrics, "value_forward"):
+                    values[indices] = critic(batch['target'], batch['current'], batch['path'],
+                                             path_lengths=batch['path_lengths']).squeeze(-1).numpy()
+
+        # the episodes are laid out as (episodes, longest episode) rows padded with zeros
+        width = self.paths.shape[1] - 1
+        padded_values = np.zeros((len(self.trajectories), width + 1), dtype=np.float32)
+        padded_rewards = np.zeros((len(self.trajectories), width), dtype=np.float32)
+        padded_values[self.episode, self.step_index] = values
+        padded_rewards[self.episode, self.step_index] = self.rewards
+
+        truncated = np.flatnonzero(self.truncated)
+        if len(truncated):
+            steps = self.steps_per_episode[truncated]
+            last = self.paths[truncated, steps]
+            targets = np.array([self.trajectories[i]['target'] for i in truncated], dtype=np.int64)
+            with torch.no_grad():
+                with timed(metrics, "embed"):
+                    target_emb = torch.as_tensor(self.embeddings[targets], dtype=torch.float32)
+                    current_emb = torch.as_tensor(self.embeddings[last], dtype=torch.float32)
+                    path_embs = path_tensor(self.embeddings, self.paths[truncated], steps)
+                with timed(metrics, "value_forward"):
+                    padded_values[truncated, steps] = critic(target_emb, current_emb, path_embs,
+                                                             path_lengths=torch.as_tensor(steps)).squeeze(-1).numpy()
+
+        deltas = padded_rewards + gamma * padded_values[:, 1:] - padded_values[:, :-1]
+        # the padding past an episode's end must not carry its bootstrap value back
+        deltas[np.arange(width)[None, :] >= self.steps_per_episode[:, None]] = 0
+        advantages = deltas @ _discount_matrix(width, gamma * gae_lambda)
+        self.advantages = advantages[self.episode, self.step_index]
+        self.returns = self.advantages + values
+
+    def minibatches(self, minibatch_size : int, rng : np.random.Generator = None) -> Iterator[np.ndarray]:
+        """
+        Returns:
+            Iterator[np.ndarray]: the step indices of every minibatch of one pass over the shuffled buffer
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        order = rng.permutation(self.num_steps)
+        for start in range(0, self.num_steps, minibatch_size):
+            yield order[start:start + minibatch_size]
+
+############################## Learner ##############################
+
+def buffer_update(buffer : RolloutBuffer,
+                  actor : ActorNN,
+                  critic : CriticNN,
+                  actor_optimizer,
+                  critic_optimizer,
+                  epochs : int = 4,
+                  minibatch_size : int = 256,
+                  gamma : float = 0.99,
+                  gae_lambda : float = 0.95,
+                  clip : float = 0.2,
+                  rng : np.random.Generator = None,
+                  metrics : TrainingMetrics = None) -> Dict[str,float]:
+    """Several epochs of shuffled minibatch updates over the episodes in a buffer. Since the actor changes
+    between minibatches (and the episodes may come from older weights) the actor loss is the clipped
+    importance weighted objective against the log probabilities recorded while acting.
+
+    Returns:
+        Dict[str,float]: the last actor loss, last critic loss and mean episode reward of the buffer
+    """
+    buffer.compute_advantages(critic, gamma, gae_lambda, metrics=metrics)
+    advantages = (buffer.advantages - buffer.advantages.mean()) / (buffer.advantages.std() + 1e-8)
+
+    for _ in range(epochs):
+        for indices in buffer.minibatches(minibatch_size, rng):
+            with timed(metrics, "embed"):
+                batch = buffer.tensors(indices)
+            with timed(metrics, "train_forward"):
+                action_probs = actor(batch['target'], batch['current'], batch['path'], batch['action_embs'],
+                                     batch['action_mask'], path_lengths=batch['path_lengths'])
+                log_probs = torch.log(action_probs.gather(1, batch['actions'].unsqueeze(1)).squeeze(1).clamp(min=1e-12))
+                ratio = torch.exp(log_probs - torch.as_tensor(buffer.log_probs[indices]))
+                minibatch_advantages = torch.as_tensor(advantages[indices], dtype=torch.float32)
+                actor_loss = -torch.min(ratio * minibatch_advantages,
+                                        ratio.clamp(1 - clip, 1 + clip) * minibatch_advantages).mean()
+
+                values = critic(batch['target'], batch['current'], batch['path'], path_lengths=batch['path_lengths']).squeeze(-1)
+                critic_loss = F.mse_loss(values, torch.as_tensor(buffer.returns[indices], dtype=torch.float32))
+
+            with timed(metrics, "backward"):
+                actor_optimizer.zero_grad()
+                actor_loss.backward()
+                actor_optimizer.step()
+
+                critic_optimizer.zero_grad()
+                critic_loss.backward()
+                critic_optimizer.step()
+
+    return {'actor_loss' : actor_loss.item(),
+            'critic_loss' : critic_loss.item(),
+            'mean_reward' : float(np.mean([trajectory['rewards'].sum() for trajectory in buffer.trajectories]))}
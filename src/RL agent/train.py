@@ -40,141 +40,258 @@
 
 ###############################################################################################
 
-from wikiGameEnvironment import WikiEnvironment
+from wikiGameEnvironment import BatchedWikiEnvironment
 from agent import ActorNN,CriticNN
 import networkx
-from gensim.models import KeyedVectors
-from pathlib import Path
-import torch
 import torch.optim as optim
-import torch.nn.functional as F
 from collections import deque
 import numpy as np
 import pickle
 
 import sys                       
 sys.path.append("./src")     
-from wikiLinkRetrieval import clean_wiki_link
-from searchAlgorithms import phrase_to_vec
+from csrGraph import CSRGraph
+import os
+import queue
+import multiprocessing as mp
+from rollouts import rollout_worker, load_shared, check_alignment, EpisodeRunner, RolloutBuffer, buffer_update
+from trainingMetrics import TrainingMetrics, timed
 
-def train_agent(env, actor, critic, episodes=1000, lr=3e-4):
+def train_agent(env : BatchedWikiEnvironment,
+                actor : ActorNN,
+                critic : CriticNN,
+                episodes : int = 1000,
+                lr : float = 3e-4,
+                batch_steps : int = 2048,
+                epochs : int = 4,
+                minibatch_size : int = 256,
+                gamma : float = 0.99,
+                gae_lambda : float = 0.95,
+                clip : float = 0.2,
+                seed : int = None,
+                metrics : TrainingMetrics = None):
+    """Plays the env's games with the actor until a rollout buffer holds batch_steps steps of finished episodes,
+    then trains on the buffer for several epochs of shuffled minibatches (see rollouts.buffer_update) before
+    collecting the next batch. The episodes are stored as article ids and only the minibatch being trained on
+    is turned into embeddings.
+
+    Args:
+        env (BatchedWikiEnvironment): the games, built with the (unit, graph aligned) embeddings
+        actor (ActorNN): the actor being trained
+        critic (CriticNN): the critic being trained
+        episodes (int, optional): the number of episodes to train on. Defaults to 1000.
+        lr (float, optional): the learning rate of both networks. Defaults to 3e-4.
+        batch_steps (int, optional): the number of steps collected before each update. Defaults to 2048.
+        epochs (int, optional): the number of passes over every batch. Defaults to 4.
+        minibatch_size (int, optional): the number of steps per optimizer step. Defaults to 256.
+        gamma (float, optional): the discount. Defaults to 0.99.
+        gae_lambda (float, optional): the GAE parameter. Defaults to 0.95.
+        clip (float, optional): the clipping range of the policy ratio. Defaults to 0.2.
+        seed (int, optional): seeds the minibatch shuffling. Defaults to None.
+        metrics (TrainingMetrics, optional): gets the phase timings, throughput, action set sizes and memory use
+                                             (along with the losses) of every update. Defaults to None.
+
+    Raises:
+        ValueError: if the env has no embeddings
+
+    Returns:
+        Tuple[ActorNN,CriticNN]: the trained actor and critic
+    """
+    if env.embeddings is None:
+        raise ValueError("the environment needs node embeddings to build the actor's inputs")
 
     actor_optimizer = optim.Adam(actor.parameters(), lr=lr)
     critic_optimizer = optim.Adam(critic.parameters(), lr=lr)
-    
+    rng = np.random.default_rng(seed)
+
+    runner = EpisodeRunner(env, env.embeddings, metrics)
+    buffer = RolloutBuffer(env.graph, env.embeddings, env.max_actions)
+
     # Track training metrics
     episode_rewards = deque(maxlen=100)
     episode_lengths = deque(maxlen=100)
-    
-    for episode in range(episodes):
-        # Reset environment
-        env.reset()
-        state = env.get_state()
-        
-        # Episode storage
-        states, actions, rewards, log_probs, values = [], [], [], [], []
-        done = False
-
-        print(f"------------- episode {episode} -------------")
-        
-        while not done:
-            # Convert state to tensors
-            target_emb = torch.tensor(state['target article'], dtype=torch.float32).unsqueeze(0)
-            current_emb = torch.tensor(state['current article'], dtype=torch.float32).unsqueeze(0)
-            path_embs = torch.tensor(state['path'], dtype=torch.float32).unsqueeze(0) if state['path'] else torch.zeros(1, 0, len(state['target article']))
-            
-            # Get available actions
-            action_embs = env.get_actions()
-            if not action_embs:  # No actions available
-                break
-                
-            action_embs_tensor = [torch.tensor(emb, dtype=torch.float32) for emb in action_embs]
-            
-            # Forward pass through networks
-            action_probs = actor(target_emb, current_emb, path_embs, action_embs_tensor)
-            value = critic(target_emb, current_emb, path_embs)
-            
-            # Sample action
-            action_dist = torch.distributions.Categorical(action_probs)
-            action_idx = action_dist.sample()
-            log_prob = action_dist.log_prob(action_idx)
-            
-            # Take step in environment
-            selected_action = action_embs[action_idx.item()]
-            next_state, reward, done = env.step(selected_action)
-            
-            # Store trajectory
-            states.append((target_emb, current_emb, path_embs, action_embs_tensor))
-            actions.append(action_idx)
-            rewards.append(reward)
-            log_probs.append(log_prob)
-            values.append(value)
-            
-            state = next_state
-        
-        # Calculate returns (rewards-to-go)
-        returns = []
-        R = 0
-        for reward in reversed(rewards):
-            R = reward + 0.99 * R  # gamma = 0.99
-            returns.insert(0, R)
-        returns = torch.tensor(returns, dtype=torch.float32)
-        
-        # Convert to tensors
-        log_probs = torch.stack(log_probs)
-        values = torch.stack(values).squeeze()
-        
-        # Calculate advantages
-        advantages = returns - values.detach()
-        
-        # Actor loss (policy gradient with baseline)
-        actor_loss = -(log_probs * advantages).mean()
-        
-        # Critic loss (MSE between predicted and actual returns)
-        critic_loss = F.mse_loss(values, returns)
-        
-        # Update networks
-        actor_optimizer.zero_grad()
-        actor_loss.backward()
-        actor_optimizer.step()
-        
-        critic_optimizer.zero_grad()
-        critic_loss.backward()
-        critic_optimizer.step()
-        
-        # Track metrics
-        episode_reward = sum(rewards)
-        episode_rewards.append(episode_reward)
-        episode_lengths.append(len(rewards))
-        
+
+    played = 0
+    update = 0
+    if metrics is not None:
+        metrics.start_profiling()
+    while played < episodes:
+        buffer.clear()
+        while len(buffer) < batch_steps and played < episodes:
+            for trajectory in runner.step(actor):
+                buffer.add(trajectory)
+                episode_rewards.append(trajectory['rewards'].sum())
+                episode_lengths.append(len(trajectory['actions']))
+                played += 1
+        if len(buffer) == 0:
+            continue
+
+        losses = buffer_update(buffer, actor, critic, actor_optimizer, critic_optimizer,
+                               epochs, minibatch_size, gamma, gae_lambda, clip, rng, metrics)
+        if metrics is not None:
+            metrics.record(update, avg_reward=np.mean(episode_rewards), avg_length=np.mean(episode_lengths), **losses)
+
         # Print progress
-        if episode % 100 == 0:
-            avg_reward = np.mean(episode_rewards)
-            avg_length = np.mean(episode_lengths)
-            print(f"Episode {episode}, Avg Reward: {avg_reward:.2f}, Avg Length: {avg_length:.2f}")
-    
+        if update % 10 == 0:
+            print(f"Episode {played}, Avg Reward: {np.mean(episode_rewards):.2f}, Avg Length: {np.mean(episode_lengths):.2f}, "
+                  f"Actor Loss: {losses['actor_loss']:.3f}, Critic Loss: {losses['critic_loss']:.3f}")
+        update += 1
+
+    if metrics is not None:
+        metrics.stop_profiling()
+    return actor, critic
+
+def train_distributed(graph_directory : str,
+                      embedding_directory : str,
+                      actor : ActorNN,
+                      critic : CriticNN,
+                      num_workers : int = 4,
+                      updates : int = 1000,
+                      episodes_per_update : int = 32,
+                      broadcast_every : int = 10,
+                      lr : float = 3e-4,
+                      gamma : float = 0.99,
+                      gae_lambda : float = 0.95,
+                      epochs : int = 4,
+                      minibatch_size : int = 256,
+                      clip : float = 0.2,
+                      envs_per_worker : int = 16,
+                      max_steps : int = 20,
+                      max_actions : int = None,
+                      queue_size : int = 256,
+                      seed : int = None,
+                      timeout : float = 60.0,
+                      metrics : TrainingMetrics = None):
+    """Actor-learner version of train_agent. num_workers processes each play envs_per_worker games at once with
+    a copy of the actor (reading the graph and embeddings through shared memory maps) and send the finished
+    episodes back as compact id arrays, while this process batches them into updates and broadcasts the new actor
+    weights to the workers every broadcast_every updates. Every update is the same minibatch training as
+    train_agent's, whose clipped policy ratio also accounts for episodes played with older weights.
+
+    Args:
+        graph_directory (str): a directory written by CSRGraph.save
+        embedding_directory (str): a directory written by EmbeddingIndex.save over the graph's nodes (same order)
+        actor (ActorNN): the actor being trained
+        critic (CriticNN): the critic being trained
+        num_workers (int, optional): the number of rollout processes. Defaults to 4.
+        updates (int, optional): the number of learner updates. Defaults to 1000.
+        episodes_per_update (int, optional): the number of episodes in each update. Defaults to 32.
+        broadcast_every (int, optional): the number of updates between weight broadcasts. Defaults to 10.
+        epochs, minibatch_size, gamma, gae_lambda, clip: the update parameters, as in train_agent.
+        queue_size (int, optional): bounds the episodes waiting for the learner (and so their staleness). Defaults to 256.
+        timeout (float, optional): seconds without any episode after which the workers are considered dead. Defaults to 60.0.
+        metrics (TrainingMetrics, optional): gets the learner's phase timings (including the time spent waiting
+                                             on the workers) and throughput of every update. Defaults to None.
+
+    Raises:
+        ValueError: if the embedding rows don't follow the graph's node order
+        RuntimeError: if no episode arrives within the timeout
+
+    Returns:
+        Tuple[ActorNN,CriticNN]: the trained actor and critic
+    """
+    check_alignment(graph_directory, embedding_directory)
+    graph, embeddings = load_shared(graph_directory, embedding_directory)
+
+    actor_optimizer = optim.Adam(actor.parameters(), lr=lr)
+    critic_optimizer = optim.Adam(critic.parameters(), lr=lr)
+    episode_rewards = deque(maxlen=100)
+    buffer = RolloutBuffer(graph, embeddings, max_actions)
+    rng = np.random.default_rng(seed)
+
+    # spawn rather than fork, forking a process that already ran torch can deadlock
+    context = mp.get_context("spawn")
+    trajectory_queue = context.Queue(maxsize=queue_size)
+    weight_queues = [context.Queue() for _ in range(num_workers)]
+    stop_event = context.Event()
+    actor_kwargs = {'embedding_dim' : actor.embedding_dim, 'hidden_dim' : actor.hidden_dim}
+
+    def broadcast(version):
+        state_dict = {name : tensor.detach().cpu().clone() for name, tensor in actor.state_dict().items()}
+        for weight_queue in weight_queues:
+            weight_queue.put((version, state_dict))
+
+    workers = [context.Process(target=rollout_worker,
+                               args=(worker_id, graph_directory, embedding_directory, actor_kwargs,
+                                     trajectory_queue, weight_queues[worker_id], stop_event,
+                                     envs_per_worker, max_steps, max_actions, seed),
+                               daemon=True)
+               for worker_id in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        version = 0
+        broadcast(version)
+        if metrics is not None:
+            metrics.start_profiling()
+        for update in range(updates):
+            buffer.clear()
+            while len(buffer.trajectories) < episodes_per_update:
+                try:
+                    with timed(metrics, "wait"):
+                        trajectory = trajectory_queue.get(timeout=timeout)
+                except queue.Empty:
+                    raise RuntimeError(f"no episode in {timeout}s, {sum(w.is_alive() for w in workers)}/{num_workers} workers alive")
+                buffer.add(trajectory)
+                if metrics is not None:
+                    metrics.count_steps(len(trajectory['actions']))
+                    metrics.count_episodes(1)
+
+            losses = buffer_update(buffer, actor, critic, actor_optimizer, critic_optimizer,
+                                   epochs, minibatch_size, gamma, gae_lambda, clip, rng, metrics)
+            episode_rewards.extend(trajectory['rewards'].sum() for trajectory in buffer.trajectories)
+
+            if (update + 1) % broadcast_every == 0:
+                version += 1
+                with timed(metrics, "broadcast"):
+                    broadcast(version)
+            if metrics is not None:
+                staleness = np.mean([version - trajectory['version'] for trajectory in buffer.trajectories])
+                metrics.record(update, avg_reward=np.mean(episode_rewards), staleness=staleness, **losses)
+            if update % 100 == 0:
+                print(f"Update {update}, Avg Reward: {np.mean(episode_rewards):.2f}, Actor Loss: {losses['actor_loss']:.3f}")
+    finally:
+        if metrics is not None:
+            metrics.stop_profiling()
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        for worker_queue in [trajectory_queue] + weight_queues:
+            worker_queue.cancel_join_thread()
+            worker_queue.close()
+
     return actor, critic
 
 # Usage example:
 # Assuming you have initialized env, actor, and critic
 # trained_actor, trained_critic = train_agent(env, actor, critic)
 
-with open("src/RL agent/graphs/CountryGraphL2.pickle","rb") as f:
-    country_graph : networkx.DiGraph = pickle.load(f)
+if __name__ == "__main__":
+    # prefer the memory mapped CSR version of the graph (made with src/csrGraph.py) over the pickle
+    if os.path.isdir("src/RL agent/graphs/CountryGraphL2"):
+        country_graph : CSRGraph = CSRGraph.load("src/RL agent/graphs/CountryGraphL2")
+    else:
+        with open("src/RL agent/graphs/CountryGraphL2.pickle","rb") as f:
+            country_graph : networkx.DiGraph = pickle.load(f)
+
+    print(len(list(country_graph.nodes)))
+    print(country_graph.number_of_edges())
+    dead_ends = sum(1 for node in country_graph.nodes if country_graph.out_degree(node) == 0)
+    print(f"Dead ends: {dead_ends}/{len(country_graph.nodes)} ({dead_ends/len(country_graph.nodes)*100:.1f}%)")
 
-print(len(list(country_graph.nodes)))
-print(len(list(country_graph.edges)))
-dead_ends = sum(1 for node in country_graph.nodes if country_graph.out_degree(node) == 0)
-print(f"Dead ends: {dead_ends}/{len(country_graph.nodes)} ({dead_ends/len(country_graph.nodes)*100:.1f}%)")
 
+    # word2vec_model : KeyedVectors = KeyedVectors.load(str(Path("models/word2vec/wiki-news-300d-1M.kv").resolve()),mmap='r')
 
-# word2vec_model : KeyedVectors = KeyedVectors.load(str(Path("models/word2vec/wiki-news-300d-1M.kv").resolve()),mmap='r')
+    # index = EmbeddingIndex.from_keyed_vectors(word2vec_model, country_graph.nodes)
+    # env = BatchedWikiEnvironment(country_graph, num_envs=64, embeddings=index.vectors, seed=22)
+    # actor = ActorNN(word2vec_model.vector_size)
 
-# env = WikiEnvironment(G=country_graph,
-#                     embedder=lambda x : phrase_to_vec(clean_wiki_link(x),word2vec_model),
-#                     seed= 22)
-# actor = ActorNN(word2vec_model.vector_size)
+    # critic = CriticNN(word2vec_model.vector_size)
 
-# critic = CriticNN(word2vec_model.vector_size)
+    # train_agent(env,actor,critic)
 
-# train_agent(env,actor,critic)
\ No newline at end of file
+    # or with rollout worker processes, once an EmbeddingIndex over country_graph.nodes has been saved
+    # train_distributed("src/RL agent/graphs/CountryGraphL2", "src/RL agent/graphs/CountryGraphL2Embeddings", actor, critic)
@@ -0,0 +1,191 @@
+import os                                     # log directory handling
+import csv                                    # csv logs
+import json                                   # jsonl logs
+import time                                   # phase timers
+import cProfile                               # opt in profiling of the first episodes
+import contextlib                             # phase context managers
+from collections import defaultdict
+from typing import Dict,List,Any              # just needed for signatures/type hinting
+import numpy as np
+
+try:
+    import resource                           # peak memory, unix only
+except ImportError:
+    resource = None
+
+def _rss_mb() -> float:
+    """the current resident memory of the process in MB (0 where it can't be read)"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+def _peak_rss_mb() -> float:
+    """the peak resident memory of the process in MB (0 where it can't be read)"""
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10
+
+class TrainingMetrics:
+    """Where the training loops report what they spend their time on. The loops wrap their phases (env stepping,
+    embedding lookups, forward passes, backprop, ...) in phase(name) and count the steps, episodes and action set
+    sizes they go through, then record() turns everything accumulated since the previous record into one row of
+    per phase seconds, steps/s, episodes/s, action set sizes and memory use. Rows are appended to a .csv or .jsonl
+    log and/or sent to a TensorBoard style writer (anything with add_scalar(tag, value, step), e.g.
+    torch.utils.tensorboard.SummaryWriter).
+
+    With profile_episodes > 0 the first profile_episodes episodes (and the updates between them) are run under
+    cProfile, from the loop's start_profiling call on, and the stats are dumped to profile_path, to be read with
+    pstats or snakeviz. Sampling profilers like py-spy need no hook, they can attach to the running pid
+    (py-spy record --pid ...).
+    """
+
+    def __init__(self,
+                 log_path : str = None,
+                 writer = None,
+                 profile_episodes : int = 0,
+                 profile_path : str = "train_agent.prof"):
+        """
+        Args:
+            log_path (str, optional): a .csv or .jsonl file the rows are appended to. Defaults to None.
+            writer (optional): a TensorBoard style writer the rows are sent to. Defaults to None.
+            profile_episodes (int, optional): the number of episodes run under cProfile. Defaults to 0 (no profiling).
+            profile_path (str, optional): where the profile stats are dumped. Defaults to "train_agent.prof".
+
+        Raises:
+            ValueError: if the log isn't a .csv or .jsonl file
+        """
+        if log_path is not None and not log_path.endswith((".csv", ".jsonl")):
+            raise ValueError(f"{log_path} should be a .csv or .jsonl file")
+        self.log_path = log_path
+        self.writer = writer
+        self.profile_episodes = profile_episodes
+        self.profile_path = profile_path
+        self.rows : List[Dict[str,Any]] = []
+
+        self.total_steps = 0
+        self.total_episodes = 0
+        self._csv_fields : List[str] = None
+        self._profiler : cProfile.Profile = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = time.perf_counter()
+        self.phase_seconds : Dict[str,float] = defaultdict(float)
+        self.steps = 0
+        self.episodes = 0
+        self.action_sizes : List[np.ndarray] = []
+
+    @contextlib.contextmanager
+    def phase(self, name : str):
+        """Adds the time spent inside the with block to the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.perf_counter() - start
+
+    def count_steps(self, steps : int, action_sizes : np.ndarray = None):
+        """
+        Args:
+            steps (int): the number of env steps taken
+            action_sizes (np.ndarray, optional): the number of actions each of those steps had. Defaults to None.
+        """
+        self.steps += steps
+        self.total_steps += steps
+        if action_sizes is not None and len(action_sizes):
+            self.action_sizes.append(np.asarray(action_sizes))
+
+    def count_episodes(self, episodes : int):
+        self.episodes += episodes
+        self.total_episodes += episodes
+        if self._profiler is not None and self.total_episodes >= self.profile_episodes:
+            self.stop_profiling()
+
+    def start_profiling(self):
+        """Starts the profiler when the first profiled episode starts, the training loops call it once their setup
+        (models, workers...) is done. Does nothing without profile_episodes, or once they have been profiled."""
+        if self._profiler is not None or self.total_episodes >= self.profile_episodes:
+            return
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop_profiling(self):
+        """Stops the profiler (if it is running) and dumps its stats to profile_path."""
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        self._profiler.dump_stats(self.profile_path)
+        self._profiler = None
+
+    def record(self, step : int, **scalars) -> Dict[str,Any]:
+        """Closes the current window into a row, logs it and starts a new window.
+
+        Args:
+            step (int): the x axis of the row (e.g. the update number)
+            **scalars: any other values to log along with the row (e.g. the losses)
+
+        Returns:
+            Dict[str,Any]: the row
+        """
+        elapsed = max(time.perf_counter() - self.window_start, 1e-9)
+        sizes = np.concatenate(self.action_sizes) if self.action_sizes else np.zeros(0)
+        row = {'step' : step,
+               'time' : time.time(),
+               'elapsed' : elapsed,
+               'steps' : self.steps,
+               'episodes' : self.episodes,
+               'total_steps' : self.total_steps,
+               'total_episodes' : self.total_episodes,
+               'steps_per_s' : self.steps / elapsed,
+               'episodes_per_s' : self.episodes / elapsed,
+               'mean_actions' : float(sizes.mean()) if len(sizes) else 0.0,
+               'max_actions' : int(sizes.max()) if len(sizes) else 0,
+               'rss_mb' : _rss_mb(),
+               'peak_rss_mb' : _peak_rss_mb()}
+        row.update({f"phase_{name}" : seconds for name, seconds in sorted(self.phase_seconds.items())})
+        row.update({name : float(value) for name, value in scalars.items()})
+
+        self.rows.append(row)
+        self._write(row)
+        self._reset_window()
+        return row
+
+    def _write(self, row : Dict[str,Any]):
+        if self.writer is not None:
+            for name, value in row.items():
+                if name not in ('step', 'time'):
+                    self.writer.add_scalar(name, value, row['step'])
+
+        if self.log_path is None:
+            return
+        if self.log_path.endswith(".jsonl"):
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(row) + "\n")
+            return
+
+        # the columns are fixed by the first row, a phase first seen later is left out of the csv
+        new_file = not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0
+        if self._csv_fields is None:
+            if new_file:
+                self._csv_fields = list(row)
+            else:
+                with open(self.log_path, 'r', encoding='utf-8', newline='') as f:
+                    self._csv_fields = next(csv.reader(f))
+        with open(self.log_path, 'a', encoding='utf-8', newline='') as f:
+            log = csv.DictWriter(f, fieldnames=self._csv_fields, extrasaction='ignore')
+            if new_file:
+                log.writeheader()
+            log.writerow(row)
+
+    def close(self):
+        self.stop_profiling()
+        if self.writer is not None and hasattr(self.writer, "flush"):
+            self.writer.flush()
+
+def timed(metrics : TrainingMetrics, name : str):
+    """metrics.phase(name), or a no-op when no metrics are being kept"""
+    return metrics.phase(name) if metrics is not None else contextlib.nullcontext()
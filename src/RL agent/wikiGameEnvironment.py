@@ -11,6 +11,8 @@ import sys
 sys.path.append("./src")     
 from wikiLinkRetrieval import clean_wiki_link
 from searchAlgorithms import phrase_to_vec
+from csrGraph import CSRGraph
+from landmarkIndex import LandmarkIndex
 
 class WikiEnvironment:
     def assign_nodes(self,init_node : str = None, target_node : str = None):
@@ -33,8 +35,14 @@ class WikiEnvironment:
             self.target_node = target_node
             print(f"target article --> {self.target_node}")
 
+        # the embeddings of the episode are computed once and kept, the path ones are appended as the game goes
+        self.target_emb = np.asarray(self.embedder(self.target_node))
+        self.current_emb = np.asarray(self.embedder(self.current_node))
+        self.path_embs = np.zeros((16, len(self.target_emb)), dtype=np.float32)
+        self.delta_start = 0
+
     def __init__(self,
-                 G : nx.DiGraph,
+                 G : nx.DiGraph, # or a CSRGraph
                  embedder,
                  init_node : str = None,
                  target_node : str = None,
@@ -42,8 +50,21 @@ class WikiEnvironment:
                  success_reward: float = 1000.0,
                  step_loss: float = -2.0,
                  similarity_threshold: float = 0.6,
-                 similarity_scale_factor: float = 2):
-        
+                 similarity_scale_factor: float = 2,
+                 path_deltas : bool = False,
+                 landmarks : LandmarkIndex = None,
+                 distance_scale : float = 2.0):
+        """
+        Args:
+            path_deltas (bool, optional): if True get_state only gives the articles added to the path since the last
+                                          call (and their embeddings) instead of the whole path, so the agent can carry
+                                          on its own path encoding. Defaults to False.
+            landmarks (LandmarkIndex, optional): a landmark index over the graph (with its graph set for url queries),
+                                                 when given the similarity shaping is replaced by distance shaping,
+                                                 distance_scale times the estimated hops to the target the step saved.
+                                                 Defaults to None.
+            distance_scale (float, optional): the reward of a step getting one hop closer to the target. Defaults to 2.0.
+        """
         self.seed = seed
         if seed is not None:
             random.seed(seed)
@@ -55,41 +76,239 @@ class WikiEnvironment:
         self.step_loss = step_loss
         self.similarity_threshold = similarity_threshold
         self.similarity_scale_factor = similarity_scale_factor
+        self.path_deltas = path_deltas
+        self.landmarks = landmarks
+        self.distance_scale = distance_scale
         self.visited = []
         self.assign_nodes(init_node,target_node)
 
+    def _append_path(self, embedding : np.ndarray):
+        # the path buffer doubles when full so appending is amortized constant time
+        if len(self.visited) > len(self.path_embs):
+            grown = np.zeros((2 * len(self.path_embs), self.path_embs.shape[1]), dtype=np.float32)
+            grown[:len(self.path_embs)] = self.path_embs
+            self.path_embs = grown
+        self.path_embs[len(self.visited) - 1] = embedding
+
     def get_state(self):
-        return {'path' : list(map(self.embedder,self.visited)),
-         'current article' : self.embedder(self.current_node),
-         'target article' : self.embedder(self.target_node)}
+        if self.path_deltas:
+            state = {'path delta' : self.visited[self.delta_start:],
+                     'path delta embeddings' : self.path_embs[self.delta_start:len(self.visited)],
+                     'current article' : self.current_emb,
+                     'target article' : self.target_emb}
+            self.delta_start = len(self.visited)
+            return state
+
+        # a view of the used part of the buffer, later appends write past it
+        return {'path' : self.path_embs[:len(self.visited)],
+         'current article' : self.current_emb,
+         'target article' : self.target_emb}
         
     def get_actions(self):
         return list(map(self.embedder,self.graph.neighbors(self.current_node)))
     
     def step(self,model_output):
-        output_norm = np.linalg.norm(model_output)
-        def cosine_sim(adjacent_vec):
-            adjacent_norm = np.linalg.norm(adjacent_vec)
-            return np.dot(model_output,adjacent_vec)/(adjacent_norm*output_norm)
-        
-        max_similarity = -1
-        most_similar = None
-        for adj in self.get_actions():
-            if cosine_sim(self.embedder(adj)) < max_similarity:
-                most_similar = adj
-                max_similarity = cosine_sim(self.embedder(adj))
+        neighbours = list(self.graph.neighbors(self.current_node))
+        neighbour_embs = np.asarray([self.embedder(adj) for adj in neighbours], dtype=np.float32)
 
+        # cosine similarity of the model output to every neighbour at once
+        norms = np.linalg.norm(neighbour_embs, axis=1) * np.linalg.norm(model_output)
+        similarities = np.divide(neighbour_embs @ np.asarray(model_output, dtype=np.float32), norms,
+                                 out=np.zeros(len(neighbours), dtype=np.float32), where=norms > 0)
+        best = int(np.argmax(similarities))
+        max_similarity = similarities[best]
+
+        previous_node = self.current_node
         self.visited.append(self.current_node)
-        self.current_node = adj
+        self._append_path(self.current_emb)
+        self.current_node = neighbours[best]
+        self.current_emb = neighbour_embs[best]
 
-        similarity_reward = self.step_loss*(1/(1+np.exp(self.similarity_scale_factor(max_similarity-self.similarity_threshold))))-0.5*self.step_loss
+        if self.landmarks is not None:
+            before, after = self.landmarks.estimates([previous_node, self.current_node], [self.target_node] * 2,
+                                                     unreachable=self.landmarks.horizon)
+            similarity_reward = self.distance_scale*float(before - after)
+        else:
+            similarity_reward = self.step_loss*(1/(1+np.exp(self.similarity_scale_factor*(max_similarity-self.similarity_threshold))))-0.5*self.step_loss
 
         state = self.get_state()
-        isdone = True if (self.current_node == self.target_node) or (len(self.graph.neighbors(self.current_node)) == 0) else False
+        isdone = True if (self.current_node == self.target_node) or (self.graph.out_degree(self.current_node) == 0) else False
         reward = self.success_reward + similarity_reward  if isdone else self.step_loss + similarity_reward
 
         return [state, reward, isdone]
         
     def reset(self,init_node : str = None, target_node : str = None):
         self.visited = []
-        self.assign_nodes(init_node,target_node)
\ No newline at end of file
+        self.assign_nodes(init_node,target_node)
+
+class BatchedWikiEnvironment:
+    """Steps num_envs games at once over a CSRGraph. Every game's state lives in preallocated NumPy arrays
+    (current article id, target article id, path buffer, path length, done and truncated masks) and every operation is
+    vectorized over the games, so stepping thousands of episodes costs a handful of array operations.
+
+    Actions are indices into a game's neighbour list (the row of the padded action matrix given by get_actions).
+    Each step costs step_loss and reaching the target gives success_reward, when an embedding matrix is given
+    (unit rows aligned with the graph's ids, e.g. from an EmbeddingIndex built over graph.nodes) the same
+    similarity shaping as WikiEnvironment is added, based on the cosine similarity of the chosen article to the target.
+    With a LandmarkIndex the shaping uses the estimated graph distance to the target instead.
+    """
+
+    def __init__(self,
+                 graph : CSRGraph,
+                 num_envs : int,
+                 max_steps : int = 20,
+                 embeddings : np.ndarray = None,
+                 max_actions : int = None,
+                 seed : int = None,
+                 success_reward: float = 1000.0,
+                 step_loss: float = -2.0,
+                 similarity_threshold: float = 0.6,
+                 similarity_scale_factor: float = 2,
+                 landmarks : LandmarkIndex = None,
+                 distance_scale : float = 2.0):
+        """
+        Args:
+            graph (CSRGraph): the graph the games are played on
+            num_envs (int): the number of games stepped together
+            max_steps (int, optional): the number of jumps after which a game is over. Defaults to 20.
+            embeddings (np.ndarray, optional): (num nodes, dim) unit embeddings enabling the similarity reward. Defaults to None.
+            max_actions (int, optional): caps the number of actions (the first neighbours of hub pages). Defaults to None.
+            seed (int, optional): seeds the start/target sampling. Defaults to None.
+            landmarks (LandmarkIndex, optional): replaces the similarity shaping with distance_scale times the estimated
+                                                 hops to the target each step saved. Defaults to None.
+            distance_scale (float, optional): the reward of a step getting one hop closer to the target. Defaults to 2.0.
+        """
+        if len(graph) < 2:
+            raise ValueError(f"a game needs distinct start and target articles, the graph has {len(graph)} nodes")
+        self.graph = graph
+        self.num_envs = num_envs
+        self.max_steps = max_steps
+        self.embeddings = embeddings
+        self.max_actions = max_actions
+        self.success_reward = success_reward
+        self.step_loss = step_loss
+        self.similarity_threshold = similarity_threshold
+        self.similarity_scale_factor = similarity_scale_factor
+        self.landmarks = landmarks
+        self.distance_scale = distance_scale
+        self.rng = np.random.default_rng(seed)
+
+        self.offsets = np.asarray(graph.offsets)
+        self.targets = np.asarray(graph.targets)
+        self.degrees = np.diff(self.offsets)
+        # games only start on articles with somewhere to go
+        self.start_candidates = np.flatnonzero(self.degrees > 0)
+
+        self.current = np.zeros(num_envs, dtype=np.int32)
+        self.target = np.zeros(num_envs, dtype=np.int32)
+        self.path = np.full((num_envs, max_steps + 1), -1, dtype=np.int32)
+        self.length = np.zeros(num_envs, dtype=np.int32)
+        self.done = np.ones(num_envs, dtype=bool)
+        # the games stopped by max_steps rather than by reaching the target or a dead end
+        self.truncated = np.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def reset(self, env_ids : np.ndarray = None, starts : np.ndarray = None, targets : np.ndarray = None):
+        """Starts new games, random start and target articles are sampled for the ones not given.
+
+        Args:
+            env_ids (np.ndarray, optional): the games to reset. Defaults to every game.
+            starts (np.ndarray, optional): the start article ids. Defaults to None.
+            targets (np.ndarray, optional): the target article ids. Defaults to None.
+        """
+        env_ids = np.arange(self.num_envs) if env_ids is None else np.asarray(env_ids)
+        if starts is None:
+            starts = self.rng.choice(self.start_candidates, size=len(env_ids))
+        if targets is None:
+            targets = self.rng.integers(0, len(self.graph), size=len(env_ids))
+            # resample the (rare) targets that landed on their own start
+            same = targets == starts
+            while same.any():
+                targets[same] = self.rng.integers(0, len(self.graph), size=same.sum())
+                same = targets == starts
+
+        self.current[env_ids] = starts
+        self.target[env_ids] = targets
+        self.path[env_ids] = -1
+        self.path[env_ids, 0] = starts
+        self.length[env_ids] = 1
+        self.done[env_ids] = False
+        self.truncated[env_ids] = False
+
+    def reset_done(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the ids of the finished games, which have been restarted with new random articles
+        """
+        env_ids = np.flatnonzero(self.done)
+        if len(env_ids):
+            self.reset(env_ids)
+        return env_ids
+
+    def get_state(self) -> dict:
+        return {'current' : self.current,
+                'target' : self.target,
+                'path' : self.path,
+                'length' : self.length,
+                'done' : self.done,
+                'truncated' : self.truncated}
+
+    def get_actions(self):
+        """
+        Returns:
+            Tuple[np.ndarray,np.ndarray]: the (num_envs, max actions) padded matrix of neighbour ids (-1 as padding)
+                                          and the matching mask, finished games have no actions
+        """
+        degrees = np.where(self.done, 0, self.degrees[self.current])
+        if self.max_actions is not None:
+            degrees = np.minimum(degrees, self.max_actions)
+        width = max(int(degrees.max(initial=0)), 1)
+
+        columns = np.arange(width)
+        mask = columns[None, :] < degrees[:, None]
+        positions = self.offsets[self.current][:, None] + columns[None, :]
+        action_ids = np.where(mask, self.targets[np.where(mask, positions, 0)], -1).astype(np.int32)
+        return action_ids, mask
+
+    def step(self, actions : np.ndarray):
+        """
+        Args:
+            actions (np.ndarray): the (num_envs,) chosen neighbour index of every game (ignored for finished games)
+
+        Returns:
+            Tuple[dict,np.ndarray,np.ndarray]: the new state, the (num_envs,) rewards and the done mask
+        """
+        actions = np.asarray(actions)
+        active = np.flatnonzero(~self.done)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        if len(active) == 0:
+            return self.get_state(), rewards, self.done
+
+        limit = self.degrees[self.current[active]]
+        if self.max_actions is not None:
+            limit = np.minimum(limit, self.max_actions)
+        if np.any((actions[active] < 0) | (actions[active] >= limit)):
+            raise ValueError("action outside of the article's neighbours")
+
+        previous = self.current[active].copy()
+        chosen = self.targets[self.offsets[self.current[active]] + actions[active]]
+        self.current[active] = chosen
+        self.path[active, self.length[active]] = chosen
+        self.length[active] += 1
+
+        reached = chosen == self.target[active]
+        rewards[active] = self.step_loss
+        if self.landmarks is not None:
+            targets = self.target[active]
+            before = self.landmarks.estimates(previous, targets, unreachable=self.landmarks.horizon)
+            after = self.landmarks.estimates(chosen, targets, unreachable=self.landmarks.horizon)
+            rewards[active] += self.distance_scale*(before - after)
+        elif self.embeddings is not None:
+            similarity = np.einsum('ij,ij->i', self.embeddings[chosen], self.embeddings[self.target[active]])
+            rewards[active] += self.step_loss/(1 + np.exp(self.similarity_scale_factor*(similarity - self.similarity_threshold))) - 0.5*self.step_loss
+        rewards[active[reached]] += self.success_reward - self.step_loss
+
+        dead_end = self.degrees[chosen] == 0
+        self.truncated[active] = ~reached & ~dead_end & (self.length[active] > self.max_steps)
+        self.done[active] = reached | dead_end | self.truncated[active]
+        return self.get_state(), rewards, self.done
@@ -0,0 +1,314 @@
+import re                             # regex library
+import html                           # entities in the canonical link
+import sqlite3                        # on disk storage for the redirect map
+from typing import List,Dict,Iterable,Tuple,Optional # just needed for signatures/type hinting
+from urllib.parse import urlsplit, urlunsplit, quote, unquote, parse_qs # needed for canonicalizing urls
+import numpy as np
+
+WIKI_BASE = "https://en.wikipedia.org"
+
+# characters wikipedia leaves unencoded in article paths
+_SAFE_PATH_CHARS = "/:@!$&'()*+,;=-._~"
+# wikis whose titles are case sensitive in the first letter too
+_CASE_SENSITIVE_HOSTS = ("wiktionary.org",)
+_MOBILE_HOST = re.compile(r"\.m\.(wiki[a-z]+\.org)$")
+_CANONICAL_LINK = re.compile(rb'<link rel="canonical" href="([^"]+)"')
+
+############################## Normalization ##############################
+
+def normalize_url(url : str, base : str = WIKI_BASE) -> str:
+    """Given a url (or /wiki/... path) to a wikipedia article will return the normalized form every module keys the
+    article by, that is https, lowercase desktop host, /wiki/Title path (index.php?title= links included), no query or
+    fragment, single underscores instead of whitespace, uppercase first letter and consistent percent encoding.
+    Anything that isn't an article url (no /wiki/ path) is returned as is.
+
+    Args:
+        url (str): the url of the wikipedia page
+        base (str, optional): the scheme and host relative /wiki/ paths are resolved against. Defaults to WIKI_BASE.
+
+    Returns:
+        str: the normalized url of the page
+    """
+    url = url.strip()
+    if url.startswith("/wiki/"):
+        url = base + url
+    parts = urlsplit(url)
+
+    path = unquote(parts.path)
+    if path.endswith("/index.php"):
+        title = parse_qs(parts.query).get("title")
+        if title:
+            path = "/wiki/" + title[0]
+    if not path.startswith("/wiki/"):
+        return url
+
+    host = _MOBILE_HOST.sub(r".\1", parts.netloc.lower())
+    title = " ".join(path[6:].replace("_", " ").split())
+    first = title[:1].upper()
+    if len(first) == 1 and not host.endswith(_CASE_SENSITIVE_HOSTS):
+        title = first + title[1:]
+    path = quote("/wiki/" + title.replace(" ", "_"), safe=_SAFE_PATH_CHARS)
+    return urlunsplit(("https", host, path, "", ""))
+
+def extract_canonical(content : bytes) -> Optional[str]:
+    """Given the bytes of a wikipedia article will return the url of its <link rel="canonical">, which for a page
+    reached through a redirect is the url of the article redirected to, or None if the page doesn't have one.
+
+    Args:
+        content (bytes): the content of the wikipedia page
+
+    Returns:
+        Optional[str]: the canonical url of the page
+    """
+    match = _CANONICAL_LINK.search(content)
+    return html.unescape(match.group(1).decode('utf-8', errors='ignore')) if match else None
+
+############################## Redirects ##############################
+
+class RedirectMap:
+    """Persistent SQLite backed map from redirect urls to the urls they redirect to, learned from the pages fetched
+    (a redirect is answered with the target's page, whose canonical link gives it away) or imported from the SQL
+    dumps. Both sides are stored normalized and chains are followed when resolving, resolved urls are memoized.
+    """
+
+    def __init__(self, path : str = None, max_hops : int = 5, memo_size : int = 100_000):
+        """
+        Args:
+            path (str, optional): the path of the sqlite file. Defaults to None (kept in memory).
+            max_hops (int, optional): the longest redirect chain followed. Defaults to 5.
+            memo_size (int, optional): the number of resolved urls memoized. Defaults to 100_000.
+        """
+        self.path = path
+        self.max_hops = max_hops
+        self.memo_size = memo_size
+        self._memo : Dict[str,str] = {}
+
+        self.connection = sqlite3.connect(path if path is not None else ":memory:", check_same_thread=False)
+        if path is not None:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS redirects (
+                                       source TEXT PRIMARY KEY,
+                                       target TEXT NOT NULL)""")
+        self.connection.commit()
+
+    def _target(self, url : str) -> Optional[str]:
+        row = self.connection.execute("SELECT target FROM redirects WHERE source = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def resolve(self, url : str) -> str:
+        """
+        Args:
+            url (str): a normalized url
+
+        Returns:
+            str: the url of the article it (eventually) redirects to, or url itself if it isn't a known redirect
+        """
+        resolved = self._memo.get(url)
+        if resolved is not None:
+            return resolved
+
+        resolved, visited = url, {url}
+        for _ in range(self.max_hops):
+            target = self._target(resolved)
+            if target is None or target in visited:
+                break
+            resolved = target
+            visited.add(target)
+
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[url] = resolved
+        return resolved
+
+    def add(self, source : str, target : str):
+        self.update([(source, target)])
+
+    def update(self, redirects : Iterable[Tuple[str,str]]):
+        """
+        Args:
+            redirects (Iterable[Tuple[str,str]]): (redirect url, target url) pairs
+        """
+        pairs = [(normalize_url(source), normalize_url(target)) for source, target in redirects]
+        pairs = [(source, target) for source, target in pairs if source != target]
+        if not pairs:
+            return
+        self.connection.executemany("INSERT OR REPLACE INTO redirects VALUES (?, ?)", pairs)
+        self.connection.commit()
+        self._memo.clear()
+
+    def learn(self, url : str, content : bytes) -> str:
+        """Records a redirect when the page fetched for url is another article's (its canonical link points elsewhere
+        on the same wiki).
+
+        Args:
+            url (str): the url that was requested
+            content (bytes): the content of the page received
+
+        Returns:
+            str: the normalized url of the article actually received
+        """
+        source = normalize_url(url)
+        canonical = extract_canonical(content)
+        if canonical is None:
+            return self.resolve(source)
+        target = normalize_url(canonical)
+        if target == source or urlsplit(target).netloc != urlsplit(source).netloc:
+            return self.resolve(source)
+        self.add(source, target)
+        return target
+
+    def import_dump(self, page_path : str, redirect_path : str, base : str = WIKI_BASE, batch_size : int = 100_000) -> int:
+        """Imports every main namespace redirect of the page and redirect SQL dumps (e.g. enwiki-latest-page.sql.gz
+        and enwiki-latest-redirect.sql.gz).
+
+        Args:
+            page_path (str): the page table dump
+            redirect_path (str): the redirect table dump
+            base (str, optional): the scheme and host of the wiki. Defaults to WIKI_BASE.
+            batch_size (int, optional): the number of redirects written per transaction. Defaults to 100_000.
+
+        Returns:
+            int: the number of redirects imported
+        """
+        from dumpIngestion import iter_sql_rows, normalize_title # only needed for dumps
+
+        titles = {row['page_id'] : normalize_title(row['page_title']) for row in iter_sql_rows(page_path)
+                  if row['page_namespace'] == 0 and row['page_is_redirect']}
+        imported = 0
+        batch : List[Tuple[str,str]] = []
+        for row in iter_sql_rows(redirect_path):
+            if row['rd_namespace'] != 0 or row['rd_from'] not in titles or row.get('rd_interwiki'):
+                continue
+            batch.append((f"{base}/wiki/{titles[row['rd_from']]}", f"{base}/wiki/{normalize_title(row['rd_title'])}"))
+            if len(batch) == batch_size:
+                self.update(batch)
+                imported += len(batch)
+                batch = []
+        self.update(batch)
+        return imported + len(batch)
+
+    def __contains__(self, url : str) -> bool:
+        return self._target(normalize_url(url)) is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM redirects").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+############################## Interning ##############################
+
+class UrlInterner:
+    """Global url -> compact int id table. Urls are canonicalized (normalized and redirects resolved) before being
+    interned so every spelling of an article gets the same id, ids are handed out densely in order of first sight.
+    A redirect learned after its url was interned doesn't merge the two ids.
+    """
+
+    def __init__(self, urls : Iterable[str] = (), redirects : RedirectMap = None):
+        """
+        Args:
+            urls (Iterable[str], optional): urls interned up front, in id order. Defaults to ().
+            redirects (RedirectMap, optional): the redirects resolved before interning. Defaults to default_redirects.
+        """
+        self.redirects = redirects
+        self.urls : List[str] = []
+        self.ids : Dict[str,int] = {}
+        for url in urls:
+            self.intern(url)
+
+    @classmethod
+    def from_graph(cls, graph, redirects : RedirectMap = None) -> "UrlInterner":
+        """an interner whose ids are the node ids of a CSRGraph (whose urls are assumed canonical)"""
+        interner = cls(redirects=redirects)
+        interner.urls = list(graph.urls)
+        interner.ids = {url : i for i, url in enumerate(interner.urls)}
+        return interner
+
+    def canonical(self, url : str) -> str:
+        redirects = self.redirects if self.redirects is not None else default_redirects
+        return redirects.resolve(normalize_url(url))
+
+    def intern(self, url : str) -> int:
+        """
+        Returns:
+            int: the id of the url, assigning the next one if it wasn't interned yet
+        """
+        node = self.ids.get(url)
+        if node is not None:
+            return node
+        canonical = self.canonical(url)
+        node = self.ids.get(canonical)
+        if node is None:
+            node = self.ids[canonical] = len(self.urls)
+            self.urls.append(canonical)
+        return node
+
+    def intern_many(self, urls : Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.intern(url) for url in urls), dtype=np.int32)
+
+    def get(self, url : str, default : int = -1) -> int:
+        """the id of the url without interning it"""
+        node = self.ids.get(url)
+        return node if node is not None else self.ids.get(self.canonical(url), default)
+
+    def url(self, node : int) -> str:
+        return self.urls[node]
+
+    def __contains__(self, url : str) -> bool:
+        return self.get(url) != -1
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def save(self, path : str):
+        """writes the urls one per line in id order (the urls.txt format of CSRGraph)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(url + "\n" for url in self.urls)
+
+    @classmethod
+    def load(cls, path : str, redirects : RedirectMap = None) -> "UrlInterner":
+        interner = cls(redirects=redirects)
+        with open(path, 'r', encoding='utf-8') as f:
+            interner.urls = f.read().splitlines()
+        interner.ids = {url : i for i, url in enumerate(interner.urls)}
+        return interner
+
+############################## Defaults ##############################
+
+# redirects resolved by canonicalize (and so by every fetcher, graph and search), in memory unless use_redirects is called
+default_redirects : RedirectMap = RedirectMap()
+# ids shared by the graphs built with CSRGraph.from_edges(..., interner=default_interner), the live searches intern
+# into a table of their own so that this one only grows with the graphs
+default_interner : UrlInterner = UrlInterner()
+
+def use_redirects(path : str = "wikiRedirects.sqlite", **kwargs) -> RedirectMap:
+    """Opens (or creates) the on disk redirect map at the given path and makes it the default one.
+
+    Args:
+        path (str, optional): the path of the sqlite file. Defaults to "wikiRedirects.sqlite".
+        **kwargs: passed through to RedirectMap (max_hops, memo_size)
+
+    Returns:
+        RedirectMap: the redirect map now in use
+    """
+    global default_redirects
+    default_redirects = RedirectMap(path, **kwargs)
+    return default_redirects
+
+def canonicalize(url : str) -> str:
+    """
+    Returns:
+        str: the normalized url of the article url points to, known redirects resolved
+    """
+    return default_redirects.resolve(normalize_url(url))
+
+def canonical_links(urls : Iterable[str]) -> set:
+    return {canonicalize(url) for url in urls}
+
+def article_id(url : str) -> int:
+    """the id of the article in the default interner"""
+    return default_interner.intern(url)
+
+def learn_redirect(url : str, content : bytes) -> str:
+    """records url as a redirect in the default map if the page fetched for it is another article's, see RedirectMap.learn"""
+    return default_redirects.learn(url, content)
@@ -0,0 +1,236 @@
+import os                                     # graph directory handling
+import sys                                    # command line converter
+import pickle                                 # reads the old pickled graphs
+from array import array                       # compact growable id buffers
+from typing import List,Dict,Iterable,Iterator,Tuple # just needed for signatures/type hinting
+import numpy as np
+
+from canonicalUrls import canonicalize        # other spellings of the node urls
+
+class CSRGraph:
+    """Compact integer indexed directed graph. Every article url is interned to an int32 id (its position in the
+    url table) and the edges are kept in compressed sparse row form, the out neighbours of node i are
+    targets[offsets[i]:offsets[i+1]], with a second (reverse) CSR holding the backlinks. The arrays are saved as
+    .npy files so they can be memory mapped instead of unpickled.
+
+    Besides the id level functions, the url level has_node/nodes/neighbors/successors/predecessors/out_degree
+    mirror nx.DiGraph so it can be used anywhere a loaded networkx graph is. A url that isn't one of the node urls is
+    looked up again in canonical form (see canonicalUrls), so other spellings and known redirects find their node.
+    """
+
+    def __init__(self,
+                 urls : List[str],
+                 offsets : np.ndarray,
+                 targets : np.ndarray,
+                 rev_offsets : np.ndarray = None,
+                 rev_targets : np.ndarray = None):
+        self.urls = urls
+        self.offsets = offsets
+        self.targets = targets
+        self._ids : Dict[str,int] = None
+
+        if rev_offsets is None or rev_targets is None:
+            rev_offsets, rev_targets = _reverse(offsets, targets, len(offsets) - 1)
+        self.rev_offsets = rev_offsets
+        self.rev_targets = rev_targets
+
+    ############################## Construction ##############################
+
+    @classmethod
+    def from_edges(cls, adjacency : Iterable[Tuple[str,Iterable[str]]], interner = None) -> "CSRGraph":
+        """Builds the graph from (page, linked pages) pairs, like the ones given by StreamingCrawler.iter_edges,
+        without ever holding more than the id buffers in memory.
+
+        Args:
+            adjacency (Iterable[Tuple[str,Iterable[str]]]): every page along with the pages it links to
+            interner (UrlInterner, optional): gives the node ids (e.g. canonicalUrls.default_interner), so that they are
+                                              the same across graphs and searches. Every url interned so far becomes a
+                                              node. Defaults to None (ids local to the graph, urls taken as they are).
+
+        Returns:
+            CSRGraph: the graph
+        """
+        urls : List[str] = []
+        ids : Dict[str,int] = {}
+
+        def intern(url):
+            node = ids.get(url)
+            if node is None:
+                node = ids[url] = len(urls)
+                urls.append(url)
+            return node
+
+        if interner is not None:
+            intern = interner.intern
+
+        sources, targets = array('i'), array('i')
+        for source, links in adjacency:
+            source_id = intern(source)
+            for link in links:
+                sources.append(source_id)
+                targets.append(intern(link))
+
+        if interner is not None:
+            urls, ids = list(interner.urls), dict(interner.ids)
+        graph = cls._from_id_edges(urls, np.frombuffer(sources, dtype=np.int32), np.frombuffer(targets, dtype=np.int32))
+        graph._ids = ids
+        return graph
+
+    @classmethod
+    def from_networkx(cls, G) -> "CSRGraph":
+        """
+        Args:
+            G (nx.DiGraph): a graph with url node keys
+
+        Returns:
+            CSRGraph: the same graph in CSR form, node ids follow G's node order
+        """
+        urls = list(G.nodes)
+        ids = {url : i for i, url in enumerate(urls)}
+        degrees = np.fromiter((G.out_degree(url) for url in urls), dtype=np.int64, count=len(urls))
+        offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=offsets[1:])
+        targets = np.fromiter((ids[adj] for url in urls for adj in G.successors(url)), dtype=np.int32, count=offsets[-1])
+
+        graph = cls(urls, offsets, targets)
+        graph._ids = ids
+        return graph
+
+    @classmethod
+    def from_pickle(cls, path : str) -> "CSRGraph":
+        """Converts one of the pickled networkx graphs (e.g. graphs/CountryGraphL2.pickle).
+
+        Args:
+            path (str): the path of the pickle
+
+        Returns:
+            CSRGraph: the graph
+        """
+        with open(path, 'rb') as f:
+            return cls.from_networkx(pickle.load(f))
+
+    @classmethod
+    def _from_id_edges(cls, urls : List[str], sources : np.ndarray, targets : np.ndarray) -> "CSRGraph":
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(urls)), out=offsets[1:])
+        return cls(urls, offsets, np.ascontiguousarray(targets[order], dtype=np.int32))
+
+    ############################## Storage ##############################
+
+    def save(self, directory : str):
+        """Writes the url table and the (forward and reverse) CSR arrays to a directory.
+
+        Args:
+            directory (str): where the graph is saved
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "urls.txt"), 'w', encoding='utf-8') as f:
+            f.writelines(url + "\n" for url in self.urls)
+        np.save(os.path.join(directory, "offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(directory, "targets.npy"), np.asarray(self.targets, dtype=np.int32))
+        np.save(os.path.join(directory, "rev_offsets.npy"), np.asarray(self.rev_offsets, dtype=np.int64))
+        np.save(os.path.join(directory, "rev_targets.npy"), np.asarray(self.rev_targets, dtype=np.int32))
+
+    @classmethod
+    def load(cls, directory : str, mmap : bool = True, load_urls : bool = True) -> "CSRGraph":
+        """
+        Args:
+            directory (str): where the graph was saved
+            mmap (bool, optional): memory maps the arrays (read only) instead of reading them. Defaults to True.
+            load_urls (bool, optional): if False the url table isn't read and only the id level functions
+                                        work (e.g. for rollout workers that never see a url). Defaults to True.
+
+        Returns:
+            CSRGraph: the graph
+        """
+        mode = 'r' if mmap else None
+        urls = None
+        if load_urls:
+            with open(os.path.join(directory, "urls.txt"), 'r', encoding='utf-8') as f:
+                urls = f.read().splitlines()
+        return cls(urls,
+                   np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mode),
+                   np.load(os.path.join(directory, "targets.npy"), mmap_mode=mode),
+                   np.load(os.path.join(directory, "rev_offsets.npy"), mmap_mode=mode),
+                   np.load(os.path.join(directory, "rev_targets.npy"), mmap_mode=mode))
+
+    ############################## Id Level Access ##############################
+
+    @property
+    def ids(self) -> Dict[str,int]:
+        """the url -> id table, built on first use"""
+        if self._ids is None:
+            self._ids = {url : i for i, url in enumerate(self.urls)}
+        return self._ids
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def id(self, url : str) -> int:
+        node = self.ids.get(url)
+        return node if node is not None else self.ids[canonicalize(url)]
+
+    def url(self, node : int) -> str:
+        return self.urls[node]
+
+    def out_neighbors(self, node : int) -> np.ndarray:
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def in_neighbors(self, node : int) -> np.ndarray:
+        return self.rev_targets[self.rev_offsets[node]:self.rev_offsets[node + 1]]
+
+    def out_degrees(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def in_degrees(self) -> np.ndarray:
+        return np.diff(self.rev_offsets)
+
+    ############################## Url Level Access (mirrors nx.DiGraph) ##############################
+
+    @property
+    def nodes(self) -> List[str]:
+        return self.urls
+
+    def has_node(self, url : str) -> bool:
+        return url in self.ids or canonicalize(url) in self.ids
+
+    def successors(self, url : str) -> Iterator[str]:
+        return (self.urls[adj] for adj in self.out_neighbors(self.id(url)).tolist())
+
+    def predecessors(self, url : str) -> Iterator[str]:
+        return (self.urls[adj] for adj in self.in_neighbors(self.id(url)).tolist())
+
+    def neighbors(self, url : str) -> Iterator[str]:
+        return self.successors(url)
+
+    def out_degree(self, url : str) -> int:
+        node = self.id(url)
+        return int(self.offsets[node + 1] - self.offsets[node])
+
+    def in_degree(self, url : str) -> int:
+        node = self.id(url)
+        return int(self.rev_offsets[node + 1] - self.rev_offsets[node])
+
+    @property
+    def edges(self) -> Iterator[Tuple[str,str]]:
+        return ((url, adj) for url in self.urls for adj in self.successors(url))
+
+    def number_of_edges(self) -> int:
+        return int(self.offsets[-1])
+
+def _reverse(offsets : np.ndarray, targets : np.ndarray, num_nodes : int) -> Tuple[np.ndarray,np.ndarray]:
+    """builds the reverse (backlink) CSR of a forward CSR"""
+    sources = np.repeat(np.arange(num_nodes, dtype=np.int32), np.diff(offsets))
+    order = np.argsort(targets, kind='stable')
+    rev_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=num_nodes), out=rev_offsets[1:])
+    return rev_offsets, np.ascontiguousarray(sources[order], dtype=np.int32)
+
+# converts the old pickled graphs, e.g.
+# python src/csrGraph.py "src/RL agent/graphs/CountryGraphL2.pickle" "src/RL agent/graphs/CountryGraphL2"
+if __name__ == "__main__":
+    pickle_path, output_directory = sys.argv[1], sys.argv[2]
+    graph = CSRGraph.from_pickle(pickle_path)
+    graph.save(output_directory)
+    print(f"saved {len(graph)} nodes and {graph.number_of_edges()} edges to {output_directory}")
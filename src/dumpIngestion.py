@@ -0,0 +1,567 @@
+import os                                     # work/graph directory handling
+import re                                     # regex library
+import sys                                    # command line ingestion
+import bz2                                    # the dumps are distributed compressed
+import gzip
+import html                                   # entities in the xml titles
+import argparse                               # command line options
+import multiprocessing as mp                  # parses the dump chunks in parallel
+import xml.etree.ElementTree as ET            # streams the xml dumps
+from typing import Dict,List,Tuple,Iterator,Iterable,Callable,Optional,BinaryIO # just needed for signatures/type hinting
+import numpy as np
+
+from wikiLinkRetrieval import title_to_url
+
+# Builds a CSRGraph directory (see csrGraph.py) of the article link graph straight from a local Wikipedia dump,
+# either the SQL table dumps (page + pagelinks + redirect, and linktarget for the 2024+ pagelinks schema) or the
+# pages-articles XML dump. The dumps are streamed (compressed or not) and never held in memory, only the title table
+# and the id arrays are. Parsing is spread over worker processes by chunks of INSERT statements / pages, the resolved
+# (source, target) id pairs are spilled to disk and the CSR arrays are built from the spill in fixed size blocks
+# through memory mapped files, so the edges never have to fit in memory either.
+
+############################## Titles ##############################
+
+def normalize_title(title : str) -> str:
+    """Normalizes a link target or page title the way MediaWiki does for the main namespace: underscores, collapsed
+    whitespace, no leading colon and an uppercase first letter.
+
+    Args:
+        title (str): a title as written in the dump or in a [[link]]
+
+    Returns:
+        str: the normalized title, with underscores
+    """
+    title = " ".join(title.replace("_", " ").split()).lstrip(":").strip()
+    return (title[:1].upper() + title[1:]).replace(" ", "_")
+
+def open_dump(path : str) -> BinaryIO:
+    """opens a dump for binary reading, decompressing .bz2 and .gz files on the fly"""
+    if path.endswith(".bz2"):
+        return bz2.open(path, 'rb')
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+############################## SQL Dumps ##############################
+
+_CREATE_TABLE = re.compile(rb"^CREATE TABLE `(\w+)`")
+_COLUMN = re.compile(rb"^\s+`(\w+)`\s")
+_INSERT = b"INSERT INTO `"
+# one parenthesised row, strings may contain anything escaped
+_ROW = re.compile(rb"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)", re.DOTALL)
+_VALUE = re.compile(rb"'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+)", re.DOTALL)
+_ESCAPE = re.compile(rb"\\(.)", re.DOTALL)
+_ESCAPES = {b"n" : b"\n", b"r" : b"\r", b"t" : b"\t", b"0" : b"\0", b"Z" : b"\x1a"}
+
+def _unescape(value : bytes) -> str:
+    return _ESCAPE.sub(lambda match: _ESCAPES.get(match.group(1), match.group(1)), value).decode('utf-8', errors='replace')
+
+def parse_rows(statement : bytes) -> Iterator[tuple]:
+    """
+    Args:
+        statement (bytes): one INSERT INTO ... VALUES (...),(...); line of a SQL dump
+
+    Yields:
+        tuple: the values of every row, ints and strs (None for NULL)
+    """
+    values_start = statement.find(b" VALUES ")
+    for row in _ROW.finditer(statement, values_start):
+        values = []
+        for string, null, number in _VALUE.findall(row.group(1)):
+            if null:
+                values.append(None)
+            elif number:
+                values.append(int(number) if number.lstrip(b"-+").isdigit() else float(number))
+            else:
+                values.append(_unescape(string))
+        yield tuple(values)
+
+def sql_statements(path : str) -> Tuple[List[str],Iterator[bytes]]:
+    """Reads the CREATE TABLE header of a table dump and gives its column names along with the INSERT statements.
+
+    Args:
+        path (str): the path of the table dump
+
+    Raises:
+        ValueError: if the dump has no CREATE TABLE statement
+
+    Returns:
+        Tuple[List[str],Iterator[bytes]]: the column names in order and an iterator over the INSERT lines
+    """
+    f = open_dump(path)
+    columns = []
+    in_table = False
+    for line in f:
+        if _CREATE_TABLE.match(line):
+            in_table = True
+            continue
+        if in_table:
+            column = _COLUMN.match(line)
+            if column:
+                columns.append(column.group(1).decode())
+            elif line.startswith(b")"):
+                break
+    if not columns:
+        f.close()
+        raise ValueError(f"{path} has no CREATE TABLE statement")
+
+    def statements():
+        with f:
+            for line in f:
+                if line.startswith(_INSERT):
+                    yield line
+    return columns, statements()
+
+def iter_sql_rows(path : str) -> Iterator[Dict[str,object]]:
+    """
+    Args:
+        path (str): the path of a table dump
+
+    Yields:
+        Dict[str,object]: every row of the table keyed by column name
+    """
+    columns, statements = sql_statements(path)
+    for statement in statements:
+        for row in parse_rows(statement):
+            yield dict(zip(columns, row))
+
+############################## Worker State ##############################
+
+# read only lookup tables of the ingestion, set in the parent before the worker pool is forked so that the
+# workers share them instead of receiving a copy with every chunk
+_tables : Dict[str,object] = {}
+
+def _pool(workers : int):
+    """a forked pool sharing _tables, or None (parse in this process) for one worker or where fork isn't available"""
+    if workers <= 1 or "fork" not in mp.get_all_start_methods():
+        return None
+    return mp.get_context("fork").Pool(workers)
+
+def _map(pool, function : Callable, chunks : Iterable) -> Iterator:
+    return pool.imap(function, chunks) if pool is not None else map(function, chunks)
+
+def _resolve(title : str) -> int:
+    """the node id of an article title or of the article a redirect title points to, -1 for missing pages"""
+    return _tables['title_to_node'].get(title, -1)
+
+def _pack(sources : List[int], targets : List[int]) -> bytes:
+    pairs = np.empty((len(sources), 2), dtype=np.int32)
+    pairs[:, 0] = sources
+    pairs[:, 1] = targets
+    return pairs[pairs[:, 1] >= 0].tobytes()
+
+def _pagelinks_chunk(statement : bytes) -> bytes:
+    """the (source, target) node id pairs of one INSERT statement of the pagelinks table"""
+    columns, page_to_node = _tables['pagelinks_columns'], _tables['page_to_node']
+    from_index = columns.index('pl_from')
+    from_namespace = columns.index('pl_from_namespace') if 'pl_from_namespace' in columns else None
+    target_index = columns.index('pl_target_id') if 'pl_target_id' in columns else None
+
+    sources, targets = [], []
+    for row in parse_rows(statement):
+        if from_namespace is not None and row[from_namespace] != 0:
+            continue
+        page = row[from_index]
+        source = page_to_node[page] if page < len(page_to_node) else -1
+        if source < 0:
+            continue
+        if target_index is not None:
+            # 2024+ schema, the target is an id into the linktarget table
+            target = _tables['linktarget_to_node'].get(row[target_index], -1)
+        elif row[columns.index('pl_namespace')] == 0:
+            target = _resolve(normalize_title(row[columns.index('pl_title')]))
+        else:
+            continue
+        sources.append(source)
+        targets.append(target)
+    return _pack(sources, targets)
+
+def _linktarget_chunk(statement : bytes) -> List[Tuple[int,int]]:
+    """the (linktarget id, node id) pairs of one INSERT statement of the linktarget table"""
+    columns = _tables['linktarget_columns']
+    id_index, namespace_index, title_index = columns.index('lt_id'), columns.index('lt_namespace'), columns.index('lt_title')
+    resolved = []
+    for row in parse_rows(statement):
+        if row[namespace_index] == 0:
+            node = _resolve(normalize_title(row[title_index]))
+            if node >= 0:
+                resolved.append((row[id_index], node))
+    return resolved
+
+############################## Redirects ##############################
+
+def resolve_redirects(title_to_node : Dict[str,int], redirects : Dict[str,str], max_hops : int = 5) -> int:
+    """Adds every redirect title to the title table, pointing at the node of the article it (eventually) redirects to.
+    Chains are followed for up to max_hops redirects, redirects to missing pages or loops are dropped.
+
+    Args:
+        title_to_node (Dict[str,int]): the article title -> node id table, extended in place
+        redirects (Dict[str,str]): redirect title -> target title
+        max_hops (int, optional): the longest redirect chain followed. Defaults to 5.
+
+    Returns:
+        int: the number of redirects resolved
+    """
+    resolved = {}
+    for title, target in redirects.items():
+        for _ in range(max_hops):
+            if target in title_to_node:
+                resolved[title] = title_to_node[target]
+                break
+            target = redirects.get(target)
+            if target is None:
+                break
+    for title, node in resolved.items():
+        title_to_node.setdefault(title, node)
+    return len(resolved)
+
+############################## CSR From Disk ##############################
+
+class EdgeSpill:
+    """Append only file of (source, target) int32 node id pairs."""
+
+    def __init__(self, path : str):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.edges = 0
+
+    def write(self, pairs : bytes):
+        self.file.write(pairs)
+        self.edges += len(pairs) // 8
+
+    def close(self):
+        self.file.close()
+
+    def blocks(self, block_edges : int) -> Iterator[Tuple[np.ndarray,np.ndarray]]:
+        if self.edges == 0:
+            return
+        pairs = np.memmap(self.path, dtype=np.int32, mode='r').reshape(-1, 2)
+        for start in range(0, len(pairs), block_edges):
+            block = np.asarray(pairs[start:start + block_edges])
+            yield block[:, 0], block[:, 1]
+
+def write_csr(num_nodes : int,
+              edge_blocks : Callable[[],Iterator[Tuple[np.ndarray,np.ndarray]]],
+              directory : str,
+              prefix : str = "",
+              dedupe : bool = True,
+              block_nodes : int = 1 << 20) -> int:
+    """Writes the CSR arrays (prefix + offsets.npy / targets.npy) of the edges given in blocks, holding at most one
+    block of edges (plus the per node counts) in memory. A first pass counts the degrees, a second scatters every block
+    into a memory mapped targets array and, with dedupe, a last pass over blocks of rows sorts each row and drops the
+    repeated edges and self links.
+
+    Args:
+        num_nodes (int): the number of nodes
+        edge_blocks (Callable[[],Iterator[Tuple[np.ndarray,np.ndarray]]]): gives a fresh iterator over the
+                                                                          (sources, targets) blocks, called twice
+        directory (str): the graph directory
+        prefix (str, optional): "rev_" for the reverse CSR. Defaults to "".
+        dedupe (bool, optional): removes repeated edges and self links. Defaults to True.
+        block_nodes (int, optional): the number of rows deduplicated at once. Defaults to 1 << 20.
+
+    Returns:
+        int: the number of edges written
+    """
+    degrees = np.zeros(num_nodes, dtype=np.int64)
+    for sources, _ in edge_blocks():
+        degrees += np.bincount(sources, minlength=num_nodes)
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(degrees, out=offsets[1:])
+
+    raw_path = os.path.join(directory, f"{prefix}targets.raw")
+    raw = np.memmap(raw_path, dtype=np.int32, mode='w+', shape=(max(int(offsets[-1]), 1),))
+    fill = offsets[:-1].copy()
+    for sources, targets in edge_blocks():
+        order = np.argsort(sources, kind='stable')
+        sources, targets = sources[order], targets[order]
+        nodes, starts, counts = np.unique(sources, return_index=True, return_counts=True)
+        rank = np.arange(len(sources)) - np.repeat(starts, counts)
+        raw[fill[sources] + rank] = targets
+        fill[nodes] += counts
+    raw.flush()
+
+    if dedupe:
+        new_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        written = 0
+        for first in range(0, num_nodes, block_nodes):
+            last = min(first + block_nodes, num_nodes)
+            segment = np.array(raw[offsets[first]:offsets[last]])
+            rows = np.repeat(np.arange(first, last, dtype=np.int64), degrees[first:last])
+            order = np.lexsort((segment, rows))
+            rows, segment = rows[order], segment[order]
+            keep = rows != segment
+            keep[1:] &= (rows[1:] != rows[:-1]) | (segment[1:] != segment[:-1])
+            kept = segment[keep]
+            # the compacted rows never overtake the rows still to be read
+            raw[written:written + len(kept)] = kept
+            written += len(kept)
+            new_offsets[first + 1:last + 1] = np.bincount(rows[keep] - first, minlength=last - first)
+        np.cumsum(new_offsets, out=new_offsets)
+        offsets = new_offsets
+        raw.flush()
+
+    total = int(offsets[-1])
+    np.save(os.path.join(directory, f"{prefix}offsets.npy"), offsets)
+    targets_out = np.lib.format.open_memmap(os.path.join(directory, f"{prefix}targets.npy"), mode='w+', dtype=np.int32, shape=(total,))
+    for start in range(0, total, 1 << 24):
+        end = min(start + (1 << 24), total)
+        targets_out[start:end] = raw[start:end]
+    targets_out.flush()
+    del raw, targets_out
+    os.remove(raw_path)
+    return total
+
+def write_graph(titles : List[str], spill : EdgeSpill, directory : str, block_edges : int = 1 << 24) -> int:
+    """Writes a CSRGraph directory (urls.txt and the forward and reverse CSR arrays) from spilled edges.
+
+    Returns:
+        int: the number of (distinct) edges
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "urls.txt"), 'w', encoding='utf-8') as f:
+        f.writelines(title_to_url(title) + "\n" for title in titles)
+
+    num_nodes = len(titles)
+    edges = write_csr(num_nodes, lambda: spill.blocks(block_edges), directory)
+
+    # the reverse CSR is built from blocks of the (already deduplicated) forward one
+    def reverse_blocks():
+        offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode='r')
+        targets = np.load(os.path.join(directory, "targets.npy"), mmap_mode='r')
+        degrees = np.diff(offsets)
+        for start in range(0, edges, block_edges):
+            end = min(start + block_edges, edges)
+            first = int(np.searchsorted(offsets, start, side='right')) - 1
+            last = int(np.searchsorted(offsets, end, side='left'))
+            sources = np.repeat(np.arange(first, last, dtype=np.int32), degrees[first:last])
+            sources = sources[start - offsets[first]:end - offsets[first]]
+            yield np.asarray(targets[start:end]), sources
+    write_csr(num_nodes, reverse_blocks, directory, prefix="rev_", dedupe=False)
+    return edges
+
+############################## Ingestion ##############################
+
+def ingest_sql(page_path : str,
+               pagelinks_path : str,
+               redirect_path : str,
+               directory : str,
+               linktarget_path : str = None,
+               workers : int = None,
+               block_edges : int = 1 << 24) -> Dict[str,int]:
+    """Builds the article graph from the SQL table dumps, e.g. enwiki-latest-page.sql.gz,
+    enwiki-latest-pagelinks.sql.gz, enwiki-latest-redirect.sql.gz (and enwiki-latest-linktarget.sql.gz for dumps using
+    the pl_target_id pagelinks schema). The nodes are the main namespace pages that aren't redirects, links to
+    redirects are resolved to the article they point to and links to missing pages are dropped.
+
+    Args:
+        page_path (str): the page table dump
+        pagelinks_path (str): the pagelinks table dump
+        redirect_path (str): the redirect table dump
+        directory (str): where the CSRGraph is written
+        linktarget_path (str, optional): the linktarget table dump, needed for the pl_target_id schema. Defaults to None.
+        workers (int, optional): the number of parsing processes. Defaults to the number of cpus.
+        block_edges (int, optional): the number of edges handled at once when building the CSR. Defaults to 1 << 24.
+
+    Raises:
+        ValueError: if the pagelinks dump uses the linktarget schema and no linktarget dump is given
+
+    Returns:
+        Dict[str,int]: the number of articles, resolved redirects and edges
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(directory, exist_ok=True)
+
+    # articles get dense ids in page table order, page ids are mapped through a growable array
+    titles : List[str] = []
+    title_to_node : Dict[str,int] = {}
+    page_to_node = np.full(1 << 16, -1, dtype=np.int32)
+    redirect_pages : Dict[int,str] = {}
+    for row in iter_sql_rows(page_path):
+        if row['page_namespace'] != 0:
+            continue
+        page, title = row['page_id'], normalize_title(row['page_title'])
+        if row['page_is_redirect']:
+            redirect_pages[page] = title
+            continue
+        if page >= len(page_to_node):
+            grown = np.full(max(2 * len(page_to_node), page + 1), -1, dtype=np.int32)
+            grown[:len(page_to_node)] = page_to_node
+            page_to_node = grown
+        page_to_node[page] = len(titles)
+        title_to_node[title] = len(titles)
+        titles.append(title)
+
+    redirects = {redirect_pages[row['rd_from']] : normalize_title(row['rd_title'])
+                 for row in iter_sql_rows(redirect_path)
+                 if row['rd_namespace'] == 0 and row['rd_from'] in redirect_pages and not row.get('rd_interwiki')}
+    resolved = resolve_redirects(title_to_node, redirects)
+    del redirect_pages, redirects
+
+    columns, statements = sql_statements(pagelinks_path)
+    _tables.clear()
+    _tables.update(title_to_node=title_to_node, page_to_node=page_to_node, pagelinks_columns=columns)
+
+    if 'pl_target_id' in columns:
+        if linktarget_path is None:
+            raise ValueError(f"{pagelinks_path} links through pl_target_id, the linktarget dump is needed")
+        linktarget_columns, linktarget_statements = sql_statements(linktarget_path)
+        _tables['linktarget_columns'] = linktarget_columns
+        linktarget_to_node : Dict[int,int] = {}
+        pool = _pool(workers)
+        try:
+            for pairs in _map(pool, _linktarget_chunk, linktarget_statements):
+                linktarget_to_node.update(pairs)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        _tables['linktarget_to_node'] = linktarget_to_node
+
+    spill = EdgeSpill(os.path.join(directory, "edges.spill"))
+    pool = _pool(workers)
+    try:
+        for pairs in _map(pool, _pagelinks_chunk, statements):
+            spill.write(pairs)
+    finally:
+        spill.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _tables.clear()
+
+    edges = write_graph(titles, spill, directory, block_edges)
+    os.remove(spill.path)
+    return {'articles' : len(titles), 'redirects' : resolved, 'edges' : edges}
+
+# [[target]], [[target|label]], [[target#section|label]], the target can't contain brackets, pipes or braces
+_WIKILINK = re.compile(r"\[\[([^\[\]|#{}<>]*)(?:#[^\[\]|]*)?(?:\|[^\[\]]*)?\]\]")
+
+def _local(tag : str) -> str:
+    """the tag name without the export schema namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+def iter_xml_pages(path : str) -> Iterator[Tuple[str,int,Optional[str],str]]:
+    """
+    Args:
+        path (str): a pages-articles xml dump
+
+    Yields:
+        Tuple[str,int,Optional[str],str]: the title, namespace, redirect target (or None) and wikitext of every page
+    """
+    with open_dump(path) as f:
+        title, namespace, redirect, text = None, None, None, ""
+        root = None
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            tag = _local(element.tag)
+            if tag == "title":
+                title = element.text or ""
+            elif tag == "ns":
+                namespace = int(element.text)
+            elif tag == "redirect":
+                redirect = element.get("title")
+            elif tag == "text":
+                text = element.text or ""
+            elif tag == "page":
+                yield title, namespace, redirect, text
+                title, namespace, redirect, text = None, None, None, ""
+                # detaches the finished pages from the root (clearing the page alone would leave an empty element
+                # behind for every page of the dump)
+                root.clear()
+
+def _xml_chunk(pages : List[Tuple[int,str]]) -> bytes:
+    """the (source, target) node id pairs of a batch of (node id, wikitext) pages"""
+    sources, targets = [], []
+    for node, text in pages:
+        for target in _WIKILINK.findall(text):
+            if target.strip():
+                sources.append(node)
+                targets.append(_resolve(normalize_title(html.unescape(target))))
+    return _pack(sources, targets)
+
+def ingest_xml(path : str, directory : str, workers : int = None, batch_size : int = 1000, block_edges : int = 1 << 24) -> Dict[str,int]:
+    """Builds the article graph from a pages-articles XML dump (e.g. enwiki-latest-pages-articles.xml.bz2) with two
+    streaming passes, the first collects the titles and redirects and the second extracts the [[links]] of the
+    wikitext in batches of pages spread over the workers. Links only count when they resolve to an article, which
+    also drops the namespaced ones (File:, Category:...) and interwiki links. Links coming from templates (navboxes,
+    infoboxes...) aren't expanded so, unlike the SQL pagelinks, only the links written in the article are kept.
+
+    Args:
+        path (str): the xml dump
+        directory (str): where the CSRGraph is written
+        workers (int, optional): the number of parsing processes. Defaults to the number of cpus.
+        batch_size (int, optional): the number of pages per parsing task. Defaults to 1000.
+        block_edges (int, optional): the number of edges handled at once when building the CSR. Defaults to 1 << 24.
+
+    Returns:
+        Dict[str,int]: the number of articles, resolved redirects and edges
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(directory, exist_ok=True)
+
+    titles : List[str] = []
+    title_to_node : Dict[str,int] = {}
+    redirects : Dict[str,str] = {}
+    for title, namespace, redirect, _ in iter_xml_pages(path):
+        if namespace != 0:
+            continue
+        title = normalize_title(title)
+        if redirect is not None:
+            redirects[title] = normalize_title(redirect)
+        elif title not in title_to_node:
+            title_to_node[title] = len(titles)
+            titles.append(title)
+    resolved = resolve_redirects(title_to_node, redirects)
+    del redirects
+
+    def batches():
+        batch = []
+        for title, namespace, redirect, text in iter_xml_pages(path):
+            if namespace == 0 and redirect is None:
+                batch.append((title_to_node[normalize_title(title)], text))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    _tables.clear()
+    _tables['title_to_node'] = title_to_node
+    spill = EdgeSpill(os.path.join(directory, "edges.spill"))
+    pool = _pool(workers)
+    try:
+        for pairs in _map(pool, _xml_chunk, batches()):
+            spill.write(pairs)
+    finally:
+        spill.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _tables.clear()
+
+    edges = write_graph(titles, spill, directory, block_edges)
+    os.remove(spill.path)
+    return {'articles' : len(titles), 'redirects' : resolved, 'edges' : edges}
+
+# e.g.
+# python src/dumpIngestion.py sql graphs/enwiki enwiki-latest-page.sql.gz enwiki-latest-pagelinks.sql.gz enwiki-latest-redirect.sql.gz --linktarget enwiki-latest-linktarget.sql.gz
+# python src/dumpIngestion.py xml graphs/enwiki enwiki-latest-pages-articles.xml.bz2
+# the graph is then loaded with CSRGraph.load("graphs/enwiki")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="builds a CSRGraph of the article links of a wikipedia dump")
+    parser.add_argument("format", choices=["sql", "xml"])
+    parser.add_argument("directory", help="where the graph is written")
+    parser.add_argument("dumps", nargs="+", help="sql: the page, pagelinks and redirect dumps, xml: the pages-articles dump")
+    parser.add_argument("--linktarget", default=None, help="the linktarget dump (sql, pl_target_id schema)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.format == "sql":
+        stats = ingest_sql(*args.dumps, args.directory, linktarget_path=args.linktarget, workers=args.workers)
+    else:
+        stats = ingest_xml(args.dumps[0], args.directory, workers=args.workers)
+    print(f"wrote {stats['articles']} articles, {stats['edges']} links ({stats['redirects']} redirects resolved) to {args.directory}")
@@ -0,0 +1,427 @@
+import os                                     # index directory handling
+import sys                                    # command line builder
+import sqlite3                                # on disk store of the encoder cache
+from collections import OrderedDict           # in memory lru of the encoder cache
+from typing import List,Dict,Tuple,Iterable,Callable,Optional # just needed for signatures/type hinting
+import numpy as np
+from gensim.models import KeyedVectors
+from wikiLinkRetrieval import clean_wiki_link
+
+def phrase_to_vec(phrase: str, model: KeyedVectors, ) -> np.ndarray:
+    """Given a string and a KeyedVectors model will attempt to find the phrase vector in the model
+    and if it can't will average the available vectors from the words that make up the phrase. Will return
+    the zero vector if none of the words inside of the phrase exist in the model and thus no average can be made.
+
+    Args:
+        phrase (str): the phrase being searched
+        model (KeyedVectors): the vector embedding model
+
+    Returns:
+        np.ndarray: the final phrase vector being output
+    """
+    indices = _phrase_indices(phrase, model.key_to_index)
+    if not indices:
+        return np.zeros(model.vector_size, dtype=np.float32)
+    return model.vectors[indices].mean(axis=0)
+
+def _phrase_indices(phrase : str, key_to_index : Dict[str,int]) -> List[int]:
+    """the rows of the model making up the phrase, the phrase itself if the model has it, otherwise every
+    fragment (word) of the phrase the model has, as is or lowercased"""
+    index = key_to_index.get(phrase)
+    if index is not None:
+        return [index]
+
+    indices = []
+    for piece in phrase.replace("_"," ").split(" "):
+        index = key_to_index.get(piece)
+        if index is None:
+            index = key_to_index.get(piece.lower())
+        if index is not None:
+            indices.append(index)
+    return indices
+
+class PhraseEmbedder:
+    """Memoized phrase_to_vec. Results are kept in a bounded LRU so the titles the searches and the environment
+    keep asking for are only embedded once, and embed_many embeds a whole batch of titles with one gather of
+    every fragment row followed by a segmented mean.
+    """
+
+    def __init__(self, model : KeyedVectors, preprocess : Callable[[str],str] = None, capacity : int = 100_000):
+        """
+        Args:
+            model (KeyedVectors): the vector embedding model
+            preprocess (Callable[[str],str], optional): applied to the input before embedding it, e.g. clean_wiki_link
+                                                        so the embedder can be called on urls. Defaults to None.
+            capacity (int, optional): the number of vectors kept in the LRU. Defaults to 100_000.
+        """
+        self.model = model
+        self.preprocess = preprocess
+        self.capacity = capacity
+        self.memory : OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, phrase : str) -> np.ndarray:
+        vector = self.memory.get(phrase)
+        if vector is not None:
+            self.memory.move_to_end(phrase)
+            self.hits += 1
+            return vector
+        return self.embed_many([phrase])[0]
+
+    def embed_many(self, phrases : List[str]) -> np.ndarray:
+        """
+        Args:
+            phrases (List[str]): the phrases (or urls if preprocess is clean_wiki_link) to embed
+
+        Returns:
+            np.ndarray: the contiguous (len(phrases), dim) float32 matrix of their vectors
+        """
+        output = np.zeros((len(phrases), self.model.vector_size), dtype=np.float32)
+        missing : Dict[str,List[int]] = {}
+        for row, phrase in enumerate(phrases):
+            vector = self.memory.get(phrase)
+            if vector is not None:
+                self.memory.move_to_end(phrase)
+                output[row] = vector
+                self.hits += 1
+            else:
+                missing.setdefault(phrase, []).append(row)
+
+        if not missing:
+            return output
+        self.misses += len(missing)
+
+        # the fragment rows of every missing phrase in one flat array, averaged per phrase with reduceat
+        key_to_index = self.model.key_to_index
+        flat, starts, counts = [], [], []
+        for phrase in missing:
+            indices = _phrase_indices(self.preprocess(phrase) if self.preprocess else phrase, key_to_index)
+            starts.append(len(flat))
+            counts.append(len(indices))
+            flat.extend(indices)
+
+        counts = np.asarray(counts)
+        vectors = np.zeros((len(missing), self.model.vector_size), dtype=np.float32)
+        found = counts > 0
+        if found.any():
+            sums = np.add.reduceat(np.asarray(self.model.vectors[flat], dtype=np.float32), np.asarray(starts)[found], axis=0)
+            vectors[found] = sums / counts[found, None]
+
+        for (phrase, rows), vector in zip(missing.items(), vectors):
+            output[rows] = vector
+            self.memory[phrase] = vector
+            if len(self.memory) > self.capacity:
+                self.memory.popitem(last=False)
+        return output
+
+def _normalize_rows(vectors : np.ndarray) -> np.ndarray:
+    """unit normalizes every row (zero rows are left as zeros so they score 0 against anything)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+class EmbeddingIndex:
+    """Maps article urls to rows of a unit normalized float32 matrix of their title embeddings, so the cosine
+    similarity of a whole set of articles to a target is a single gather and matrix-vector product.
+    The index can be built offline for every article of a graph and memory mapped back in, and when it is given an
+    embed function any article it hasn't seen yet is embedded and appended the first time it is asked for.
+    """
+
+    def __init__(self, urls : Iterable[str], vectors : np.ndarray, embed : Callable[[str],np.ndarray] = None):
+        """
+        Args:
+            urls (Iterable[str]): the urls of the articles, in row order
+            vectors (np.ndarray): the (already unit normalized) embedding matrix
+            embed (Callable[[str],np.ndarray], optional): embeds urls missing from the index. Defaults to None.
+        """
+        self.urls : List[str] = list(urls)
+        self.ids : Dict[str,int] = {url : i for i, url in enumerate(self.urls)}
+        self.vectors = vectors
+        self.embed = embed
+        self._buffer : np.ndarray = None # growable in memory copy of the matrix, self.vectors is a view of its used rows
+
+    ############################## Construction ##############################
+
+    @classmethod
+    def from_keyed_vectors(cls, model : KeyedVectors, urls : Iterable[str] = ()) -> "EmbeddingIndex":
+        """Embeds the titles of the given articles with phrase_to_vec, any other article is embedded on first use.
+
+        Args:
+            model (KeyedVectors): the vector embedding model
+            urls (Iterable[str], optional): the articles embedded up front (e.g. the nodes of a graph). Defaults to ().
+
+        Returns:
+            EmbeddingIndex: the index
+        """
+        embedder = PhraseEmbedder(model, clean_wiki_link)
+        urls = list(urls)
+        return cls(urls, _normalize_rows(embedder.embed_many(urls)), embedder)
+
+    def add(self, urls : Iterable[str]):
+        """Embeds and appends the articles that aren't in the index yet.
+
+        Args:
+            urls (Iterable[str]): the articles to add
+
+        Raises:
+            KeyError: if an article is missing and the index has no embed function
+        """
+        new = [url for url in dict.fromkeys(urls) if url not in self.ids]
+        if not new:
+            return
+        if self.embed is None:
+            raise KeyError(f"{new[0]} is not in the index")
+
+        embed_many = getattr(self.embed, "embed_many", None)
+        rows = _normalize_rows(embed_many(new) if embed_many else np.stack([self.embed(url) for url in new]))
+        size = len(self.urls)
+
+        # the matrix is copied into a buffer with spare rows (doubling when full) so appends are amortized,
+        # this is also what takes a memory mapped (read only) matrix into memory on the first append
+        if self._buffer is None or len(self._buffer) < size + len(new):
+            buffer = np.zeros((max(2 * size, size + len(new), 64), rows.shape[1]), dtype=np.float32)
+            buffer[:size] = self.vectors[:size]
+            self._buffer = buffer
+        self._buffer[size:size + len(new)] = rows
+        self.vectors = self._buffer[:size + len(new)]
+
+        for url in new:
+            self.ids[url] = len(self.urls)
+            self.urls.append(url)
+
+    ############################## Storage ##############################
+
+    def save(self, directory : str):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "urls.txt"), 'w', encoding='utf-8') as f:
+            f.writelines(url + "\n" for url in self.urls)
+        np.save(os.path.join(directory, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+
+    @classmethod
+    def load(cls, directory : str, model : KeyedVectors = None, mmap : bool = True) -> "EmbeddingIndex":
+        """
+        Args:
+            directory (str): where the index was saved
+            model (KeyedVectors, optional): used to embed articles missing from the index. Defaults to None.
+            mmap (bool, optional): memory maps the matrix (read only) instead of reading it. Defaults to True.
+
+        Returns:
+            EmbeddingIndex: the index
+        """
+        with open(os.path.join(directory, "urls.txt"), 'r', encoding='utf-8') as f:
+            urls = f.read().splitlines()
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r' if mmap else None)
+        return cls(urls, vectors, PhraseEmbedder(model, clean_wiki_link) if model is not None else None)
+
+    ############################## Lookup/Scoring ##############################
+
+    def __contains__(self, url : str) -> bool:
+        return url in self.ids
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def rows(self, urls : List[str]) -> np.ndarray:
+        """
+        Args:
+            urls (List[str]): the articles
+
+        Returns:
+            np.ndarray: the row of every article (missing ones are added first)
+        """
+        self.add(urls)
+        return np.fromiter((self.ids[url] for url in urls), dtype=np.int64, count=len(urls))
+
+    def matrix(self, urls : List[str]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the (len(urls), dim) matrix of the articles' unit embeddings
+        """
+        rows = self.rows(urls) # may grow (and so replace) the matrix
+        return self.vectors[rows]
+
+    def vector(self, url : str) -> np.ndarray:
+        row = self.rows([url])[0]
+        return self.vectors[row]
+
+    def similarities(self, urls : List[str], target : str) -> np.ndarray:
+        """
+        Args:
+            urls (List[str]): the candidate articles
+            target (str): the target article
+
+        Returns:
+            np.ndarray: the cosine similarity of every candidate's title to the target's title
+        """
+        return self.matrix(urls) @ self.vector(target)
+
+def encoder_namespace(model) -> Optional[str]:
+    """Names the vectors of a SentenceTransformer by the name or path of its weights and its embedding dimension,
+    None if the name or path can't be found.
+
+    Args:
+        model (SentenceTransformer): the model encoding the titles
+
+    Returns:
+        Optional[str]: e.g. "sentence-transformers/all-MiniLM-L6-v2:384"
+    """
+    card = getattr(model, "model_card_data", None)
+    name = getattr(card, "base_model", None) or getattr(card, "model_id", None)
+    if not name:
+        try:
+            name = model[0].auto_model.config._name_or_path
+        except (TypeError, KeyError, IndexError, AttributeError):
+            return None
+    if not name:
+        return None
+    dimension = model.get_sentence_embedding_dimension() if hasattr(model, "get_sentence_embedding_dimension") else None
+    return f"{name}:{dimension}"
+
+class EncoderCache:
+    """Title -> vector cache in front of a SentenceTransformer (or anything with a compatible encode method).
+    Lookups go through a bounded in memory LRU, then an optional SQLite store on disk so that titles encoded in
+    earlier games are free, and every title missing from both is encoded in a single batched model.encode call.
+    """
+
+    def __init__(self,
+                 model,
+                 path : str = None,
+                 capacity : int = 100_000,
+                 batch_size : int = 64,
+                 namespace : str = None):
+        """
+        Args:
+            model (SentenceTransformer): the model encoding the titles
+            path (str, optional): the sqlite file of the on disk store, memory only if None. Defaults to None.
+            capacity (int, optional): the number of vectors kept in the in memory LRU. Defaults to 100_000.
+            batch_size (int, optional): the batch size passed to model.encode. Defaults to 64.
+            namespace (str, optional): keys the on disk vectors so different models can share a file.
+                                       Defaults to encoder_namespace(model).
+
+        Raises:
+            ValueError: if there is an on disk store but no namespace is given and the model's can't be found
+        """
+        self.model = model
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.namespace = namespace if namespace is not None else encoder_namespace(model)
+        if path is not None and self.namespace is None:
+            raise ValueError("can't tell which model the vectors come from, pass the namespace they are stored under")
+        self.memory : OrderedDict = OrderedDict()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.encoded = 0
+
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS vectors (
+                                           namespace TEXT NOT NULL,
+                                           title TEXT NOT NULL,
+                                           vector BLOB NOT NULL,
+                                           PRIMARY KEY (namespace, title))""")
+            self.connection.commit()
+
+    def _remember(self, title : str, vector : np.ndarray):
+        self.memory[title] = vector
+        self.memory.move_to_end(title)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def _from_disk(self, titles : List[str]) -> Dict[str,np.ndarray]:
+        if self.connection is None or not titles:
+            return {}
+        found = {}
+        # sqlite limits the number of bound parameters so the lookup is chunked
+        for start in range(0, len(titles), 500):
+            chunk = titles[start:start + 500]
+            rows = self.connection.execute(f"SELECT title, vector FROM vectors WHERE namespace = ? AND title IN ({','.join('?' * len(chunk))})",
+                                           (self.namespace, *chunk))
+            for title, blob in rows:
+                found[title] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def encode(self, titles : List[str]) -> np.ndarray:
+        """
+        Args:
+            titles (List[str]): the titles to encode
+
+        Returns:
+            np.ndarray: the (len(titles), dim) float32 matrix of their vectors
+        """
+        vectors : Dict[str,np.ndarray] = {}
+        missing = []
+        for title in dict.fromkeys(titles):
+            if title in self.memory:
+                self.memory.move_to_end(title)
+                vectors[title] = self.memory[title]
+                self.memory_hits += 1
+            else:
+                missing.append(title)
+
+        for title, vector in self._from_disk(missing).items():
+            vectors[title] = vector
+            self._remember(title, vector)
+            self.disk_hits += 1
+
+        missing = [title for title in missing if title not in vectors]
+        if missing:
+            encoded = np.asarray(self.model.encode(missing, batch_size=self.batch_size, convert_to_numpy=True), dtype=np.float32)
+            self.encoded += len(missing)
+            for title, vector in zip(missing, encoded):
+                vectors[title] = vector
+                self._remember(title, vector)
+            if self.connection is not None:
+                self.connection.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                                            [(self.namespace, title, vector.tobytes()) for title, vector in zip(missing, encoded)])
+                self.connection.commit()
+
+        if not titles:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[title] for title in titles])
+
+    def unit_vectors(self, titles : List[str]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the unit normalized vectors of the titles (zero vectors stay zero)
+        """
+        return _normalize_rows(self.encode(titles))
+
+    def cached_unit_vectors(self, titles : List[str]) -> Tuple[List[int],np.ndarray]:
+        """Looks the titles up in memory and on disk without encoding any of them.
+
+        Args:
+            titles (List[str]): the titles to look up
+
+        Returns:
+            Tuple[List[int],np.ndarray]: the positions of the titles already encoded and their unit normalized vectors
+        """
+        vectors = {title : self.memory[title] for title in dict.fromkeys(titles) if title in self.memory}
+        for title, vector in self._from_disk([title for title in dict.fromkeys(titles) if title not in vectors]).items():
+            vectors[title] = vector
+            self._remember(title, vector)
+
+        positions = [i for i, title in enumerate(titles) if title in vectors]
+        if not positions:
+            return positions, np.zeros((0, 0), dtype=np.float32)
+        return positions, _normalize_rows(np.stack([vectors[titles[i]] for i in positions]))
+
+    def stats(self) -> Dict[str,int]:
+        return {'memory_hits' : self.memory_hits, 'disk_hits' : self.disk_hits, 'encoded' : self.encoded}
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+# builds the index for every article of a saved CSR graph, e.g.
+# python src/embeddings.py models/word2vec/wiki-news-300d-1M.kv "src/RL agent/graphs/CountryGraphL2" "src/RL agent/graphs/CountryGraphL2/word2vec"
+if __name__ == "__main__":
+    from csrGraph import CSRGraph
+    model_path, graph_directory, output_directory = sys.argv[1], sys.argv[2], sys.argv[3]
+    model = KeyedVectors.load(model_path, mmap='r')
+    index = EmbeddingIndex.from_keyed_vectors(model, CSRGraph.load(graph_directory).nodes)
+    index.save(output_directory)
+    print(f"saved {len(index)} embeddings to {output_directory}")
@@ -0,0 +1,260 @@
+import sys                                    # command line server
+import json                                   # streamed results
+import argparse                               # command line options
+import asyncio                                # single flight futures
+import threading                              # serving from a background thread
+import aiohttp                                # the persistent session
+from dataclasses import replace               # results handed to coalesced callers
+from aiohttp import web                       # the local api
+from typing import Dict,List,Set              # just needed for signatures/type hinting
+
+import wikiLinkRetrieval as wiki
+from wikiLinkRetrieval import FetchResult
+from wikiCache import WikiCache
+from wikiFetcher import DEFAULT_USER_AGENT
+from rateLimiter import HostLimiters
+from canonicalUrls import canonicalize
+
+def result_to_json(result : FetchResult) -> Dict:
+    return {'url' : result.url,
+            'article' : canonicalize(result.url),
+            'links' : sorted(result.links) if result.ok else None,
+            'status' : result.status,
+            'error' : result.error,
+            'attempts' : result.attempts}
+
+class FetchDaemon:
+    """Long lived local fetch service shared by every search, crawl and training process on the machine. It keeps one
+    persistent aiohttp session and one set of per host rate limiters (see rateLimiter), and coalesces concurrent
+    requests for the same article (single flight): the first caller's fetch is awaited by every other caller instead of
+    being sent again. The links are served as json over a small local http api:
+
+        GET  /links?url=<article url>        -> a result
+        POST /links  {"urls" : [...]}         -> one result per line (ndjson), in the order they finish
+        GET  /stats                           -> request, fetch and coalescing counts
+
+    where a result is {"url", "article" (the canonical url of the article received), "links" (null on failure),
+    "status", "error", "attempts"}. A client that disconnects cancels the fetches nobody else is waiting on.
+    Point the wikiLinkRetrieval helpers at it with wikiLinkRetrieval.use_daemon(daemon.url).
+    """
+
+    def __init__(self,
+                 host : str = "127.0.0.1",
+                 port : int = 0,
+                 cache : WikiCache = None,
+                 limiters : HostLimiters = None,
+                 max_retries : int = 4):
+        """
+        Args:
+            host (str, optional): the interface listened on. Defaults to "127.0.0.1".
+            port (int, optional): the port listened on, 0 picks a free one. Defaults to 0.
+            cache (WikiCache, optional): the cache consulted before going to the network. Defaults to wiki.default_cache.
+            limiters (HostLimiters, optional): the rate and concurrency limiters. Defaults to new ones.
+            max_retries (int, optional): the number of retries per fetch. Defaults to 4.
+        """
+        self.host = host
+        self.port = port
+        self.cache = cache
+        self.limiters = limiters if limiters is not None else HostLimiters()
+        self.max_retries = max_retries
+
+        self.requests = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self.in_flight : Dict[str,asyncio.Future] = {}
+        self.waiters : Dict[str,int] = {}
+        self.fetching : Set[asyncio.Future] = set() # every fetch not done yet, the cancelled ones included
+
+        self.app = web.Application()
+        self.app.router.add_get("/links", self.get_links)
+        self.app.router.add_post("/links", self.post_links)
+        self.app.router.add_get("/stats", self.get_stats)
+        self.session : aiohttp.ClientSession = None
+        self._runner : web.AppRunner = None
+        self._loop : asyncio.AbstractEventLoop = None
+        self._thread : threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    ############################## Fetching ##############################
+
+    async def _fetch(self, url : str) -> FetchResult:
+        self.fetches += 1
+        return await wiki.async_fetch_adj_wiki(url, self.session, limiters=self.limiters, max_retries=self.max_retries,
+                                               cache=self.cache, direct=True)
+
+    def _forget(self, key : str, future : asyncio.Future):
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
+        if future.done():
+            self.fetching.discard(future)
+
+    async def fetch(self, url : str) -> FetchResult:
+        """Fetches the links of an article, joining the fetch already in flight for it if there is one. The fetch is
+        cancelled once every caller waiting on it has been cancelled.
+
+        Args:
+            url (str): the url of the wikipedia page
+
+        Returns:
+            FetchResult: the links of the page, or why they couldn't be fetched
+        """
+        key = canonicalize(url)
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(url))
+            self.in_flight[key] = future
+            self.fetching.add(future)
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            # shielded, a caller that goes away doesn't cancel the fetch the others are waiting on
+            result = await asyncio.shield(future)
+        finally:
+            self.waiters[key] -= 1
+            if not self.waiters[key]:
+                del self.waiters[key]
+                # ...but once none is left waiting it stops (a no op when it is done), and the next caller starts a
+                # new fetch rather than joining one that is winding down
+                future.cancel()
+                self._forget(key, future)
+        return result if result.url == url else replace(result, url=url)
+
+    ############################## Handlers ##############################
+
+    async def get_links(self, request : web.Request) -> web.Response:
+        if "url" not in request.query:
+            return web.json_response({'error' : "missing url parameter"}, status=400)
+        self.requests += 1
+        return web.json_response(result_to_json(await self.fetch(request.query["url"])))
+
+    async def post_links(self, request : web.Request) -> web.Response:
+        try:
+            urls : List[str] = (await request.json())["urls"]
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'error' : "expected {\"urls\" : [...]}"}, status=400)
+        self.requests += 1
+        response = web.StreamResponse(headers={"Content-Type" : "application/x-ndjson"})
+        await response.prepare(request)
+        tasks = [asyncio.ensure_future(self.fetch(url)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                await response.write((json.dumps(result_to_json(result)) + "\n").encode('utf-8'))
+        except ConnectionResetError:
+            # the client went away, the fetches only it wanted are cancelled below
+            return response
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request : web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    ############################## Lifecycle ##############################
+
+    async def start(self) -> str:
+        """Opens the session and starts serving on the running event loop.
+
+        Returns:
+            str: the base url of the daemon
+        """
+        self.session = aiohttp.ClientSession(headers={"User-Agent" : DEFAULT_USER_AGENT})
+        # a handler is cancelled when its client disconnects
+        self._runner = web.AppRunner(self.app, access_log=None, handler_cancellation=True)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        # fetches cancelled by clients that went away may still be winding down
+        fetches = list(self.fetching)
+        for future in fetches:
+            future.cancel()
+        await asyncio.gather(*fetches, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start_in_thread(self) -> str:
+        """Starts serving from an event loop on a background thread, for synchronous callers.
+
+        Returns:
+            str: the base url of the daemon
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """Stops a daemon started with start_in_thread."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def __enter__(self):
+        self.start_in_thread()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str,int]:
+        return {'requests' : self.requests,
+                'fetches' : self.fetches,
+                'coalesced' : self.coalesced,
+                'in_flight' : len(self.in_flight)}
+
+# runs the shared daemon, e.g.
+# python src/fetchDaemon.py --port 8765 --cache wikiCache.sqlite
+# and in every client: wikiLinkRetrieval.use_daemon("http://127.0.0.1:8765")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serves the links of wikipedia articles from one shared fetch session")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache", default=None, help="a WikiCache sqlite file")
+    parser.add_argument("--mirror", default=None, help="sends the requests to another host, e.g. a mockWikiServer")
+    args = parser.parse_args(sys.argv[1:])
+
+    wiki.use_mirror(args.mirror)
+    daemon = FetchDaemon(args.host, args.port, cache=wiki.use_cache(args.cache) if args.cache else None)
+
+    async def serve():
+        async with daemon:
+            print(f"fetch daemon listening on {daemon.url}")
+            await asyncio.Event().wait()
+
+    asyncio.run(serve())
@@ -0,0 +1,286 @@
+import os                                     # graph directory handling
+import sys                                    # command line builder
+import argparse                               # command line options
+from typing import Tuple,Union                # just needed for signatures/type hinting
+import numpy as np
+
+from csrGraph import CSRGraph
+
+Node = Union[int,str]
+
+def bfs_distances(offsets : np.ndarray, targets : np.ndarray, source : int, max_depth : int = None) -> np.ndarray:
+    """Level synchronous BFS over a CSR adjacency, every frontier is expanded with a handful of array operations.
+
+    Args:
+        offsets (np.ndarray): the CSR offsets (use the rev_ arrays of a CSRGraph for distances to the source)
+        targets (np.ndarray): the CSR targets
+        source (int): the start node id
+        max_depth (int, optional): stops after this many layers. Defaults to None.
+
+    Returns:
+        np.ndarray: the (num nodes,) int32 hop distances from the source, -1 for the nodes it can't reach
+    """
+    offsets = np.asarray(offsets)
+    distances = np.full(len(offsets) - 1, -1, dtype=np.int32)
+    distances[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            break
+        # positions of every out edge of the frontier, without a python loop over the frontier
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        neighbours = np.asarray(targets[positions])
+        neighbours = np.unique(neighbours[distances[neighbours] < 0])
+        depth += 1
+        distances[neighbours] = depth
+        frontier = neighbours.astype(np.int64)
+    return distances
+
+class LandmarkIndex:
+    """ALT (A*, landmarks, triangle inequality) distance oracle over a CSRGraph. K hub articles are picked offline and
+    the BFS distances from every landmark (forward) and to every landmark (over the backlinks) are stored, one byte per
+    node and landmark for the usual shallow wikipedia graphs. For any pair of articles the triangle inequality then
+    gives, with a few array lookups,
+
+        lower bound: max over L of  d(L,t) - d(L,s)  and  d(s,L) - d(t,L)
+        upper bound: min over L of  d(s,L) + d(L,t)  (the length of a real path through L)
+
+    Unknown distances (unreachable landmarks) are stored as the dtype's max and make a bound uninformative, or prove
+    that no path exists when the other side is reachable. Queries take ids or urls (urls need the graph).
+    """
+
+    def __init__(self,
+                 landmarks : np.ndarray,
+                 from_landmarks : np.ndarray,
+                 to_landmarks : np.ndarray,
+                 graph : CSRGraph = None):
+        """
+        Args:
+            landmarks (np.ndarray): the (K,) landmark node ids
+            from_landmarks (np.ndarray): (K, num nodes) hop distances from every landmark
+            to_landmarks (np.ndarray): (K, num nodes) hop distances to every landmark
+            graph (CSRGraph, optional): the graph, needed for url queries. Defaults to None.
+        """
+        self.landmarks = landmarks
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+        self.graph = graph
+        self.unreachable = np.iinfo(from_landmarks.dtype).max
+        self._horizon : float = None
+
+    ############################## Construction ##############################
+
+    @classmethod
+    def build(cls, graph : CSRGraph, num_landmarks : int = 16, strategy : str = "farthest") -> "LandmarkIndex":
+        """
+        Args:
+            graph (CSRGraph): the graph
+            num_landmarks (int, optional): K, more landmarks give tighter bounds for K bytes per node each way. Defaults to 16.
+            strategy (str, optional): "degree" takes the K best linked articles, "farthest" starts from the best linked
+                                      one and keeps adding the article farthest from the landmarks so far (spreading
+                                      them over the graph, which tightens the bounds). Defaults to "farthest".
+
+        Raises:
+            ValueError: for an unknown strategy
+
+        Returns:
+            LandmarkIndex: the index
+        """
+        if strategy not in ("degree", "farthest"):
+            raise ValueError(f"unknown landmark strategy {strategy}")
+        num_landmarks = min(num_landmarks, len(graph))
+        degrees = graph.out_degrees() + graph.in_degrees()
+        by_degree = np.argsort(-degrees, kind='stable')
+
+        landmarks, forward, backward = [], [], []
+        closest = np.full(len(graph), np.iinfo(np.int64).max, dtype=np.int64)
+        for k in range(num_landmarks):
+            if strategy == "degree" or k == 0:
+                landmark = int(next(node for node in by_degree if node not in landmarks))
+            else:
+                # the round trip distance to the closest landmark, ties (and unreachable nodes) go to the best linked
+                candidates = np.where(closest < np.iinfo(np.int64).max, closest, -1)
+                candidates[landmarks] = -2
+                landmark = int(np.lexsort((-degrees, -candidates))[0])
+            landmarks.append(landmark)
+            forward.append(bfs_distances(graph.offsets, graph.targets, landmark))
+            backward.append(bfs_distances(graph.rev_offsets, graph.rev_targets, landmark))
+            round_trip = np.where((forward[-1] >= 0) & (backward[-1] >= 0), forward[-1].astype(np.int64) + backward[-1],
+                                  np.iinfo(np.int64).max)
+            closest = np.minimum(closest, round_trip)
+
+        forward, backward = np.stack(forward), np.stack(backward)
+        deepest = max(int(forward.max(initial=0)), int(backward.max(initial=0)))
+        dtype = np.uint8 if deepest < np.iinfo(np.uint8).max else np.uint16
+        unreachable = np.iinfo(dtype).max
+        return cls(np.array(landmarks, dtype=np.int32),
+                   np.where(forward < 0, unreachable, forward).astype(dtype),
+                   np.where(backward < 0, unreachable, backward).astype(dtype),
+                   graph)
+
+    ############################## Storage ##############################
+
+    def save(self, directory : str):
+        """Writes the landmark arrays to a directory (usually the graph's own, next to its CSR arrays)."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "landmarks.npy"), self.landmarks)
+        np.save(os.path.join(directory, "from_landmarks.npy"), self.from_landmarks)
+        np.save(os.path.join(directory, "to_landmarks.npy"), self.to_landmarks)
+
+    @classmethod
+    def load(cls, directory : str, graph : CSRGraph = None, mmap : bool = True) -> "LandmarkIndex":
+        """
+        Args:
+            directory (str): where the index was saved
+            graph (CSRGraph, optional): the graph, needed for url queries. Defaults to None.
+            mmap (bool, optional): memory maps the distance arrays instead of reading them. Defaults to True.
+
+        Returns:
+            LandmarkIndex: the index
+        """
+        mode = 'r' if mmap else None
+        return cls(np.load(os.path.join(directory, "landmarks.npy")),
+                   np.load(os.path.join(directory, "from_landmarks.npy"), mmap_mode=mode),
+                   np.load(os.path.join(directory, "to_landmarks.npy"), mmap_mode=mode),
+                   graph)
+
+    ############################## Queries ##############################
+
+    def _ids(self, nodes) -> np.ndarray:
+        if isinstance(nodes, str):
+            return np.array(self.graph.id(nodes))
+        if isinstance(nodes, (list, tuple)) and nodes and isinstance(nodes[0], str):
+            return np.array([self.graph.id(node) for node in nodes])
+        return np.asarray(nodes)
+
+    def _columns(self, distances : np.ndarray, nodes : np.ndarray) -> np.ndarray:
+        """the (K, ...) float distances of the nodes, inf where unknown"""
+        columns = np.asarray(distances[:, nodes], dtype=np.float32)
+        columns[columns == self.unreachable] = np.inf
+        return columns
+
+    def lower_bounds(self, sources, targets) -> np.ndarray:
+        """
+        Args:
+            sources: start node ids (or urls), any shape broadcasting with targets
+            targets: end node ids (or urls)
+
+        Returns:
+            np.ndarray: lower bounds of the hop distances, inf where the landmarks prove there is no path
+        """
+        sources, targets = np.broadcast_arrays(self._ids(sources), self._ids(targets))
+        from_s, from_t = self._columns(self.from_landmarks, sources), self._columns(self.from_landmarks, targets)
+        to_s, to_t = self._columns(self.to_landmarks, sources), self._columns(self.to_landmarks, targets)
+        with np.errstate(invalid='ignore'):
+            # d(L,t) <= d(L,s) + d(s,t) and d(s,L) <= d(s,t) + d(t,L), inf - inf says nothing
+            bounds = np.maximum(np.nan_to_num(from_t - from_s, nan=0.0, posinf=np.inf, neginf=0.0),
+                                np.nan_to_num(to_s - to_t, nan=0.0, posinf=np.inf, neginf=0.0))
+        bounds = np.maximum(bounds.max(axis=0), (sources != targets).astype(np.float32))
+        return np.where(sources == targets, 0.0, bounds)
+
+    def upper_bounds(self, sources, targets) -> np.ndarray:
+        """
+        Args:
+            sources: start node ids (or urls), any shape broadcasting with targets
+            targets: end node ids (or urls)
+
+        Returns:
+            np.ndarray: the lengths of the shortest paths through a landmark, inf where none is known
+        """
+        sources, targets = np.broadcast_arrays(self._ids(sources), self._ids(targets))
+        bounds = (self._columns(self.to_landmarks, sources) + self._columns(self.from_landmarks, targets)).min(axis=0)
+        return np.where(sources == targets, 0.0, bounds)
+
+    def bounds(self, source : Node, target : Node) -> Tuple[float,float]:
+        """
+        Returns:
+            Tuple[float,float]: the lower and upper bounds of the hop distance from source to target
+        """
+        return float(self.lower_bounds(source, target)), float(self.upper_bounds(source, target))
+
+    def lower_bounds_to(self, target : Node) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the (num nodes,) lower bounds of the distance from every node to target, the A* heuristic
+        """
+        return self.lower_bounds(np.arange(self.from_landmarks.shape[1]), target)
+
+    def estimates(self, sources, targets, unreachable : float = None) -> np.ndarray:
+        """The distance estimates used for reward shaping, the upper bounds (a path through a landmark is usually close
+        to optimal when the landmarks are well linked hubs). Pairs without a known path, dead ends included, are
+        pessimistically estimated as unreachable.
+
+        Args:
+            sources: start node ids (or urls)
+            targets: end node ids (or urls)
+            unreachable (float, optional): the estimate given where no path is known. Defaults to inf.
+
+        Returns:
+            np.ndarray: the estimated hop distances
+        """
+        estimates = self.upper_bounds(sources, targets)
+        if unreachable is not None:
+            estimates = np.where(np.isfinite(estimates), estimates, unreachable)
+        return estimates
+
+    def path(self, source : Node, target : Node) -> np.ndarray:
+        """Walks the shortest path through the best landmark, the path whose length is the upper bound. Needs the graph.
+
+        Args:
+            source (Node): the start node id (or url)
+            target (Node): the end node id (or url)
+
+        Returns:
+            np.ndarray: the node ids from source to target, empty when no path through a landmark is known
+        """
+        source, target = int(self._ids(source)), int(self._ids(target))
+        through = self._columns(self.to_landmarks, source) + self._columns(self.from_landmarks, target)
+        k = int(np.argmin(through))
+        if source == target:
+            return np.array([source], dtype=np.int64)
+        if not np.isfinite(through[k]):
+            return np.array([], dtype=np.int64)
+        to_landmark, from_landmark = self.to_landmarks[k], self.from_landmarks[k]
+
+        # down the distances to the landmark from the source, then up from the landmark to the target backwards
+        head, node = [source], source
+        while to_landmark[node] > 0:
+            neighbours = self.graph.out_neighbors(node)
+            node = int(neighbours[np.argmin(to_landmark[neighbours])])
+            head.append(node)
+        tail, node = [target], target
+        while from_landmark[node] > 0:
+            neighbours = self.graph.in_neighbors(node)
+            node = int(neighbours[np.argmin(from_landmark[neighbours])])
+            tail.append(node)
+        return np.array(head + tail[-2::-1], dtype=np.int64)
+
+    @property
+    def horizon(self) -> float:
+        """a distance longer than any finite estimate, stands in for unreachable targets in rewards"""
+        if self._horizon is None:
+            deepest = max(int(np.max(np.where(distances == self.unreachable, 0, distances), initial=0))
+                          for distances in (self.from_landmarks, self.to_landmarks))
+            self._horizon = float(2 * deepest + 1)
+        return self._horizon
+
+    def __len__(self) -> int:
+        return len(self.landmarks)
+
+# builds the index of a saved graph into its directory, e.g.
+# python src/landmarkIndex.py "src/RL agent/graphs/CountryGraphL2" --landmarks 16
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="builds the landmark distance index of a saved CSRGraph")
+    parser.add_argument("graph", help="a CSRGraph directory")
+    parser.add_argument("--landmarks", type=int, default=16)
+    parser.add_argument("--strategy", choices=["degree", "farthest"], default="farthest")
+    args = parser.parse_args(sys.argv[1:])
+
+    graph = CSRGraph.load(args.graph, load_urls=False)
+    index = LandmarkIndex.build(graph, args.landmarks, args.strategy)
+    index.save(args.graph)
+    print(f"saved {len(index)} landmarks ({index.from_landmarks.dtype}) for {len(graph)} nodes to {args.graph}")
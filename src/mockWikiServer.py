@@ -0,0 +1,312 @@
+import os                                     # graph directory handling
+import sys                                    # command line server
+import json                                   # api responses
+import html                                   # escapes the titles in the generated pages
+import pickle                                 # reads the old pickled graphs
+import random                                 # latency and error injection
+import asyncio                                # needed for concurrency
+import argparse                               # command line options
+import threading                              # serves in the background of synchronous code
+from aiohttp import web                       # the http server
+from typing import Tuple,Dict,Iterable,Optional # just needed for signatures/type hinting
+from urllib.parse import unquote
+
+from csrGraph import CSRGraph
+from canonicalUrls import normalize_url
+
+WIKI = "https://en.wikipedia.org"
+
+def render_page(title : str, links : Iterable[str], canonical : str = None, revision : int = None) -> bytes:
+    """Builds the html of a synthetic article in the same markup as a real one, a mw-parser-output content div
+    where every link is followed by an in text citation, and a References section (with a reflist) after them
+    whose links the extractors have to skip.
+
+    Args:
+        title (str): the title of the article
+        links (Iterable[str]): the urls of the articles it links to
+        canonical (str, optional): the url given in the page's canonical link. Defaults to None (no canonical link).
+        revision (int, optional): the revision id given in the page's config. Defaults to None (no config).
+
+    Returns:
+        bytes: the html of the page
+    """
+    paragraphs = []
+    for i, link in enumerate(links):
+        path = urlpath(link)
+        paragraphs.append(f'<p>See <a href="{path}" title="{html.escape(unquote(path[6:]).replace("_", " "))}">{i}</a>'
+                          f'<sup id="cite_ref-{i}" class="reference"><a href="#cite_note-{i}">[{i}]</a></sup>.</p>\n')
+    return ('<!DOCTYPE html>\n<html class="client-nojs" lang="en" dir="ltr"><head><meta charset="UTF-8">'
+            f'<title>{html.escape(title)} - Wikipedia</title>'
+            + (f'<link rel="canonical" href="{html.escape(canonical)}">' if canonical else '')
+            + (f'<script>RLCONF={{"wgRevisionId":{revision}}};</script>' if revision is not None else '') +
+            '</head><body>'
+            '<div id="bodyContent" class="vector-body"><div id="mw-content-text" class="mw-body-content">'
+            '<div class="mw-content-ltr mw-parser-output" lang="en" dir="ltr">\n'
+            f'<p><b>{html.escape(title)}</b> is a synthetic article.</p>\n'
+            + "".join(paragraphs) +
+            '<div class="mw-heading mw-heading2"><h2 id="References">References</h2></div>'
+            '<div class="reflist"><ol class="references"><li id="cite_note-0">'
+            '<a href="/wiki/Help:Citation">cite</a> <a href="/wiki/Reference_work">source</a></li></ol></div>'
+            '</div></div></div></body></html>').encode()
+
+def urlpath(url : str) -> str:
+    """the /wiki/... path of an article url"""
+    return url[url.index("/wiki/"):]
+
+class MockWikiServer:
+    """Local aiohttp stand in for en.wikipedia.org that serves the articles of a saved graph, so that the async
+    fetchers, searches and crawlers can be load tested offline. Every node url of the graph (https://en.wikipedia.org/wiki/...)
+    is served at the same /wiki/... path as synthetic html that the link extractors turn back into the node's
+    successors, and /w/api.php answers the backlinks, links and info queries from the graph's predecessors and successors.
+    Every article is at revision 1 unless set otherwise in server.revisions, the pages and the info query give it.
+    Each response is delayed by a random latency and a fraction of them fail with an injected error status. Redirect
+    urls are answered with their target's page, like wikipedia does, whose canonical link gives the redirect away.
+
+    Point the fetch functions at it with wikiLinkRetrieval.use_mirror(server.url).
+    """
+
+    def __init__(self,
+                 graph,
+                 latency : float = 0.0,
+                 jitter : float = 0.0,
+                 error_rate : float = 0.0,
+                 error_statuses : Tuple[int,...] = (429, 500, 503),
+                 retry_after : int = 1,
+                 seed : int = None,
+                 redirects : Dict[str,str] = None,
+                 host : str = "127.0.0.1",
+                 port : int = 0):
+        """
+        Args:
+            graph (CSRGraph | nx.DiGraph): the articles served, url nodes
+            latency (float, optional): the mean delay added to every response in seconds. Defaults to 0.0.
+            jitter (float, optional): the standard deviation of the delay. Defaults to 0.0.
+            error_rate (float, optional): the fraction of requests answered with an error status. Defaults to 0.0.
+            error_statuses (Tuple[int,...], optional): the injected statuses, picked at random. Defaults to (429, 500, 503).
+            retry_after (int, optional): the Retry-After sent with an injected 429 or 503. Defaults to 1.
+            seed (int, optional): seeds the latency and error injection. Defaults to None.
+            redirects (Dict[str,str], optional): redirect url -> url of the article it redirects to. Defaults to None.
+            host (str, optional): the interface listened on. Defaults to "127.0.0.1".
+            port (int, optional): the port listened on, 0 picks a free one. Defaults to 0.
+        """
+        self.graph = graph
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.redirects = redirects or {}
+        self.revisions : Dict[str,int] = {}
+        self.host = host
+        self.port = port
+
+        self.requests = 0
+        self.errors = 0
+        self.pages_served = 0
+        self.api_calls = 0
+
+        self.app = web.Application()
+        self.app.router.add_get("/wiki/{title:.+}", self.page)
+        self.app.router.add_get("/w/api.php", self.api)
+        self._runner : web.AppRunner = None
+        self._loop : asyncio.AbstractEventLoop = None
+        self._thread : threading.Thread = None
+
+    @classmethod
+    def from_path(cls, path : str, **kwargs) -> "MockWikiServer":
+        """
+        Args:
+            path (str): a directory written by CSRGraph.save or one of the pickled networkx graphs
+            **kwargs: passed through to MockWikiServer
+
+        Returns:
+            MockWikiServer: a server for the graph
+        """
+        if os.path.isdir(path):
+            return cls(CSRGraph.load(path), **kwargs)
+        with open(path, 'rb') as f:
+            return cls(pickle.load(f), **kwargs)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    ############################## Handlers ##############################
+
+    async def _inject(self) -> Optional[web.Response]:
+        """waits out the latency and gives the injected error response, if this request gets one"""
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            status = self.rng.choice(self.error_statuses)
+            headers = {"Retry-After" : str(self.retry_after)} if status in (429, 503) else {}
+            return web.Response(status=status, text=f"injected {status}", headers=headers)
+        return None
+
+    async def page(self, request : web.Request) -> web.Response:
+        error = await self._inject()
+        if error is not None:
+            return error
+
+        # the links in the pages are percent encoded like the node urls, so the raw path is the node's path
+        url = WIKI + request.raw_path.split("?")[0]
+        url = self.redirects.get(url, url)
+        if not self.graph.has_node(url):
+            return web.Response(status=404, text="There is currently no text in this page.")
+        self.pages_served += 1
+        title = unquote(url[len(WIKI) + 6:]).replace("_", " ")
+        return web.Response(body=render_page(title, self.graph.successors(url), canonical=url,
+                                                revision=self.revisions.get(url, 1)), content_type="text/html", charset="utf-8")
+
+    async def api(self, request : web.Request) -> web.Response:
+        """the list=backlinks and prop=links|info queries of the MediaWiki action api, continued with an offset"""
+        error = await self._inject()
+        if error is not None:
+            return error
+
+        self.api_calls += 1
+        params = request.query
+        if set(params.get("prop", "").split("|")) & {"links", "info"} and "titles" in params:
+            return self.prop_query(params)
+        if params.get("list") != "backlinks" or "bltitle" not in params:
+            return web.json_response({'error' : {'code' : 'badparams', 'info' : 'only list=backlinks and prop=links|info are supported'}})
+
+        url = f"{WIKI}/wiki/{params['bltitle'].replace(' ', '_')}"
+        backlinks = sorted(self.graph.predecessors(url)) if self.graph.has_node(url) else []
+        offset = int(params.get("blcontinue", 0))
+        limit = int(params.get("bllimit", 10))
+
+        data : Dict = {'batchcomplete' : '',
+                       'query' : {'backlinks' : [{'ns' : 0, 'title' : unquote(urlpath(pred)[6:]).replace("_", " ")}
+                                                 for pred in backlinks[offset:offset + limit]]}}
+        if offset + limit < len(backlinks):
+            data['continue'] = {'blcontinue' : str(offset + limit), 'continue' : '-||'}
+        return web.Response(text=json.dumps(data), content_type="application/json")
+
+    def prop_query(self, params) -> web.Response:
+        """the prop=links and prop=info queries for up to 50 titles, redirects followed and underscores normalized like
+        wikipedia does, pllimit links (over all the titles) per response and the lastrevid of every page"""
+        props = params["prop"].split("|")
+        query : Dict = {'normalized' : [], 'redirects' : [], 'pages' : {}}
+        pairs = []
+        for title in params['titles'].split("|")[:50]:
+            if "_" in title:
+                query['normalized'].append({'from' : title, 'to' : title.replace("_", " ")})
+                title = title.replace("_", " ")
+            url = normalize_url(f"{WIKI}/wiki/{title}")
+            if url in self.redirects:
+                url = self.redirects[url]
+                query['redirects'].append({'from' : title, 'to' : unquote(urlpath(url)[6:]).replace("_", " ")})
+                title = query['redirects'][-1]['to']
+            if not self.graph.has_node(url):
+                query['pages'][str(-1 - len(query['pages']))] = {'ns' : 0, 'title' : title, 'missing' : ''}
+                continue
+            query['pages'][str(len(query['pages']) + 1)] = {'ns' : 0, 'title' : title}
+            if "info" in props:
+                query['pages'][str(len(query['pages']))]['lastrevid'] = self.revisions.get(url, 1)
+            if "links" in props:
+                pairs.extend((title, link) for link in sorted(self.graph.successors(url)))
+
+        offset = int(params.get("plcontinue", 0))
+        limit = 500 if params.get("pllimit", "max") == "max" else int(params["pllimit"])
+        pages = {page['title'] : page for page in query['pages'].values()}
+        for title, link in pairs[offset:offset + limit]:
+            pages[title].setdefault('links', []).append({'ns' : 0, 'title' : unquote(urlpath(link)[6:]).replace("_", " ")})
+
+        data : Dict = {'query' : {key : value for key, value in query.items() if value}}
+        if offset + limit < len(pairs):
+            data['continue'] = {'plcontinue' : str(offset + limit), 'continue' : '||'}
+        else:
+            data['batchcomplete'] = ''
+        return web.Response(text=json.dumps(data), content_type="application/json")
+
+    ############################## Lifecycle ##############################
+
+    async def start(self) -> str:
+        """Starts serving on the running event loop.
+
+        Returns:
+            str: the base url of the server
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start_in_thread(self) -> str:
+        """Starts serving from an event loop on a background thread, for synchronous callers.
+
+        Returns:
+            str: the base url of the server
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """Stops a server started with start_in_thread."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def __enter__(self):
+        self.start_in_thread()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str,int]:
+        return {'requests' : self.requests,
+                'errors' : self.errors,
+                'pages_served' : self.pages_served,
+                'api_calls' : self.api_calls}
+
+# serves a saved graph, e.g.
+# python src/mockWikiServer.py "src/RL agent/graphs/CountryGraphL2" --port 8080 --latency 0.05 --error-rate 0.01
+# and in the client: wikiLinkRetrieval.use_mirror("http://127.0.0.1:8080")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serves the articles of a saved graph as a local mock wikipedia")
+    parser.add_argument("graph", help="a CSRGraph directory or a pickled networkx graph")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failed with an error status")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(sys.argv[1:])
+
+    server = MockWikiServer.from_path(args.graph, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                      seed=args.seed, host=args.host, port=args.port)
+    web.run_app(server.app, host=args.host, port=args.port)
@@ -0,0 +1,171 @@
+import time                                   # token refills, latencies and pauses
+import asyncio                                # waiting for a slot
+from urllib.parse import urlsplit             # per host limiters
+from email.utils import parsedate_to_datetime # http date Retry-After values
+from typing import Dict,Optional              # just needed for signatures/type hinting
+
+# the statuses a well behaved client backs off from and retries, same as WikiFetcher's
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+def parse_retry_after(value : Optional[str]) -> Optional[float]:
+    """
+    Args:
+        value (Optional[str]): a Retry-After header, either seconds or an http date
+
+    Returns:
+        Optional[float]: the number of seconds to wait, None if there is no (valid) header
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveLimiter:
+    """Rate and concurrency limiter for the requests sent to one host. A token bucket caps the request rate (with
+    bursts of up to burst requests) and an AIMD window caps the requests in flight: every fast successful response
+    grows the window by about one request per window's worth of responses, while a 429/5xx, a failed connection or
+    a response slower than the latency target shrinks it multiplicatively, at most once per round trip (only
+    responses to requests sent after the last decrease count). A Retry-After pauses every request to the host.
+    """
+
+    def __init__(self,
+                 rate : float = 50.0,
+                 burst : int = 10,
+                 concurrency : float = 4,
+                 min_concurrency : int = 1,
+                 max_concurrency : int = 64,
+                 increase : float = 1.0,
+                 decrease : float = 0.5,
+                 latency_target : float = 2.0,
+                 max_pause : float = 60.0):
+        """
+        Args:
+            rate (float, optional): the sustained requests per second, None for no rate limit. Defaults to 50.0.
+            burst (int, optional): the size of the token bucket. Defaults to 10.
+            concurrency (float, optional): the initial window, the number of requests in flight. Defaults to 4.
+            min_concurrency (int, optional): the smallest window. Defaults to 1.
+            max_concurrency (int, optional): the largest window. Defaults to 64.
+            increase (float, optional): the additive increase per window of successful responses. Defaults to 1.0.
+            decrease (float, optional): the factor the window is multiplied by on congestion. Defaults to 0.5.
+            latency_target (float, optional): responses slower than this (in seconds) count as congestion. Defaults to 2.0.
+            max_pause (float, optional): the longest Retry-After honoured, in seconds. Defaults to 60.0.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.window = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.max_pause = max_pause
+
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self.in_flight = 0
+        self._condition : asyncio.Condition = None
+        self._loop : asyncio.AbstractEventLoop = None
+
+        self.successes = 0
+        self.congestions = 0
+        self.pauses = 0
+
+    @property
+    def concurrency(self) -> int:
+        """the number of requests currently allowed in flight"""
+        return max(self.min_concurrency, int(self.window))
+
+    def _refill(self, now : float):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    ############################## Acquiring ##############################
+
+    async def acquire(self) -> float:
+        """Waits until the request may be sent: a Retry-After pause is over, the window has room and a token is free.
+
+        Returns:
+            float: the time the request was let through, to be handed back to release
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # a limiter outlives the event loops of consecutive asyncio.run calls (e.g. the layers of sprawl)
+            self._loop, self._condition = loop, asyncio.Condition()
+        while True:
+            async with self._condition:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= self.concurrency:
+                    # woken by release
+                    await self._condition.wait()
+                    continue
+                else:
+                    self._refill(now)
+                    if self.rate is None or self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return now
+                    wait = (1 - self.tokens) / self.rate
+            # releases can't make a token appear sooner and a pause that got longer is seen on waking. A plain sleep,
+            # wait_for on the condition can swallow a cancellation that arrives as it times out (before python 3.12)
+            await asyncio.sleep(wait)
+
+    async def release(self, started : float, status : int = None, retry_after : float = None):
+        """Frees the request's slot and adjusts the window to how it went.
+
+        Args:
+            started (float): the time given by acquire
+            status (int, optional): the response status, None if the request failed without one. Defaults to None.
+            retry_after (float, optional): the response's Retry-After in seconds. Defaults to None.
+        """
+        now = time.monotonic()
+        congested = status is None or status in RETRYABLE_STATUSES or now - started > self.latency_target
+        if congested:
+            self.congestions += 1
+            if started >= self.decreased_at:
+                self.window = max(self.min_concurrency, self.window * self.decrease)
+                self.decreased_at = now
+        elif status < 400:
+            self.successes += 1
+            self.window = min(self.max_concurrency, self.window + self.increase / self.window)
+        if retry_after:
+            self.pause(retry_after)
+
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def pause(self, seconds : float):
+        """Holds back every request for the given number of seconds (capped at max_pause)."""
+        self.pauses += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + min(seconds, self.max_pause))
+
+    def stats(self) -> Dict[str,float]:
+        return {'concurrency' : self.concurrency, 'in_flight' : self.in_flight, 'successes' : self.successes,
+                'congestions' : self.congestions, 'pauses' : self.pauses}
+
+class HostLimiters:
+    """One AdaptiveLimiter per host, created on first use with the same settings."""
+
+    def __init__(self, **kwargs):
+        """
+        Args:
+            **kwargs: passed through to every AdaptiveLimiter
+        """
+        self.kwargs = kwargs
+        self.limiters : Dict[str,AdaptiveLimiter] = {}
+
+    def __getitem__(self, url : str) -> AdaptiveLimiter:
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = AdaptiveLimiter(**self.kwargs)
+        return self.limiters[host]
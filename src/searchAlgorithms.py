@@ -1,124 +1,440 @@
-from typing import List, overload
+from typing import List, Dict, Set, Tuple, Iterable, Callable, AsyncIterator, overload
 import wikiLinkRetrieval as wiki
+from wikiFetcher import DEFAULT_USER_AGENT
+from csrGraph import CSRGraph
+from landmarkIndex import LandmarkIndex
+from canonicalUrls import canonicalize, UrlInterner
+from embeddings import EmbeddingIndex, EncoderCache, PhraseEmbedder, phrase_to_vec
+import networkx as nx
+import asyncio
+import aiohttp
+from contextlib import aclosing, AsyncExitStack, nullcontext
 from gensim.models import KeyedVectors
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
-# use this to find the length of the optimal path, does not actually play the game
-def bfs_length(source : str,target : str) -> int:
-    """An implementation of BFS for wikipedia articles that calculates the shortest path length,
-    given the source and target pages as urls. Will return -1 if no path exists.
+################################################ Bidirectional BFS ################################################
+
+def graph_neighbours(G : nx.DiGraph) -> Tuple[Callable[[str],Iterable[str]],Callable[[str],Iterable[str]]]:
+    """Given a loaded graph will return the successor and predecessor functions used by bidirectional_paths,
+    the backlinks are just the reverse edges of the graph.
 
     Args:
-        source (str): the url for the start page
-        target (str): the url for the end page
+        G (nx.DiGraph): the wikipedia (sub)graph
 
     Returns:
-        int: the length of the optimal path
+        Tuple[Callable[[str],Iterable[str]],Callable[[str],Iterable[str]]]: the successor and predecessor functions
     """
-    queue = [(source, [source])]
-    seen = set()
+    def successors(node):
+        return G.successors(node) if G.has_node(node) else ()
 
-    while queue:
-        current,path = queue.pop(0)
-        seen.add(current)
+    def predecessors(node):
+        return G.predecessors(node) if G.has_node(node) else ()
 
-        if current == target:
-            return path + [current]
+    return successors, predecessors
 
-        neighbours = wiki.get_adj_wiki(current)
+def csr_neighbours(G : CSRGraph) -> Tuple[Callable[[int],Iterable[int]],Callable[[int],Iterable[int]]]:
+    """Same as graph_neighbours but for a CSRGraph, working directly on the integer ids (use G.id / G.url to
+    convert to and from urls).
 
-        if target in neighbours:
-            return path + [target]
+    Args:
+        G (CSRGraph): the wikipedia (sub)graph
 
-        for node in neighbours:
-            if node not in seen:
-                queue.append((node,path + [node]))
-    return None
+    Returns:
+        Tuple[Callable[[int],Iterable[int]],Callable[[int],Iterable[int]]]: the successor and predecessor functions
+    """
+    def successors(node):
+        return G.out_neighbors(node).tolist()
 
-# use this to find the all of the optimal paths, does not actually play the game
-def bfs_paths(source : str,target : str) -> List[str]:
-    """An implementation of BFS for wikipedia articles that calculates all of the optimal paths,
-    given the source and target pages as urls. Will return an empty list if no path exists.
+    def predecessors(node):
+        return G.in_neighbors(node).tolist()
+
+    return successors, predecessors
+
+def live_neighbours(verify_backlinks : bool = False) -> Tuple[Callable[[str],Iterable[str]],Callable[[str],Iterable[str]]]:
+    """Will return the successor and predecessor functions used by bidirectional_paths for searching live
+    wikipedia, the successors are fetched with get_adj_wiki and the predecessors come from the "what links here" api.
+    Pages and backlinks are only ever fetched once per search. Both sides give canonical urls (see
+    canonicalUrls.canonicalize) so that a page reached forwards and backwards is the same node, whatever its hrefs'
+    percent encoding.
+
+    Args:
+        verify_backlinks (bool, optional): the api's backlinks include links outside of the main text, if True a backlink
+                                           is only kept when the linking page's extracted links contain the page
+                                           (which keeps the search exact at the cost of fetching every linking page).
+                                           Defaults to False, the live searches verify the paths they find instead
+                                           (see verified_paths).
+
+    Returns:
+        Tuple[Callable[[str],Iterable[str]],Callable[[str],Iterable[str]]]: the successor and predecessor functions
+    """
+    adjacency : Dict[str,Set[str]] = {}
+    backlinks_of : Dict[str,Set[str]] = {}
+
+    def successors(node):
+        if node not in adjacency:
+            try:
+                adjacency[node] = {canonicalize(link) for link in wiki.get_adj_wiki(node)}
+            except (ConnectionError, RuntimeError):
+                adjacency[node] = set()
+        return adjacency[node]
+
+    def predecessors(node):
+        if node not in backlinks_of:
+            try:
+                backlinks_of[node] = wiki.get_backlinks(node)
+            except ConnectionError:
+                backlinks_of[node] = set()
+        backlinks = backlinks_of[node]
+        if not verify_backlinks:
+            return backlinks
+        return {pred for pred in backlinks if node in successors(pred)}
+
+    return successors, predecessors
+
+def verified_paths(paths : List[List[str]], successors : Callable[[str],Iterable[str]]) -> List[List[str]]:
+    """Keeps the paths whose every jump is a link of the page's main text, which only costs fetching the pages on the
+    backward half of the paths (the forward half came from the successors already).
+
+    Args:
+        paths (List[List[str]]): paths found with unverified backlinks
+        successors (Callable[[str],Iterable[str]]): gives the urls a url links to
+
+    Returns:
+        List[List[str]]: the paths that can be played
+    """
+    return [path for path in paths if all(b in successors(a) for a, b in zip(path, path[1:]))]
+
+def interned_neighbours(successors : Callable[[str],Iterable[str]],
+                        predecessors : Callable[[str],Iterable[str]],
+                        interner : UrlInterner) -> Tuple[Callable[[int],Iterable[int]],Callable[[int],Iterable[int]]]:
+    """Turns url level successor and predecessor functions (like the live_neighbours ones) into functions over the
+    interner's integer ids, so that the search's parent and seen tables hold ints and every spelling of an article
+    is the same node.
+
+    Args:
+        successors (Callable[[str],Iterable[str]]): gives the urls a url links to
+        predecessors (Callable[[str],Iterable[str]]): gives the urls linking to a url
+        interner (UrlInterner): the url <-> id table
+
+    Returns:
+        Tuple[Callable[[int],Iterable[int]],Callable[[int],Iterable[int]]]: the successor and predecessor functions
+    """
+    def id_successors(node):
+        return [interner.intern(url) for url in successors(interner.url(node))]
+
+    def id_predecessors(node):
+        return [interner.intern(url) for url in predecessors(interner.url(node))]
+
+    return id_successors, id_predecessors
+
+def bidirectional_paths(source : str,
+                        target : str,
+                        successors : Callable[[str],Iterable[str]],
+                        predecessors : Callable[[str],Iterable[str]],
+                        all_paths : bool = True,
+                        max_depth : int = None) -> List[List[str]]:
+    """A bidirectional BFS that expands forward from the source and backward from the target one whole layer at a
+    time (always growing the smaller frontier). Every discovered node keeps a list of parent pointers to the nodes one
+    layer closer to its side's start instead of a copy of its path, so once the two searches meet the optimal paths
+    are reconstructed by walking the pointers out from every meeting node.
+
+    Args:
+        source (str): the start node
+        target (str): the end node
+        successors (Callable[[str],Iterable[str]]): gives the nodes a node links to
+        predecessors (Callable[[str],Iterable[str]]): gives the nodes linking to a node
+        all_paths (bool, optional): if False only a single optimal path is reconstructed. Defaults to True.
+        max_depth (int, optional): gives up once the searched path length goes over this many jumps. Defaults to None.
+
+    Returns:
+        List[List[str]]: the optimal paths (source and target included), empty if there is no path
+    """
+    if source == target:
+        return [[source]]
+
+    # node -> parents one layer closer to the source / children one layer closer to the target
+    forward_parents : Dict[str,List[str]] = {source : []}
+    backward_parents : Dict[str,List[str]] = {target : []}
+    forward_frontier, backward_frontier = [source], [target]
+    depth = 0
+
+    while forward_frontier and backward_frontier:
+        if max_depth is not None and depth >= max_depth:
+            return []
+
+        forward = len(forward_frontier) <= len(backward_frontier)
+        if forward:
+            frontier, parents, other, expand = forward_frontier, forward_parents, backward_parents, successors
+        else:
+            frontier, parents, other, expand = backward_frontier, backward_parents, forward_parents, predecessors
+
+        # nodes first discovered in this layer, the parents of an already visited node can only grow within the layer
+        layer : Dict[str,List[str]] = {}
+        for node in frontier:
+            for neighbour in expand(node):
+                if neighbour in layer:
+                    layer[neighbour].append(node)
+                elif neighbour not in parents:
+                    layer[neighbour] = [node]
+        parents.update(layer)
+        depth += 1
+
+        meeting = [node for node in layer if node in other]
+        if meeting:
+            paths = []
+            for node in meeting:
+                for head in _unwind(node, forward_parents, all_paths):
+                    for tail in _unwind(node, backward_parents, all_paths):
+                        paths.append(head[::-1] + tail[1:])
+                        if not all_paths:
+                            return paths
+            return paths
+
+        if forward:
+            forward_frontier = list(layer)
+        else:
+            backward_frontier = list(layer)
+
+    return []
+
+def _unwind(node : str, parents : Dict[str,List[str]], all_paths : bool) -> List[List[str]]:
+    """Follows the parent pointers from node back to the start of its search (the node with no parents),
+    giving every pointer chain starting at node."""
+    chains = []
+    stack = [[node]]
+    while stack:
+        chain = stack.pop()
+        node_parents = parents[chain[-1]]
+        if not node_parents:
+            chains.append(chain)
+            if not all_paths:
+                return chains
+            continue
+        for parent in node_parents:
+            stack.append(chain + [parent])
+    return chains
+
+def _search(source : str, target : str, G, all_paths : bool, max_depth : int = None) -> List[List[str]]:
+    """runs bidirectional_paths over a CSRGraph (on ids), a networkx graph or live wikipedia (G is None, on the ids
+    of a UrlInterner of its own)"""
+    if isinstance(G, CSRGraph):
+        if not (G.has_node(source) and G.has_node(target)):
+            return []
+        paths = bidirectional_paths(G.id(source), G.id(target), *csr_neighbours(G), all_paths=all_paths, max_depth=max_depth)
+        return [[G.url(node) for node in path] for path in paths]
+
+    if G is not None:
+        source = source if G.has_node(source) else canonicalize(source)
+        target = target if G.has_node(target) else canonicalize(target)
+        return bidirectional_paths(source, target, *graph_neighbours(G), all_paths=all_paths)
+
+    # the backlinks are a superset of the main text links, so a path over them is never longer than the real shortest
+    # paths and every shortest path that verifies is one of them. When none does the exact (slower) search decides.
+    # ids for this search only, a process wide table would keep every url any search touched
+    interner = UrlInterner()
+    successors, predecessors = live_neighbours()
+
+    def search(backward):
+        paths = bidirectional_paths(interner.intern(source), interner.intern(target),
+                                    *interned_neighbours(successors, backward, interner), all_paths=all_paths)
+        return [[interner.url(node) for node in path] for path in paths]
+
+    paths = search(predecessors)
+    if not paths:
+        return []
+    return verified_paths(paths, successors) or search(lambda node: {pred for pred in predecessors(node) if node in successors(pred)})
+
+# use this to find the length of the optimal path, does not actually play the game
+def bfs_length(source : str,target : str, G : nx.DiGraph = None, landmarks : LandmarkIndex = None) -> int:
+    """Calculates the shortest path length (the number of jumps) given the source and target pages as urls,
+    using bidirectional BFS over either a loaded graph or live wikipedia. Will return -1 if no path exists.
 
     Args:
         source (str): the url for the start page
         target (str): the url for the end page
+        G (nx.DiGraph | CSRGraph, optional): the graph to search, searches live wikipedia if None. Defaults to None.
+        landmarks (LandmarkIndex, optional): a landmark index over G (a CSRGraph), the search is skipped when its bounds
+                                             meet and otherwise never goes deeper than the upper bound. Defaults to None.
 
     Returns:
-        List[str]: the list of all optimal paths between the source and target articles
+        int: the length of the optimal path
     """
-    opt_paths = []
-    opt_length = 0
-
-    queue = [(source, [source])]
-    seen = set()
+    max_depth = None
+    if landmarks is not None and isinstance(G, CSRGraph) and G.has_node(source) and G.has_node(target):
+        lower, upper = landmarks.bounds(G.id(source), G.id(target))
+        if lower == upper:
+            return int(upper) if np.isfinite(upper) else -1
+        max_depth = int(upper) if np.isfinite(upper) else None
 
-    while queue:
-        current,path = queue.pop(0)
-        seen.add(current)
+    paths = _search(source, target, G, all_paths=False, max_depth=max_depth)
+    return len(paths[0]) - 1 if paths else -1
 
-        neighbours = wiki.get_adj_wiki(current)
+# use this to find the all of the optimal paths, does not actually play the game
+def bfs_paths(source : str,target : str, G : nx.DiGraph = None) -> List[List[str]]:
+    """Calculates all of the optimal paths given the source and target pages as urls, using bidirectional BFS
+    over either a loaded graph or live wikipedia. Will return an empty list if no path exists.
 
-        if opt_length !=0 and len(path) > opt_length:
-            return opt_paths
+    Args:
+        source (str): the url for the start page
+        target (str): the url for the end page
+        G (nx.DiGraph | CSRGraph, optional): the graph to search, searches live wikipedia if None. Defaults to None.
 
-        if target in neighbours:
-            path_target = path+ [target]
+    Returns:
+        List[List[str]]: the list of all optimal paths between the source and target articles
+    """
+    opt_paths = _search(source, target, G, all_paths=True)
+    for path in opt_paths:
+        print(wiki.format_path(path))
+    return opt_paths
+
+
+################################################ Concurrent BFS ################################################
+
+def _check_complete(failed : Dict[str,"wiki.FetchResult"], failures : Dict[str,"wiki.FetchResult"]):
+    """raises when pages the search needed could not be fetched and the caller isn't collecting the failures"""
+    if failed and failures is None:
+        raise ConnectionError(f"the search is incomplete, {len(failed)} pages could not be fetched: " +
+                              ", ".join(f"{url} ({result.error})" for url, result in list(failed.items())[:5]))
+
+async def async_bfs_paths(source : str,
+                          target : str,
+                          concurrency : int = 20,
+                          all_paths : bool = False,
+                          max_depth : int = None,
+                          responses : Callable[[List[str]],AsyncIterator[Tuple[str,Set[str]]]] = None,
+                          failures : Dict[str,"wiki.FetchResult"] = None) -> List[List[str]]:
+    """A level synchronous BFS for live wikipedia where every page of a frontier layer is requested concurrently.
+    Responses are handled as they arrive and as soon as one of them contains the target the search stops and
+    the requests still in flight are cancelled (when looking for all optimal paths the rest of that layer is
+    still fetched since it may hold other optimal paths, but no further layer is started). The pages are fetched with
+    wiki.async_iter_adj_wikis, rate limited and retried, and a page that still fails may hide a path: unless failures
+    is given the search then raises instead of answering with longer paths than the optimal ones or no path at all.
 
-            if opt_length == 0:
-                opt_length = len(path_target)
-                print(wiki.format_path(path_target))
-                opt_paths.append(path_target)
-                continue
-            elif len(path_target) == opt_length:
-                opt_paths.append(path_target)
-                print(wiki.format_path(path_target))
-                continue
+    Args:
+        source (str): the url for the start page
+        target (str): the url for the end page
+        concurrency (int, optional): the maximum number of requests in flight. Defaults to 20.
+        all_paths (bool, optional): if True finds all of the optimal paths rather than the first one. Defaults to False.
+        max_depth (int, optional): gives up once the searched path length goes over this many jumps. Defaults to None.
+        responses (Callable[[List[str]],AsyncIterator[Tuple[str,Set[str]]]], optional): given a layer of urls yields the
+                    (url, adjacent articles) pairs as they arrive. Defaults to wiki.async_iter_adj_wikis over one session.
+        failures (Dict[str,FetchResult], optional): filled with the results of the pages that could not be fetched,
+                                                    the paths found are then only the best the other pages allow.
+                                                    Defaults to None.
+
+    Raises:
+        ConnectionError: if pages that could change the answer could not be fetched and failures isn't given
 
-        for node in neighbours:
-            if node not in seen:
-                queue.append((node,path + [node]))
+    Returns:
+        List[List[str]]: the optimal paths (source and target included), empty if there is no path
+    """
+    if responses is None:
+        # the fetched links are canonical urls
+        source, target = canonicalize(source), canonicalize(target)
+    if source == target:
+        return [[source]]
+
+    failed : Dict[str,wiki.FetchResult] = failures if failures is not None else {}
+    async with AsyncExitStack() as stack:
+        if responses is None:
+            session = await stack.enter_async_context(aiohttp.ClientSession(headers={"User-Agent" : DEFAULT_USER_AGENT}))
+            responses = lambda urls: wiki.async_iter_adj_wikis(urls, session, workers=concurrency, failures=failed)
+
+        parents : Dict[str,List[str]] = {source : []}
+        frontier = [source]
+        depth = 0
+
+        while frontier:
+            if max_depth is not None and depth >= max_depth:
+                _check_complete(failed, failures)
+                return []
+
+            earlier = dict(failed)
+            layer : Dict[str,List[str]] = {}
+            found = False
+            async with aclosing(responses(frontier)) as layer_responses:
+                async for url, links in layer_responses:
+                    for link in links:
+                        if link in layer:
+                            layer[link].append(url)
+                        elif link not in parents:
+                            layer[link] = [url]
+                    if target in links:
+                        found = True
+                        if not all_paths:
+                            break
+            parents.update(layer)
+            depth += 1
+
+            if found:
+                # a page of an earlier layer could have led to a shorter path, one of this layer to another optimal one
+                _check_complete(failed if all_paths else earlier, failures)
+                return [chain[::-1] for chain in _unwind(target, parents, all_paths)]
+            frontier = list(layer)
+
+    _check_complete(failed, failures)
     return []
 
+def concurrent_bfs_paths(source : str, target : str, concurrency : int = 20, all_paths : bool = True) -> List[List[str]]:
+    """Synchronous entry point for async_bfs_paths, calculates the optimal paths between the source and
+    target pages fetching every frontier layer concurrently. Will return an empty list if no path exists.
 
-################################################ Word2Vec Search ################################################
+    Args:
+        source (str): the url for the start page
+        target (str): the url for the end page
+        concurrency (int, optional): the maximum number of requests in flight. Defaults to 20.
+        all_paths (bool, optional): if True finds all of the optimal paths rather than the first one. Defaults to True.
 
-def phrase_to_vec(phrase: str, model: KeyedVectors, ) -> np.ndarray:
-    """Given a string and a KeyedVectors model will attempt to find the phrase vector in the model
-    and if it can't will average the available vectors from the words that make up the phrase. Will return
-    the zero vector if none of the words inside of the phrase exist in the model and thus no average can be made.
+    Raises:
+        ConnectionError: if pages that could change the answer could not be fetched (see async_bfs_paths)
+
+    Returns:
+        List[List[str]]: the list of optimal paths between the source and target articles
+    """
+    return asyncio.run(async_bfs_paths(source, target, concurrency, all_paths))
+
+def concurrent_bfs_length(source : str, target : str, concurrency : int = 20) -> int:
+    """Same as bfs_length but for live wikipedia with every frontier layer fetched concurrently.
+    Will return -1 if no path exists.
 
     Args:
-        phrase (str): the phrase being searched
-        model (KeyedVectors): the vector embedding model
+        source (str): the url for the start page
+        target (str): the url for the end page
+        concurrency (int, optional): the maximum number of requests in flight. Defaults to 20.
+
+    Raises:
+        ConnectionError: if pages that could change the answer could not be fetched (see async_bfs_paths)
 
     Returns:
-        np.ndarray: the final phrase vector being output
+        int: the length of the optimal path
     """
-    if phrase in  model:
-        return model.get_vector(phrase)
-
-    fragments = phrase.replace("_"," ").split(" ")
-    vec = []
-
-    for piece in fragments:
-        try:
-            if piece in model:
-                vec.append(model.get_vector(piece))
-            elif piece.lower() in model:
-                vec.append(model.get_vector(piece.lower()))
-            fragment_vec = model.get_vector(piece)
-            return fragment_vec
-        except KeyError:
-            continue
-    if vec != []:
-        return np.mean(vec, axis=0)
-    else:
-        return np.zeros(model.vector_size)
+    paths = asyncio.run(async_bfs_paths(source, target, concurrency, all_paths=False))
+    return len(paths[0]) - 1 if paths else -1
+
+
+################################################ Word2Vec Search ################################################
+
+def _prescore(candidates : List[str], positions : List[int], scores : np.ndarray, prefetcher : "wiki.LinkPrefetcher" = None):
+    """hands the best few of the candidates that could be scored cheaply (at the given positions) to the prefetcher,
+    so their pages download while the rest are being scored"""
+    if prefetcher is None or not positions or len(positions) == len(candidates):
+        return
+    ranking = np.argsort(-scores, kind='stable')[:prefetcher.max_pending]
+    prefetcher.prefetch([candidates[positions[i]] for i in ranking])
+
+def _choose(candidates : List[str], scores : np.ndarray, prefetcher : "wiki.LinkPrefetcher" = None) -> str:
+    """picks the best scored candidate and hands the runners up to the prefetcher. The chosen page is fetched right
+    away by the caller (or taken from the prefetcher if its download already started)."""
+    if prefetcher is None:
+        return candidates[int(np.argmax(scores))]
+    # stable, so that ties go to the same candidate argmax picks
+    ranking = np.argsort(-scores, kind='stable')[:prefetcher.max_pending + 1]
+    prefetcher.prefetch([candidates[i] for i in ranking[1:]])
+    return candidates[int(ranking[0])]
 
 # first implementation that actually plays the game
-def word2vec_search(start : str,target : str, model : KeyedVectors) -> List[str]:
+def word2vec_search(start : str,target : str, model : KeyedVectors, index : EmbeddingIndex = None, prefetch : int = 0) -> List[str]:
     """A greedy approach to the wikiGame which uses article name vector embeddings. The algorithm
     works by always traversing to the adjacent article whose name vector has the highest cosine similarity to
     the target article's name vector.
@@ -127,46 +443,56 @@ def word2vec_search(start : str,target : str, model : KeyedVectors) -> List[str]
         start (str): the url for the start page
         target (str): the url for the end page
         model (KeyedVectors): the vector embedding used
+        index (EmbeddingIndex, optional): a (possibly prebuilt) index of the articles' normalized embeddings,
+                                          articles missing from it are embedded with the model on first use.
+                                          Defaults to a new empty index over the model.
+        prefetch (int, optional): the number of best scored candidates whose pages are fetched in the background
+                                  every hop (see wikiLinkRetrieval.LinkPrefetcher), 0 fetches the chosen article
+                                  only. Defaults to 0.
 
     Returns:
         List[str]: the path from the start page to the end page
     """
-    target_vec = phrase_to_vec(wiki.clean_wiki_link(target),model)
-    target_norm = np.linalg.norm(target_vec)
+    if index is None:
+        index = EmbeddingIndex.from_keyed_vectors(model)
+    elif index.embed is None:
+        index.embed = PhraseEmbedder(model, wiki.clean_wiki_link)
 
-    def target_cosine_sim(node_vec):
-        node_norm = np.linalg.norm(node_vec)
-        if node_norm*target_norm > 0:
-            return np.dot(node_vec,target_vec)/(node_norm*target_norm)
-        else:
-            return 0
+    start, target = canonicalize(start), canonicalize(target)
+    target_vec = index.vector(target)
+
+    prefetcher = wiki.LinkPrefetcher(prefetch) if prefetch else None
+    get_links = prefetcher.get_adj_wiki if prefetcher else wiki.get_adj_wiki
 
-    # each element in the queue forms a tuple (distance_to_target, current_node, current_path)
     seen = set()
     path = []
     current = start
 
-    while current != None:
-        path.append(current)
-        seen.add(current)
+    with prefetcher if prefetcher else nullcontext():
+        while current != None:
+            path.append(current)
+            seen.add(current)
+
+            if current == target:
+                return path + [current]
 
-        if current == target:
-            return path + [current]
+            neighbours = get_links(current)
 
-        neighbours = wiki.get_adj_wiki(current)
+            if target in neighbours:
+                return path + [target]
 
-        if target in neighbours:
-            return path + [target]
-        
-        max_sim = -1
-        current = None
-        for node in neighbours:
-            if node not in seen:
-                node_vec = phrase_to_vec(wiki.clean_wiki_link(node), model)
-                node_sim = target_cosine_sim(node_vec)
-                if max_sim == 0 or max_sim < node_sim:
-                    max_sim = node_sim
-                    current = node
+            candidates = [node for node in neighbours if node not in seen]
+            if not candidates:
+                break
+
+            if prefetcher is not None:
+                # the articles already in the index score for free, the others have to be embedded first
+                known = [i for i, node in enumerate(candidates) if node in index]
+                _prescore(candidates, known, index.matrix([candidates[i] for i in known]) @ target_vec, prefetcher)
+
+            # one gather + one matrix-vector product scores every candidate at once
+            similarities = index.matrix(candidates) @ target_vec
+            current = _choose(candidates, similarities, prefetcher)
 
     print("Dead end reached!")
     return path
@@ -174,8 +500,8 @@ def word2vec_search(start : str,target : str, model : KeyedVectors) -> List[str]
 ################################################ Transformer Search ################################################
 
 
-# first implementation that actually plays the game
-def transformer_search(start : str,target : str, model : SentenceTransformer) -> List[str]:
+def transformer_search(start : str,target : str, model : SentenceTransformer, cache : EncoderCache = None,
+                       prefetch : int = 0) -> List[str]:
     """A greedy approach to the wikiGame which uses article name vector embeddings. The algorithm
     works by always traversing to the adjacent article whose name vector has the highest cosine similarity to
     the target article's name vector.
@@ -183,49 +509,96 @@ def transformer_search(start : str,target : str, model : SentenceTransformer) ->
     Args:
         start (str): the url for the start page
         target (str): the url for the end page
-        model (KeyedVectors): the vector embedding used
+        model (SentenceTransformer): the vector embedding used
+        cache (EncoderCache, optional): the title vector cache in front of the model, pass a persistent one to reuse
+                                        vectors across games. Defaults to a new in memory cache.
+        prefetch (int, optional): the number of best scored candidates whose pages are fetched in the background
+                                  every hop (see wikiLinkRetrieval.LinkPrefetcher), 0 fetches the chosen article
+                                  only. Defaults to 0.
 
     Returns:
         List[str]: the path from the start page to the end page
     """
-    target_vec = model.encode(wiki.clean_wiki_link(target))
-    target_norm = np.linalg.norm(target_vec)
+    if cache is None:
+        cache = EncoderCache(model)
 
-    def target_cosine_sim(node_vec):
-        node_norm = np.linalg.norm(node_vec)
-        if node_norm*target_norm > 0:
-            return np.dot(node_vec,target_vec)/(node_norm*target_norm)
-        else:
-            return 0
+    start, target = canonicalize(start), canonicalize(target)
+    target_vec = cache.unit_vectors([wiki.clean_wiki_link(target)])[0]
+
+    prefetcher = wiki.LinkPrefetcher(prefetch) if prefetch else None
+    get_links = prefetcher.get_adj_wiki if prefetcher else wiki.get_adj_wiki
 
-    # each element in the queue forms a tuple (distance_to_target, current_node, current_path)
     seen = set()
     path = []
     current = start
 
-    while current != None:
-        print(wiki.clean_wiki_link(current))
-        path.append(current)
-        seen.add(current)
+    with prefetcher if prefetcher else nullcontext():
+        while current != None:
+            print(wiki.clean_wiki_link(current))
+            path.append(current)
+            seen.add(current)
 
-        if current == target:
-            return path + [current]
+            if current == target:
+                return path + [current]
 
-        neighbours = wiki.get_adj_wiki(current)
+            neighbours = get_links(current)
 
-        if target in neighbours:
-            return path + [target]
-        
-        max_sim = -1
-        current = None
+            if target in neighbours:
+                return path + [target]
 
-        for node in neighbours:
-            if node not in seen:
-                node_vec = model.encode(wiki.clean_wiki_link(node))
-                node_sim = target_cosine_sim(node_vec)
-                if max_sim == 0 or max_sim < node_sim:
-                    max_sim = node_sim
-                    current = node
+            candidates = [node for node in neighbours if node not in seen]
+            if not candidates:
+                break
+
+            titles = [wiki.clean_wiki_link(node) for node in candidates]
+            if prefetcher is not None:
+                # the titles encoded on earlier hops (or games) score for free while the model encodes the rest
+                known, vectors = cache.cached_unit_vectors(titles)
+                _prescore(candidates, known, vectors @ target_vec if known else vectors, prefetcher)
+
+            # every unseen title is encoded in one batch and all candidates are scored with one matrix-vector product
+            similarities = cache.unit_vectors(titles) @ target_vec
+            current = _choose(candidates, similarities, prefetcher)
 
     print("Dead end reached!")
-    return path
\ No newline at end of file
+    return path
+
+################################################ Landmark Search ################################################
+
+def landmark_search(start : str, target : str, G : CSRGraph, landmarks : LandmarkIndex) -> List[str]:
+    """A greedy approach to the wikiGame which uses graph distances instead of title similarity. The algorithm
+    always traverses to the adjacent article with the smallest landmark distance estimate to the target (the length
+    of the shortest path through a landmark) while that estimate keeps going down. Once no neighbour improves on it
+    (usually when standing on a landmark) the rest of the path through the best landmark is taken, so the game never
+    takes more jumps than the start's estimate.
+
+    Args:
+        start (str): the url for the start page
+        target (str): the url for the end page
+        G (CSRGraph): the graph the game is played on
+        landmarks (LandmarkIndex): a landmark index over G
+
+    Returns:
+        List[str]: the path from the start page to the end page
+    """
+    if not (G.has_node(start) and G.has_node(target)):
+        return [start]
+    current, goal = G.id(start), G.id(target)
+    path = [current]
+    estimate = float(landmarks.upper_bounds(current, goal))
+
+    while current != goal and np.isfinite(estimate):
+        neighbours = G.out_neighbors(current)
+        # every neighbour is scored with one gather over the landmark tables
+        estimates = landmarks.upper_bounds(neighbours, goal) if len(neighbours) else np.array([np.inf])
+        best = int(np.argmin(estimates))
+        if estimates[best] < estimate:
+            current, estimate = int(neighbours[best]), float(estimates[best])
+            path.append(current)
+        else:
+            path.extend(int(node) for node in landmarks.path(current, goal)[1:])
+            current = path[-1]
+
+    if current != goal:
+        print("Dead end reached!")
+    return [G.url(node) for node in path]
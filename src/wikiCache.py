@@ -0,0 +1,324 @@
+import sqlite3                        # on disk storage for the cache
+import zlib                           # compresses the raw html tier
+import hashlib                        # content hash of the raw html
+import time                           # timestamps for ttl and lru eviction
+import re                             # regex library
+from typing import Set,Dict,Tuple,Optional # just needed for signatures/type hinting
+from canonicalUrls import normalize_url      # the cache keys
+
+_REVISION_PATTERN = re.compile(rb'"wgRevisionId":(\d+)')
+
+# the cache is keyed by normalized article url
+canonical_url = normalize_url
+
+def extract_revision(content : bytes) -> Optional[str]:
+    """Given the bytes of a wikipedia article will return the revision id embedded in the page's config, or None
+    if the page doesn't have one.
+
+    Args:
+        content (bytes): the content of the wikipedia page
+
+    Returns:
+        Optional[str]: the revision id of the page
+    """
+    match = _REVISION_PATTERN.search(content)
+    return match.group(1).decode() if match else None
+
+class WikiCache:
+    """Persistent SQLite backed cache for wikipedia pages. Keeps two tiers keyed by canonical article url,
+    the parsed adjacency sets (one per parser) and optionally the zlib compressed raw html so that the links can
+    be recovered with any parser without going back to the network. Entries older than the ttl are treated as misses,
+    entries whose revision doesn't match the requested one are invalidated and the least recently used entries are
+    evicted once the cache grows past max_bytes. With revalidate the fetch functions of wikiLinkRetrieval ask the
+    wiki's api for the current revision of the pages they look up (see wikiLinkRetrieval.get_revisions), so edited
+    articles are refetched.
+
+    The stored size is kept as a running total, so the tables are only scanned once it goes past max_bytes, and the
+    access times of hits are written in batches of access_batch (and on flush/close) rather than on every hit.
+    """
+
+    def __init__(self,
+                 path : str = "wikiCache.sqlite",
+                 ttl : float = None,
+                 max_bytes : int = 1 << 30,
+                 store_html : bool = True,
+                 compression_level : int = 6,
+                 revalidate : bool = False,
+                 access_batch : int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.store_html = store_html
+        self.compression_level = compression_level
+        self.revalidate = revalidate
+        self.access_batch = access_batch
+
+        self.hits = 0       # served from the adjacency tier
+        self.html_hits = 0  # reparsed from the raw html tier
+        self.misses = 0     # had to go to the network
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS links (
+                                       url TEXT NOT NULL,
+                                       parser TEXT NOT NULL,
+                                       links TEXT NOT NULL,
+                                       revision TEXT,
+                                       fetched_at REAL NOT NULL,
+                                       last_access REAL NOT NULL,
+                                       size INTEGER NOT NULL,
+                                       PRIMARY KEY (url, parser))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                       url TEXT PRIMARY KEY,
+                                       html BLOB NOT NULL,
+                                       digest TEXT NOT NULL,
+                                       revision TEXT,
+                                       fetched_at REAL NOT NULL,
+                                       last_access REAL NOT NULL,
+                                       size INTEGER NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS links_lru ON links (last_access)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_lru ON pages (last_access)")
+        self.connection.commit()
+
+        # running total of the stored bytes, rescanned when it goes past max_bytes (other processes may share the file)
+        self._bytes = self._scan_size()
+        # access times of the hits not written yet, (url, parser) -> time and url -> time
+        self._link_accesses : Dict[Tuple[str,str],float] = {}
+        self._page_accesses : Dict[str,float] = {}
+
+    def _is_stale(self, fetched_at : float, stored_revision : Optional[str], revision : Optional[str]) -> bool:
+        if self.ttl is not None and time.time() - fetched_at > self.ttl:
+            return True
+        return revision is not None and stored_revision != revision
+
+    def _accessed(self):
+        if len(self._link_accesses) + len(self._page_accesses) >= self.access_batch:
+            self.flush()
+
+    def get_links(self, url : str, parser : str, revision : str = None) -> Optional[Set[str]]:
+        """Looks up the adjacency set of a page in the adjacency tier, does not update the hit/miss counts.
+
+        Args:
+            url (str): the url of the wikipedia page
+            parser (str): the name of the parser used to build the adjacency set
+            revision (str, optional): if given, entries for any other revision are invalidated. Defaults to None.
+
+        Returns:
+            Optional[Set[str]]: the set of adjacent urls or None if the page isn't cached (or is stale)
+        """
+        key = canonical_url(url)
+        row = self.connection.execute("SELECT links, revision, fetched_at, size FROM links WHERE url = ? AND parser = ?",
+                                      (key, parser)).fetchone()
+        if row is None:
+            return None
+        if self._is_stale(row[2], row[1], revision):
+            self.connection.execute("DELETE FROM links WHERE url = ? AND parser = ?", (key, parser))
+            self.connection.commit()
+            self._bytes -= row[3]
+            self._link_accesses.pop((key, parser), None)
+            return None
+
+        self._link_accesses[(key, parser)] = time.time()
+        self._accessed()
+        return set(row[0].split("\n")) if row[0] else set()
+
+    def get_html(self, url : str, revision : str = None) -> Optional[bytes]:
+        """Looks up the raw html of a page in the html tier, does not update the hit/miss counts.
+
+        Args:
+            url (str): the url of the wikipedia page
+            revision (str, optional): if given, entries for any other revision are invalidated. Defaults to None.
+
+        Returns:
+            Optional[bytes]: the html of the page or None if the page isn't cached (or is stale)
+        """
+        key = canonical_url(url)
+        row = self.connection.execute("SELECT html, revision, fetched_at, size FROM pages WHERE url = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self._is_stale(row[2], row[1], revision):
+            self.connection.execute("DELETE FROM pages WHERE url = ?", (key,))
+            self.connection.commit()
+            self._bytes -= row[3]
+            self._page_accesses.pop(key, None)
+            return None
+
+        self._page_accesses[key] = time.time()
+        self._accessed()
+        return zlib.decompress(row[0])
+
+    def contains(self, url : str, parser : str) -> bool:
+        """Tells whether lookup would find the page, without counting a hit or a miss or touching its access time.
+
+        Args:
+            url (str): the url of the wikipedia page
+            parser (str): the name of the parser used to build the adjacency set
+
+        Returns:
+            bool: True if the page's links or its html are cached and fresh
+        """
+        key = canonical_url(url)
+        rows = self.connection.execute("""SELECT fetched_at, revision FROM links WHERE url = ? AND parser = ?
+                                          UNION ALL SELECT fetched_at, revision FROM pages WHERE url = ?""", (key, parser, key))
+        return any(not self._is_stale(fetched_at, revision, None) for fetched_at, revision in rows)
+
+    def lookup(self, url : str, parser, revision : str = None) -> Optional[Set[str]]:
+        """Consults both tiers for the adjacency set of a page, first the parsed links and then the raw html
+        (which is reparsed and written back to the adjacency tier), counting the result as a hit or a miss.
+
+        Args:
+            url (str): the url of the wikipedia page
+            parser (Callable[[bytes],Set[str]]): the parser used to build the adjacency set
+            revision (str, optional): if given, entries for any other revision are invalidated. Defaults to None.
+
+        Returns:
+            Optional[Set[str]]: the set of adjacent urls or None on a miss
+        """
+        links = self.get_links(url, parser.__name__, revision)
+        if links is not None:
+            self.hits += 1
+            return links
+
+        html = self.get_html(url, revision)
+        if html is not None:
+            links = parser(html)
+            self.put_links(url, parser.__name__, links, extract_revision(html))
+            self.html_hits += 1
+            return links
+
+        self.misses += 1
+        return None
+
+    def put_links(self, url : str, parser : str, links : Set[str], revision : str = None):
+        """Stores the adjacency set of a page in the adjacency tier.
+
+        Args:
+            url (str): the url of the wikipedia page
+            parser (str): the name of the parser used to build the adjacency set
+            links (Set[str]): the set of adjacent urls
+            revision (str, optional): the revision of the page the links came from. Defaults to None.
+        """
+        key = canonical_url(url)
+        now = time.time()
+        serialized = "\n".join(sorted(links))
+        replaced = self.connection.execute("SELECT size FROM links WHERE url = ? AND parser = ?", (key, parser)).fetchone()
+        self.connection.execute("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (key, parser, serialized, revision, now, now, len(serialized)))
+        self.connection.commit()
+        self._bytes += len(serialized) - (replaced[0] if replaced else 0)
+        self.evict()
+
+    def put_html(self, url : str, content : bytes):
+        """Stores the compressed raw html of a page in the html tier, if the page is already stored with the same
+        content only its timestamps are refreshed.
+
+        Args:
+            url (str): the url of the wikipedia page
+            content (bytes): the content of the wikipedia page
+        """
+        key = canonical_url(url)
+        now = time.time()
+        digest = hashlib.sha1(content).hexdigest()
+
+        updated = self.connection.execute("UPDATE pages SET fetched_at = ?, last_access = ? WHERE url = ? AND digest = ?",
+                                          (now, now, key, digest)).rowcount
+        if not updated:
+            compressed = zlib.compress(content, self.compression_level)
+            replaced = self.connection.execute("SELECT size FROM pages WHERE url = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (key, compressed, digest, extract_revision(content), now, now, len(compressed)))
+            self._bytes += len(compressed) - (replaced[0] if replaced else 0)
+        self.connection.commit()
+        self.evict()
+
+    def store(self, url : str, parser, content : bytes, links : Set[str]):
+        """Stores a freshly fetched page, its links always and its raw html if the html tier is enabled.
+
+        Args:
+            url (str): the url of the wikipedia page
+            parser (Callable[[bytes],Set[str]]): the parser used to build the adjacency set
+            content (bytes): the content of the wikipedia page
+            links (Set[str]): the set of adjacent urls
+        """
+        if self.store_html:
+            self.put_html(url, content)
+        self.put_links(url, parser.__name__, links, extract_revision(content))
+
+    def invalidate(self, url : str):
+        """Removes every entry for a page from both tiers.
+
+        Args:
+            url (str): the url of the wikipedia page
+        """
+        key = canonical_url(url)
+        for table in ("links", "pages"):
+            self._bytes -= self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table} WHERE url = ?", (key,)).fetchone()[0]
+            self.connection.execute(f"DELETE FROM {table} WHERE url = ?", (key,))
+        self.connection.commit()
+        self._link_accesses = {entry : at for entry, at in self._link_accesses.items() if entry[0] != key}
+        self._page_accesses.pop(key, None)
+
+    def size(self) -> int:
+        """
+        Returns:
+            int: the number of bytes of links and compressed html currently stored
+        """
+        return self._bytes
+
+    def _scan_size(self) -> int:
+        links_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM links").fetchone()[0]
+        pages_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        return links_size + pages_size
+
+    def flush(self):
+        """Writes the access times of the hits since the last flush, which the lru eviction goes by."""
+        link_accesses, self._link_accesses = self._link_accesses, {}
+        page_accesses, self._page_accesses = self._page_accesses, {}
+        if not (link_accesses or page_accesses):
+            return
+        self.connection.executemany("UPDATE links SET last_access = ? WHERE url = ? AND parser = ?",
+                                    [(at, url, parser) for (url, parser), at in link_accesses.items()])
+        self.connection.executemany("UPDATE pages SET last_access = ? WHERE url = ?",
+                                    [(at, url) for url, at in page_accesses.items()])
+        self.connection.commit()
+
+    def evict(self):
+        """Removes the least recently used entries (across both tiers) until the cache fits in max_bytes."""
+        if self._bytes <= self.max_bytes:
+            return
+        self.flush()
+        self._bytes = self._scan_size()
+        excess = self._bytes - self.max_bytes
+        if excess <= 0:
+            return
+
+        rows = self.connection.execute("""SELECT 'links', url, parser, size, last_access FROM links
+                                          UNION ALL
+                                          SELECT 'pages', url, NULL, size, last_access FROM pages
+                                          ORDER BY last_access""")
+        for table, url, parser, size, _ in rows.fetchall():
+            if excess <= 0:
+                break
+            if table == 'links':
+                self.connection.execute("DELETE FROM links WHERE url = ? AND parser = ?", (url, parser))
+            else:
+                self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+            excess -= size
+            self._bytes -= size
+        self.connection.commit()
+
+    def stats(self) -> Dict[str,int]:
+        """
+        Returns:
+            Dict[str,int]: the hit/miss counts since the cache was opened along with the number of stored entries
+        """
+        return {'hits' : self.hits,
+                'html_hits' : self.html_hits,
+                'misses' : self.misses,
+                'links_entries' : self.connection.execute("SELECT COUNT(*) FROM links").fetchone()[0],
+                'page_entries' : self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0],
+                'bytes' : self.size()}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
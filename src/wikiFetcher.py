@@ -0,0 +1,97 @@
+import requests                                 # sends the HTTP requests
+from requests.adapters import HTTPAdapter       # connection pool per host
+from urllib3.util.retry import Retry            # retry/backoff policy
+from typing import Tuple,Union                  # just needed for signatures/type hinting
+
+# brotli is only advertised when urllib3 is able to decode it
+try:
+    import brotli # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi # noqa: F401
+        _ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        _ACCEPT_ENCODING = "gzip, deflate"
+
+# wikipedia asks that automated clients identify themselves
+DEFAULT_USER_AGENT = "wikiGameBot/0.1 (https://github.com/Pablo-CarB/wikiGameBot)"
+
+class WikiFetcher:
+    """Synchronous page fetcher built on a single pooled keep-alive requests.Session, so that repeated fetches
+    (like the ones made by the searches) reuse the same TCP/TLS connections instead of paying a handshake per article.
+    Requests answered with 429 or 5xx are retried with exponential backoff (honouring Retry-After) and compressed
+    responses are requested and decoded transparently.
+    """
+
+    def __init__(self,
+                 pool_size : int = 10,
+                 timeout : Union[float,Tuple[float,float]] = (5.0, 30.0),
+                 retries : int = 5,
+                 backoff_factor : float = 0.5,
+                 status_forcelist : Tuple[int,...] = (429, 500, 502, 503, 504),
+                 user_agent : str = DEFAULT_USER_AGENT):
+        """
+        Args:
+            pool_size (int, optional): the number of keep-alive connections kept per host. Defaults to 10.
+            timeout (float | Tuple[float,float], optional): the (connect, read) timeout in seconds. Defaults to (5.0, 30.0).
+            retries (int, optional): the number of retries on connection errors and retryable statuses. Defaults to 5.
+            backoff_factor (float, optional): the base of the exponential backoff between retries. Defaults to 0.5.
+            status_forcelist (Tuple[int,...], optional): the statuses that are retried. Defaults to (429, 500, 502, 503, 504).
+            user_agent (str, optional): the User-Agent sent with every request. Defaults to DEFAULT_USER_AGENT.
+        """
+        self.timeout = timeout
+        self.requests_made = 0
+
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=status_forcelist,
+                      allowed_methods=frozenset({"GET", "HEAD"}),
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent" : user_agent,
+                                     "Accept-Encoding" : _ACCEPT_ENCODING,
+                                     "Connection" : "keep-alive"})
+
+    def get(self, url : str, **kwargs) -> requests.Response:
+        """Sends a GET request through the pooled session.
+
+        Args:
+            url (str): the url being requested
+            **kwargs: passed through to requests.Session.get
+
+        Raises:
+            requests.HTTPError: if the response still has an error status once the retries are exhausted
+
+        Returns:
+            requests.Response: the response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self.requests_made += 1
+        response = self.session.get(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def fetch(self, url : str) -> bytes:
+        """
+        Args:
+            url (str): the url of the page
+
+        Returns:
+            bytes: the (decompressed) content of the page
+        """
+        return self.get(url).content
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
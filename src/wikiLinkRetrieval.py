@@ -1,11 +1,22 @@
 import requests                       # sends the HTTP requests
 from bs4 import BeautifulSoup         # is what can parse HTML
-from typing import List,Set,Dict      # just needed for signatures/type hinting  
+from typing import List,Set,Dict,Tuple,Iterator,AsyncIterator,Iterable # just needed for signatures/type hinting  
 from _collections_abc import Callable # more type hinting    
-from urllib.parse import unquote      # needed for correctly formatting articles names 
+from urllib.parse import unquote, urlsplit # needed for correctly formatting articles names 
 import asyncio                        # needed for concurrency
 import aiohttp                        # needed for concurrent HTTP requests
 import re                             # regex library
+import json                           # the fetch daemon's streamed results
+import time                           # retry backoff
+from contextlib import aclosing       # closes the single url fetch early
+from collections import OrderedDict   # bounded prefetch cache
+from dataclasses import dataclass     # structured fetch results
+from concurrent.futures import Future, ThreadPoolExecutor # background page downloads
+from wikiCache import WikiCache, canonical_url # persistent page/adjacency cache
+import canonicalUrls                  # redirects learned by the fetch daemon
+from canonicalUrls import canonicalize, canonical_links, learn_redirect # one url per article, redirects resolved
+from wikiFetcher import WikiFetcher   # pooled keep-alive session for synchronous fetches
+from rateLimiter import AdaptiveLimiter, HostLimiters, RETRYABLE_STATUSES, parse_retry_after # polite async fetching
 
 ############################## Parsers/ HTML Wiki Link Extractors  ##############################
 
@@ -87,15 +98,206 @@ def extract_links(content: bytes) -> Set[str]:
                 cleaned_links.add('https://en.wikipedia.org' + base_link)
     return cleaned_links
 
+# precompiled byte patterns for the streaming extractor
+_MAIN_DIV = re.compile(rb'<div[^>]*class="[^"]*mw-parser-output[^"]*"[^>]*>')
+_END_SECTION = re.compile(rb'<(?:h2[^>]*id="(?:See_also|References|Further_reading|External_links|Notes|Bibliography)"'
+                          rb'|div[^>]*class="[^"]*reflist[^"]*")', re.IGNORECASE)
+# only the tags that change the extractor's state (or carry links) are tokenized, everything else is skipped by the regex engine
+_TAG = re.compile(rb'<(/?)(div|h2|sup|span|a)\b([^>]*)>', re.IGNORECASE)
+# these only ever run over the attribute section of a single tag
+_REFLIST_CLASS = re.compile(rb'class="[^"]*reflist[^"]*"', re.IGNORECASE)
+_REFERENCE_CLASS = re.compile(rb'class="[^"]*reference[^"]*"')
+_END_SECTION_ID = re.compile(rb'id="(?:See_also|References|Further_reading|External_links|Notes|Bibliography)"', re.IGNORECASE)
+_WIKI_HREF = re.compile(rb'href="(/wiki/[^":]+)"')
+
+def iter_links(content: bytes) -> Iterator[str]:
+    """Single pass tokenizer version of extract_links. Jumps to the main content div and walks its tags once, keeping
+    track of whether it is inside a <sup> citation or inside a reference span, and stops as soon as it reaches the first
+    end section (See also, References, reflist div...). Links are yielded as they are found so no decoded copy of
+    the page is ever built.
+
+    Args:
+        content (bytes): the content of the wikipedia page
+
+    Raises:
+        RuntimeError: if the main content section of the page can't be found
+
+    Yields:
+        str: the wikipedia urls hyperlinked in the page (may contain duplicates)
+    """
+    main_body = _MAIN_DIV.search(content)
+
+    if not main_body:
+        raise RuntimeError("unable to find main content section")
+
+    # an end section before the main content means there is nothing to keep (same as extract_links' cutoff)
+    if _END_SECTION.search(content, 0, main_body.start()):
+        return
+
+    in_sup = False       # inside <sup>...</sup>, skipped up to the next closing </sup>
+    in_ref_span = False  # inside <span class="...reference...">...</span>, skipped up to the next closing </span>
+
+    for tag in _TAG.finditer(content, main_body.end()):
+        closing, name, attrs = tag.groups()
+        name = name.lower()
+
+        if not closing and ((name == b'h2' and _END_SECTION_ID.search(attrs))
+                            or (name == b'div' and _REFLIST_CLASS.search(attrs))):
+            return
+
+        # citations in sup tags take priority (they are removed before the reference spans)
+        if in_sup:
+            if closing and name == b'sup':
+                in_sup = False
+            continue
+        if not closing and name == b'sup':
+            in_sup = True
+            continue
+
+        if in_ref_span:
+            if closing and name == b'span':
+                in_ref_span = False
+            continue
+        if not closing and name == b'span' and _REFERENCE_CLASS.search(attrs):
+            in_ref_span = True
+            continue
+
+        if not closing and name == b'a':
+            for link in _WIKI_HREF.findall(attrs):
+                # Strip fragment (everything after #) to get base page
+                base_link = link.split(b'#')[0]
+                if base_link:
+                    yield 'https://en.wikipedia.org' + base_link.decode('utf-8', errors='ignore')
+
+def stream_extract_links(content: bytes) -> Set[str]:
+    """Drop in replacement for extract_links built on iter_links, gives the same set of links but only scans
+    the page once and never decodes or copies it.
+
+    Args:
+        content (bytes): the content of the wikipedia page
+
+    Returns:
+        Set[str]: the set of wikipedia urls hyperlinked in the page
+    """
+    return set(iter_links(content))
+
 ############################## Adjacent Article Functions  ##############################
 
-def get_adj_wiki(url : str, parser : Callable[[bytes],Set[str]] = extract_links) -> Set[str]:
+# cache consulted by every fetch function when no cache is passed explicitly, see use_cache
+default_cache : WikiCache = None
+
+def use_cache(path : str = "wikiCache.sqlite", redirects : bool = True, **kwargs) -> WikiCache:
+    """Opens (or creates) the on disk cache at the given path and makes it the default cache for every fetch function.
+    The pages are cached under the article they belong to, so by default the redirects learned are kept in the same
+    file (see canonicalUrls.use_redirects), otherwise a redirect url would miss the cache in every new session.
+
+    Args:
+        path (str, optional): the path of the sqlite file. Defaults to "wikiCache.sqlite".
+        redirects (bool, optional): also makes the file the default redirect map. Defaults to True.
+        **kwargs: passed through to WikiCache (ttl, max_bytes, store_html, compression_level, revalidate)
+
+    Returns:
+        WikiCache: the cache now in use
+    """
+    global default_cache
+    default_cache = WikiCache(path, **kwargs)
+    if redirects:
+        canonicalUrls.use_redirects(path)
+    return default_cache
+
+# host every request is sent to instead of the one in the url (e.g. a local mockWikiServer), see use_mirror
+default_mirror : str = None
+
+def use_mirror(base : str = None):
+    """Sends every request made by the fetch functions (pages and api calls) to another host, the urls themselves
+    (cache keys, extracted links, search paths...) are left untouched. Used to point the searches and crawlers at a
+    local MockWikiServer.
+
+    Args:
+        base (str, optional): the scheme and host requests are sent to, e.g. "http://127.0.0.1:8080".
+                              Defaults to None (requests go to the url's own host).
+    """
+    global default_mirror
+    default_mirror = base.rstrip("/") if base else None
+
+def request_url(url : str) -> str:
+    """
+    Returns:
+        str: the url a request for the given url is actually sent to (see use_mirror)
+    """
+    if default_mirror is None:
+        return url
+    parts = urlsplit(url)
+    return default_mirror + parts.path + (f"?{parts.query}" if parts.query else "")
+
+# local fetchDaemon every fetch goes through instead of the network, see use_daemon
+default_daemon : str = None
+
+def use_daemon(base : str = None):
+    """Sends the link fetches (get_adj_wiki, async_fetch_adj_wikis and async_iter_adj_wikis, with the default parser)
+    to a running fetchDaemon, which shares one session, its rate limiters and its in flight requests between every
+    process using it. Caches are still consulted first.
+
+    Args:
+        base (str, optional): the daemon's url, e.g. "http://127.0.0.1:8765". Defaults to None (fetch directly).
+    """
+    global default_daemon
+    default_daemon = base.rstrip("/") if base else None
+
+# where the links come from, "html" parses the article pages and "api" asks the wiki's api for them, see use_backend
+default_backend : str = "html"
+
+def use_backend(backend : str = "html"):
+    """Selects where every fetch function gets the links from when no backend is passed explicitly.
+
+    Args:
+        backend (str, optional): "html" downloads the rendered articles and extracts the links of their main text,
+                                 "api" asks the MediaWiki action api for the article links only (prop=links, many
+                                 articles per request, see LinksQuery). Defaults to "html".
+
+    Raises:
+        ValueError: for an unknown backend
+    """
+    global default_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend}, expected one of {BACKENDS}")
+    default_backend = backend
+
+def _cached_links(cache : WikiCache, url : str, parser : Callable[[bytes],Set[str]], backend : str, revision : str = None) -> Set[str]:
+    """the cached links of a page for the backend, None on a miss (or if the cached page isn't at the given revision)"""
+    if cache is None:
+        return None
+    if backend == "api":
+        return cache.get_links(canonicalize(url), API_LINKS, revision)
+    return cache.lookup(canonicalize(url), parser, revision)
+
+# fetcher used by get_adj_wiki when none is passed explicitly, created on first use
+default_fetcher : WikiFetcher = None
+
+def get_default_fetcher() -> WikiFetcher:
+    """
+    Returns:
+        WikiFetcher: the shared fetcher used by get_adj_wiki, created with the default settings on first use
+    """
+    global default_fetcher
+    if default_fetcher is None:
+        default_fetcher = WikiFetcher()
+    return default_fetcher
+
+def get_adj_wiki(url : str, parser : Callable[[bytes],Set[str]] = stream_extract_links, cache : WikiCache = None,
+                 fetcher : WikiFetcher = None, backend : str = None) -> Set[str]:
     """
         Given a link to a wikipedia page, will construct a list of urls pointing to other wikipedai pages found
-        hyperlinked within the main text
+        hyperlinked within the main text. The links are canonicalized (see canonicalUrls.canonicalize) and if the page
+        turns out to be a redirect it is learned by the default redirect map. A revalidating cache is only used if the
+        cached page is at the article's latest revision (see get_revisions).
 
         Args:
             url (str): the url of the wikipedia page
+            parser (Callable[[bytes],Set[str]], optional): the link extractor. Defaults to stream_extract_links.
+            cache (WikiCache, optional): the cache consulted before going to the network. Defaults to default_cache.
+            fetcher (WikiFetcher, optional): the pooled session used for the request. Defaults to get_default_fetcher().
+            backend (str, optional): "html" or "api" (which ignores the parser), see use_backend. Defaults to default_backend.
 
         Raises:
             ConnectionError: if the wikipedia page cannot be acessed for any reason
@@ -103,56 +305,705 @@ def get_adj_wiki(url : str, parser : Callable[[bytes],Set[str]] = extract_links)
         Returns:
             List[str]: a list of urls of the wikipedia pages hyperlinked within the text of the original wikipedia page
     """
-    
+    cache = cache if cache is not None else default_cache
+    backend = backend if backend is not None else default_backend
+    fetcher = fetcher if fetcher is not None else get_default_fetcher()
+
+    revision = get_revisions([url], fetcher).get(url) if cache is not None and cache.revalidate else None
+    links = _cached_links(cache, url, parser, backend, revision)
+    if links is not None:
+        return canonical_links(links)
+
+    if backend == "api":
+        query = LinksQuery([url])
+        try:
+            while query.feed(fetcher.get(request_url(query.api), params=query.params).json()):
+                pass
+        except Exception as e:
+            raise ConnectionError(f"Could not retrieve links \nerror code : {e}")
+        result = query.results(cache)[0]
+        if not result.ok:
+            raise ConnectionError(f"Could not retrieve links \nerror code : {result.error}")
+        return result.links
+
+    if _through_daemon(parser, backend):
+        try:
+            result = _daemon_result(fetcher.get(f"{default_daemon}/links", params={'url' : url}).json())
+        except Exception as e:
+            raise ConnectionError(f"Could not reach the fetch daemon \nerror code : {e}")
+        if not result.ok:
+            raise ConnectionError(f"Could not retrieve page \nerror code : {result.error}")
+        if cache is not None:
+            cache.put_links(canonicalize(url), parser.__name__, result.links, revision)
+        return result.links
+
     # try to establish connection
     try:
-        response = requests.get(url)
+        response = fetcher.get(request_url(url))
     except Exception as e:
         print("request failed with exception:", e)
         raise ConnectionError(f"Could not retrieve page \nerror code : {e}")    
 
-    return parser(response.content)
+    return page_links(url, response.content, parser, cache)
 
-async def async_get_adj_wiki(url :str, session : aiohttp.ClientSession, parser : Callable[[bytes],Set[str]] = extract_links) -> Set[str]:
-    async with session.get(url) as response:
-        content = await response.read()
-        return {url : parser(content)}
+def page_links(url : str, content : bytes, parser : Callable[[bytes],Set[str]] = stream_extract_links, cache : WikiCache = None) -> Set[str]:
+    """Extracts the canonical links of a fetched page, learning the redirect if the page is one and storing the page
+    in the cache (if any).
 
+    Args:
+        url (str): the url the page was requested for
+        content (bytes): the page
+        parser (Callable[[bytes],Set[str]], optional): the link extractor. Defaults to stream_extract_links.
+        cache (WikiCache, optional): the cache the page is stored in. Defaults to None.
 
-async def async_get_adj_wikis_helper(urls : Set[str],batch_size : int = 20) -> Dict[str,Set[str]]:
-    
-    mapping : Dict[str,Set[str]] = {}
+    Returns:
+        Set[str]: the urls of the adjacent articles
+    """
+    # a redirect is answered with the target's page, which is cached under the target
+    article = learn_redirect(url, content)
+    links = canonical_links(parser(content))
+    if cache is not None:
+        cache.store(article, parser, content, links)
+    return links
 
-    semaphore = asyncio.Semaphore(batch_size)
+async def async_get_adj_wiki(url :str, session : aiohttp.ClientSession, parser : Callable[[bytes],Set[str]] = stream_extract_links, cache : WikiCache = None) -> Dict[str,Set[str]]:
+    """Same as get_adj_wiki for async callers, goes through async_fetch_adj_wiki (cache first, rate limited, retried).
+
+    Raises:
+        ConnectionError: if the wikipedia page cannot be acessed for any reason
+
+    Returns:
+        Dict[str,Set[str]]: the url mapped to the urls of its adjacent articles
+    """
+    result = await async_fetch_adj_wiki(url, session, parser=parser, cache=cache)
+    if not result.ok:
+        raise ConnectionError(f"Could not retrieve page {url}: {result.error}")
+    return {url : result.links}
+
+
+@dataclass
+class FetchResult:
+    """The outcome of fetching one page, either its links or the reason it failed (the last status, if any)."""
+    url : str
+    links : Set[str] = None
+    status : int = None
+    error : str = None
+    attempts : int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.links is not None
+
+    @property
+    def retryable(self) -> bool:
+        """whether the failure was the server's or the network's (429, 5xx, no response) rather than the page's"""
+        return not self.ok and (self.status is None or self.status in RETRYABLE_STATUSES)
+
+def _daemon_result(data : dict) -> FetchResult:
+    """a FetchResult from the daemon's json, learning the redirect the daemon found"""
+    if data['article'] != canonicalize(data['url']):
+        canonicalUrls.default_redirects.add(data['url'], data['article'])
+    links = canonical_links(data['links']) if data['links'] is not None else None
+    return FetchResult(data['url'], links, data['status'], data['error'], data['attempts'])
+
+def _through_daemon(parser : Callable[[bytes],Set[str]], backend : str) -> bool:
+    return default_daemon is not None and parser is stream_extract_links and backend == "html"
+
+# rate and concurrency limits shared by every async fetch, one per host
+default_limiters = HostLimiters()
+
+# the number of urls sent to the fetch daemon per request
+DAEMON_BATCH_SIZE = 50
+
+# the number of pages whose links are asked for per api query, the action api's limit for clients without bot rights
+API_BATCH_SIZE = 50
+
+async def _attempt_adj_wiki(url : str, attempt : int, session : aiohttp.ClientSession, limiter : AdaptiveLimiter,
+                            parser : Callable[[bytes],Set[str]], cache : WikiCache) -> FetchResult:
+    """one request for the page, every error ends up in the result"""
+    started = await limiter.acquire()
+    status = retry_after = content = None
+    try:
+        async with session.get(request_url(url)) as response:
+            status = response.status
+            if status in RETRYABLE_STATUSES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if status < 400:
+                content = await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return FetchResult(url, error=f"{type(e).__name__}: {e}", attempts=attempt)
+    finally:
+        await limiter.release(started, status, retry_after)
+
+    if content is None:
+        return FetchResult(url, status=status, error=f"HTTP {status}", attempts=attempt)
+    try:
+        return FetchResult(url, page_links(url, content, parser, cache), status, attempts=attempt)
+    except Exception as e:
+        return FetchResult(url, status=status, error=f"{type(e).__name__}: {e}", attempts=attempt)
+
+async def _run_query(query : "LinksQuery", session : aiohttp.ClientSession, limiter : AdaptiveLimiter) -> Tuple[int,str]:
+    """sends the query and all of its continuations, gives the last status and the error that stopped it (None once
+    the query is complete)"""
+    more = True
+    while more:
+        started = await limiter.acquire()
+        status = retry_after = data = None
+        try:
+            async with session.get(request_url(query.api), params=query.params) as response:
+                status = response.status
+                if status in RETRYABLE_STATUSES:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if status < 400:
+                    data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            return None, f"{type(e).__name__}: {e}"
+        finally:
+            await limiter.release(started, status, retry_after)
+
+        if data is None:
+            return status, f"HTTP {status}"
+        try:
+            more = query.feed(data)
+        except ValueError as e:
+            return status, str(e)
+    return status, None
+
+async def _attempt_api_links(urls : List[str], attempt : int, session : aiohttp.ClientSession, limiter : AdaptiveLimiter,
+                             cache : WikiCache) -> List[FetchResult]:
+    """one prop=links query (all of its continuations) for a batch of pages, every error ends up in the results"""
+    query = LinksQuery(urls)
+    status, error = await _run_query(query, session, limiter)
+    if error is not None:
+        return [FetchResult(url, status=status, error=error, attempts=attempt) for url in urls]
+    return query.results(cache, status, attempt)
+
+async def async_fetch_adj_wikis(urls : Iterable[str], session : aiohttp.ClientSession, limiters : HostLimiters = None,
+                                max_retries : int = 4, backoff_factor : float = 0.5, workers : int = 64,
+                                parser : Callable[[bytes],Set[str]] = stream_extract_links,
+                                cache : WikiCache = None, direct : bool = False, backend : str = None) -> AsyncIterator[FetchResult]:
+    """Fetches every url through the per host rate limiters (see rateLimiter.AdaptiveLimiter) and yields one result per
+    url, success or failure, as they finish, cached pages first. Failures worth retrying (429, 5xx, connection errors)
+    go back on the work queue after an exponential backoff, or once the limiter's Retry-After pause is over, until they
+    run out of retries. Closing the generator early cancels every request still in flight. With a fetch daemon in use
+    (see use_daemon) the urls are handed to it in batches instead, and it does the limiting and retrying. The api
+    backend asks for the links of up to API_BATCH_SIZE pages of a wiki per query, a batch is retried as a whole.
+    A revalidating cache is only used for the pages it holds at their latest revision (see async_get_revisions).
+
+    Args:
+        urls (Iterable[str]): the urls to explore
+        session (aiohttp.ClientSession): the session used for the requests
+        limiters (HostLimiters, optional): the rate and concurrency limiters. Defaults to default_limiters.
+        max_retries (int, optional): the number of retries per url. Defaults to 4.
+        backoff_factor (float, optional): the first retry waits this many seconds, every next one twice as long. Defaults to 0.5.
+        workers (int, optional): the most requests in flight whatever the limiters allow. Defaults to 64.
+        parser (Callable[[bytes],Set[str]], optional): the link extractor. Defaults to stream_extract_links.
+        cache (WikiCache, optional): the cache consulted before going to the network. Defaults to default_cache.
+        direct (bool, optional): fetches from the network even when a fetch daemon is in use. Defaults to False.
+        backend (str, optional): "html" or "api" (which ignores the parser), see use_backend. Defaults to default_backend.
+
+    Yields:
+        FetchResult: the result of every url
+    """
+    cache = cache if cache is not None else default_cache
+    limiters = limiters if limiters is not None else default_limiters
+    backend = backend if backend is not None else default_backend
+    loop = asyncio.get_running_loop()
+
+    queue : asyncio.Queue = asyncio.Queue()
+    results : asyncio.Queue = asyncio.Queue()
+    urls = list(dict.fromkeys(urls))
+    revisions = await async_get_revisions(urls, session, limiters) if cache is not None and cache.revalidate else {}
+    cached, pending = [], []
+    for url in urls:
+        links = _cached_links(cache, url, parser, backend, revisions.get(url))
+        if links is not None:
+            cached.append(FetchResult(url, canonical_links(links)))
+        else:
+            pending.append(url)
+
+    def deliver(result : FetchResult):
+        if cache is not None and result.ok:
+            cache.put_links(canonicalize(result.url), parser.__name__, result.links, revisions.get(result.url))
+        results.put_nowait(result)
+
+    async def post(batch):
+        # the daemon streams one json result per line as each page finishes
+        remaining = set(batch)
+        try:
+            async with session.post(f"{default_daemon}/links", json={'urls' : batch}) as response:
+                response.raise_for_status()
+                buffer = b""
+                async for chunk in response.content.iter_any():
+                    *lines, buffer = (buffer + chunk).split(b"\n")
+                    for line in lines:
+                        result = _daemon_result(json.loads(line))
+                        remaining.discard(result.url)
+                        deliver(result)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            error = f"fetch daemon unreachable, {type(e).__name__}: {e}"
+        else:
+            error = "fetch daemon sent no result"
+        for url in batch:
+            if url in remaining:
+                deliver(FetchResult(url, error=error))
+
+    async def worker():
+        while True:
+            batch, attempt = await queue.get()
+            limiter = limiters[request_url(batch[0])]
+            if backend == "api":
+                fetched = await _attempt_api_links(batch, attempt, session, limiter, cache)
+            else:
+                fetched = [await _attempt_adj_wiki(batch[0], attempt, session, limiter, parser, cache)]
+            retry = [result.url for result in fetched if result.retryable and attempt <= max_retries]
+            if retry:
+                # a Retry-After already holds back the whole host, otherwise these urls back off on their own
+                delay = 0 if limiter.paused_until > time.monotonic() else backoff_factor * 2 ** (attempt - 1)
+                loop.call_later(delay, queue.put_nowait, (retry, attempt + 1))
+            for result in fetched:
+                if result.url not in retry:
+                    results.put_nowait(result)
+
+    if _through_daemon(parser, backend) and not direct:
+        tasks = [asyncio.ensure_future(post(pending[i:i + DAEMON_BATCH_SIZE])) for i in range(0, len(pending), DAEMON_BATCH_SIZE)]
+    else:
+        if backend == "api":
+            # one query per batch of pages of the same wiki
+            for batch in _api_batches(pending):
+                queue.put_nowait((batch, 1))
+        else:
+            for url in pending:
+                queue.put_nowait(([url], 1))
+        tasks = [asyncio.ensure_future(worker()) for _ in range(min(workers, queue.qsize()))]
+    try:
+        for result in cached:
+            yield result
+        for _ in range(len(pending)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def async_fetch_adj_wiki(url : str, session : aiohttp.ClientSession, **kwargs) -> FetchResult:
+    """
+    Args:
+        url (str): the url of the wikipedia page
+        session (aiohttp.ClientSession): the session used for the requests
+        **kwargs: passed through to async_fetch_adj_wikis
+
+    Returns:
+        FetchResult: the links of the page, or why they couldn't be fetched
+    """
+    async with aclosing(async_fetch_adj_wikis([url], session, **kwargs)) as results:
+        async for result in results:
+            return result
+
+async def async_get_adj_wikis_helper(urls : Set[str],batch_size : int = 20, cache : WikiCache = None,
+                                     failures : Dict[str,FetchResult] = None, backend : str = None) -> Dict[str,Set[str]]:
+    mapping : Dict[str,Set[str]] = {}
+    failed = failures if failures is not None else {}
 
-    async def get_links(url):
-        async with semaphore:
-            return await async_get_adj_wiki(url,session)
-        
     async with aiohttp.ClientSession() as session:
-            tasks  = [get_links(url) for url in urls]
-            
-            # return exceptions so that whole thing doesn't fail if one url does
-            results = await asyncio.gather(*tasks, return_exceptions=True) 
+        async for result in async_fetch_adj_wikis(urls, session, workers=batch_size, cache=cache, backend=backend):
+            if result.ok:
+                mapping[result.url] = result.links
+            else:
+                failed[result.url] = result
 
-            return {k: v for r in results if isinstance(r, dict) for k, v in r.items()}
-    
-def get_adj_wiki_lists(urls : Set[str],batch_size : int = 20) -> Dict[str,Set[str]]:
+    if failed and failures is None:
+        print(f"{len(failed)} of {len(mapping) + len(failed)} pages could not be fetched:",
+              ", ".join(f"{url} ({result.error})" for url, result in list(failed.items())[:5]))
+    return mapping
+
+async def async_iter_adj_wikis(urls : Iterable[str], session : aiohttp.ClientSession, workers : int = 20,
+                               cache : WikiCache = None, failures : Dict[str,FetchResult] = None) -> AsyncIterator[Tuple[str,Set[str]]]:
+    """Fetches every url through async_fetch_adj_wikis (rate limited and retried, through the fetch daemon or the api
+    backend when in use) and yields the (url, adjacent articles) pairs in the order they finish, cached pages first.
+    The urls that still fail are left out, and reported in failures when it is given. Closing the generator early
+    (e.g. breaking out of an aclosing block) cancels every request still in flight.
+
+    Args:
+        urls (Iterable[str]): the urls to explore
+        session (aiohttp.ClientSession): the session used for the requests
+        workers (int, optional): the most requests in flight whatever the limiters allow. Defaults to 20.
+        cache (WikiCache, optional): the cache consulted before going to the network. Defaults to default_cache.
+        failures (Dict[str,FetchResult], optional): filled with the failed urls' results. Defaults to None.
+
+    Yields:
+        Tuple[str,Set[str]]: a url and the set of its adjacent articles
+    """
+    async with aclosing(async_fetch_adj_wikis(urls, session, workers=workers, cache=cache)) as results:
+        async for result in results:
+            if result.ok:
+                yield result.url, result.links
+            elif failures is not None:
+                failures[result.url] = result
+
+def get_adj_wiki_lists(urls : Set[str],batch_size : int = 20, cache : WikiCache = None,
+                       failures : Dict[str,FetchResult] = None, backend : str = None) -> Dict[str,Set[str]]:
     """Given a set of urls to explore will return a dictionary where the keys are articles in the input set
-    and the values are the sets of adjacent articles
+    and the values are the sets of adjacent articles. The requests go through the default rate limiters and are
+    retried (see async_fetch_adj_wikis), the pages that still fail are reported in failures, or printed without it.
 
     Args:
         urls (Set[str]): a set of urls to explore
-        batch_size (int, optional): the batch size used for requesting wikipedia's servers. Defaults to 20.
+        batch_size (int, optional): the most requests sent to wikipedia's servers at once. Defaults to 20.
+        cache (WikiCache, optional): the cache consulted before going to the network. Defaults to default_cache.
+        failures (Dict[str,FetchResult], optional): filled with the failed urls' results. Defaults to None.
+        backend (str, optional): "html" or "api", see use_backend. Defaults to default_backend.
 
     Returns:
         Dict[str,Set[str]]: the dictionary containing the articles in the input set 
                             as keys and the set of adjacent articles as values
     """
-    return asyncio.run(async_get_adj_wikis_helper(urls,batch_size))
+    return asyncio.run(async_get_adj_wikis_helper(urls,batch_size,cache,failures,backend))
+
+############################## Links API Backend  ##############################
+
+# the link sources selectable with use_backend
+BACKENDS = ("html", "api")
+
+# the parser name the api backend's links are cached under, they include the links outside the main text
+API_LINKS = "api_links"
+
+def _title(url : str) -> str:
+    return unquote(urlsplit(canonical_url(url)).path[len("/wiki/"):]).replace("_", " ")
+
+class LinksQuery:
+    """The prop=links query of the MediaWiki action api for a batch of articles of one wiki, which lists the article
+    links (namespace 0) of every page without downloading any html. Titles are normalized and redirects followed by
+    the api, and the redirects it reports are learned by the default redirect map. The links come from the wiki's link
+    table, so like get_backlinks they include the links outside the main text (navboxes, references...), a superset
+    of what the html parsers extract; both backends give canonical urls with known redirects resolved. The query also
+    asks for the pages' latest revision ids (prop=info), which the links are cached with.
+
+    Send query.params to query.api, feed every response in and repeat while feed returns True (continuation).
+    """
+
+    def __init__(self, urls : List[str], limit : str = "max", links : bool = True):
+        """
+        Args:
+            urls (List[str]): the urls of the articles, all on the same wiki (at most API_BATCH_SIZE of them)
+            limit (str, optional): the number of links per response over the whole batch. Defaults to "max".
+            links (bool, optional): if False only the revision ids are asked for. Defaults to True.
+        """
+        parts = urlsplit(urls[0])
+        self.base = f"{parts.scheme}://{parts.netloc}"
+        self.api = f"{self.base}/w/api.php"
+        self.requested : Dict[str,str] = {url : _title(url) for url in urls}
+        self.params = {'action' : 'query',
+                       'format' : 'json',
+                       'prop' : 'links|info' if links else 'info',
+                       'titles' : "|".join(dict.fromkeys(self.requested.values())),
+                       'redirects' : 1}
+        if links:
+            self.params.update({'plnamespace' : 0, 'pllimit' : limit})
+        self.aliases : Dict[str,str] = {}
+        self.links : Dict[str,Set[str]] = {}
+        self.lastrevids : Dict[str,str] = {}
+        self.missing : Set[str] = set()
+
+    def feed(self, data : dict) -> bool:
+        """
+        Args:
+            data (dict): a json response to the query
+
+        Raises:
+            ValueError: if the api answered with an error
+
+        Returns:
+            bool: whether there are more links to ask for (the params now hold the continuation)
+        """
+        if 'error' in data:
+            raise ValueError(f"api error {data['error'].get('code')}: {data['error'].get('info')}")
+        query = data.get('query', {})
+        for entry in query.get('normalized', []):
+            self.aliases[entry['from']] = entry['to']
+        for entry in query.get('redirects', []):
+            self.aliases[entry['from']] = entry['to']
+            canonicalUrls.default_redirects.add(title_to_url(entry['from'], self.base), title_to_url(entry['to'], self.base))
+        for page in query.get('pages', {}).values():
+            if 'missing' in page or 'invalid' in page:
+                self.missing.add(page['title'])
+                continue
+            self.links.setdefault(page['title'], set()).update(title_to_url(link['title'], self.base)
+                                                               for link in page.get('links', []))
+            if 'lastrevid' in page:
+                self.lastrevids[page['title']] = str(page['lastrevid'])
+
+        if 'continue' not in data:
+            return False
+        self.params.update(data['continue'])
+        return True
+
+    def _resolve(self, title : str) -> str:
+        # normalized then redirected, the api reports both hops
+        for _ in range(3):
+            title = self.aliases.get(title, title)
+        return title
+
+    def revisions(self) -> Dict[str,str]:
+        """
+        Returns:
+            Dict[str,str]: the latest revision id of every requested url the api knows
+        """
+        revisions = {}
+        for url, title in self.requested.items():
+            title = self._resolve(title)
+            if title in self.lastrevids:
+                revisions[url] = self.lastrevids[title]
+        return revisions
+
+    def results(self, cache : WikiCache = None, status : int = None, attempts : int = 1) -> List[FetchResult]:
+        """
+        Args:
+            cache (WikiCache, optional): the cache the links are stored in. Defaults to None.
+            status (int, optional): the status of the last response. Defaults to None.
+            attempts (int, optional): the attempt the query was. Defaults to 1.
+
+        Returns:
+            List[FetchResult]: the result of every requested url, missing articles fail with a 404
+        """
+        results = []
+        for url, title in self.requested.items():
+            title = self._resolve(title)
+            if title in self.links:
+                links = canonical_links(self.links[title])
+                if cache is not None:
+                    cache.put_links(canonicalize(url), API_LINKS, links, self.lastrevids.get(title))
+                results.append(FetchResult(url, links, status, attempts=attempts))
+            elif title in self.missing:
+                results.append(FetchResult(url, status=404, error="missing article", attempts=attempts))
+            else:
+                results.append(FetchResult(url, status=status, error="not in the api response", attempts=attempts))
+        return results
+
+def _api_batches(urls : Iterable[str]) -> Iterator[List[str]]:
+    """the urls in batches of at most API_BATCH_SIZE pages of the same wiki"""
+    by_host : Dict[str,List[str]] = {}
+    for url in urls:
+        by_host.setdefault(urlsplit(url).netloc, []).append(url)
+    for host_urls in by_host.values():
+        for i in range(0, len(host_urls), API_BATCH_SIZE):
+            yield host_urls[i:i + API_BATCH_SIZE]
+
+def get_revisions(urls : Iterable[str], fetcher : WikiFetcher = None) -> Dict[str,str]:
+    """Given links to wikipedia pages, will ask the wiki's api for the ids of their latest revisions (prop=info,
+    API_BATCH_SIZE pages per request), which a revalidating WikiCache checks its entries against. The pages the api
+    doesn't know, or whose batch fails, are left out, so their cache entries are only subject to the ttl.
+
+    Args:
+        urls (Iterable[str]): the urls of the wikipedia pages
+        fetcher (WikiFetcher, optional): the pooled session used for the requests. Defaults to get_default_fetcher().
+
+    Returns:
+        Dict[str,str]: url -> latest revision id
+    """
+    fetcher = fetcher if fetcher is not None else get_default_fetcher()
+    revisions = {}
+    for batch in _api_batches(dict.fromkeys(urls)):
+        query = LinksQuery(batch, links=False)
+        try:
+            while query.feed(fetcher.get(request_url(query.api), params=query.params).json()):
+                pass
+        except Exception:
+            continue
+        revisions.update(query.revisions())
+    return revisions
+
+async def async_get_revisions(urls : Iterable[str], session : aiohttp.ClientSession, limiters : HostLimiters = None) -> Dict[str,str]:
+    """Same as get_revisions, with every batch sent concurrently through the per host rate limiters.
+
+    Args:
+        urls (Iterable[str]): the urls of the wikipedia pages
+        session (aiohttp.ClientSession): the session used for the requests
+        limiters (HostLimiters, optional): the rate and concurrency limiters. Defaults to default_limiters.
+
+    Returns:
+        Dict[str,str]: url -> latest revision id
+    """
+    limiters = limiters if limiters is not None else default_limiters
+
+    async def batch_revisions(batch):
+        query = LinksQuery(batch, links=False)
+        _, error = await _run_query(query, session, limiters[request_url(query.api)])
+        return query.revisions() if error is None else {}
+
+    revisions = {}
+    for batch in await asyncio.gather(*(batch_revisions(batch) for batch in _api_batches(dict.fromkeys(urls)))):
+        revisions.update(batch)
+    return revisions
+
+############################## Prefetching  ##############################
+
+class LinkPrefetcher:
+    """Speculatively downloads the pages a greedy player is likely to visit next. The player hands over its best
+    candidates every hop (from a cheap prescore while it is still scoring, then its runners up), their pages are
+    requested in background threads and kept in a small bounded cache, and the next get_adj_wiki only has to parse the
+    page (a runner up is often chosen a hop or two later, when its page is already there). Downloads of candidates that
+    dropped out of the latest ranking are cancelled if they haven't started, and a page asked for before its download
+    started is fetched right away instead of waiting for a worker. Parsing, redirect learning and cache writes all
+    happen in the caller's thread. Only the plain html path is prefetched: with the api backend or a fetch daemon in
+    use (see use_backend and use_daemon) every page goes through get_adj_wiki, so the links of a game all come from
+    the same source and the daemon's shared limits and single flight still apply.
+    """
+
+    def __init__(self,
+                 max_pending : int = 3,
+                 max_cached : int = 32,
+                 parser : Callable[[bytes],Set[str]] = stream_extract_links,
+                 cache : WikiCache = None,
+                 fetcher : WikiFetcher = None):
+        """
+        Args:
+            max_pending (int, optional): the number of pages downloaded at once. Defaults to 3.
+            max_cached (int, optional): the number of downloaded (or downloading) pages kept. Defaults to 32.
+            parser (Callable[[bytes],Set[str]], optional): the link extractor. Defaults to stream_extract_links.
+            cache (WikiCache, optional): the cache consulted before prefetching. Defaults to default_cache.
+            fetcher (WikiFetcher, optional): the session the pages are downloaded with. Defaults to get_default_fetcher().
+        """
+        self.max_pending = max_pending
+        self.max_cached = max_cached
+        self.parser = parser
+        self.cache = cache if cache is not None else default_cache
+        self.fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        self.executor = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="prefetch")
+        self.pages : OrderedDict[str,Future] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def _download(self, url : str) -> bytes:
+        return self.fetcher.get(url).content
+
+    def _speculating(self) -> bool:
+        return default_backend == "html" and not _through_daemon(self.parser, default_backend)
+
+    def prefetch(self, urls : Iterable[str]):
+        """Starts downloading the given pages (best first) and cancels the queued downloads of every other page.
+
+        Args:
+            urls (Iterable[str]): the urls most likely to be visited next
+        """
+        if not self._speculating():
+            urls = []
+        # pages the cache already has are not worth a request, peeked at so that the candidates never played don't
+        # count as cache misses
+        urls = [url for url in urls if url in self.pages or self.cache is None
+                or not self.cache.contains(canonicalize(url), self.parser.__name__)]
+        wanted = set(urls)
+        for url, future in list(self.pages.items()):
+            if url not in wanted and future.cancel():
+                del self.pages[url]
+                self.cancelled += 1
+
+        for url in urls:
+            if url in self.pages:
+                self.pages.move_to_end(url)
+            else:
+                self.pages[url] = self.executor.submit(self._download, request_url(url))
+
+        while len(self.pages) > self.max_cached:
+            _, future = self.pages.popitem(last=False)
+            future.cancel()
+
+    def get_adj_wiki(self, url : str) -> Set[str]:
+        """Same as get_adj_wiki, using the prefetched page when there is one.
+
+        Raises:
+            ConnectionError: if the wikipedia page cannot be acessed for any reason
+
+        Returns:
+            Set[str]: the urls of the adjacent articles
+        """
+        future = self.pages.pop(url, None)
+        # a download still queued behind the others isn't waited for
+        if future is not None and not future.cancel() and self._speculating():
+            try:
+                content = future.result()
+            except Exception:
+                # a failed download is retried (and reported) by the normal path
+                content = None
+            if content is not None:
+                self.hits += 1
+                return page_links(url, content, self.parser, self.cache)
+        self.misses += 1
+        return get_adj_wiki(url, self.parser, self.cache, self.fetcher)
+
+    def close(self):
+        for future in self.pages.values():
+            future.cancel()
+        self.pages.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+############################## Backlink Functions  ##############################
+
+def get_backlinks(url : str, fetcher : WikiFetcher = None, limit : int = 500) -> Set[str]:
+    """Given a link to a wikipedia page, will ask the wiki's api which articles link to it ("what links here").
+    Only articles (namespace 0) that aren't redirects are returned. These come from the wiki's own link table,
+    which also counts links outside the main text (navboxes, references...), so they are a superset of the
+    pages whose extract_links output contains the url.
+
+    Args:
+        url (str): the url of the wikipedia page
+        fetcher (WikiFetcher, optional): the pooled session used for the requests. Defaults to get_default_fetcher().
+        limit (int, optional): the number of backlinks requested per api call. Defaults to 500.
+
+    Raises:
+        ConnectionError: if the api cannot be acessed for any reason
+
+    Returns:
+        Set[str]: the set of urls of the wikipedia pages linking to the original page
+    """
+    fetcher = fetcher if fetcher is not None else get_default_fetcher()
+    parts = urlsplit(url)
+    api = request_url(f"{parts.scheme}://{parts.netloc}/w/api.php")
+    params = {'action' : 'query',
+              'format' : 'json',
+              'list' : 'backlinks',
+              'bltitle' : clean_wiki_link(canonical_url(url)),
+              'blnamespace' : 0,
+              'blfilterredir' : 'nonredirects',
+              'bllimit' : limit}
+
+    backlinks = set()
+    while True:
+        try:
+            data = fetcher.get(api, params=params).json()
+        except Exception as e:
+            raise ConnectionError(f"Could not retrieve backlinks \nerror code : {e}")
+
+        for page in data.get('query', {}).get('backlinks', []):
+            backlinks.add(title_to_url(page['title'], f"{parts.scheme}://{parts.netloc}"))
+
+        if 'continue' not in data:
+            return backlinks
+        params.update(data['continue'])
 
 ############################## Helper Functions/Formatting Functions  ##############################
 
+def title_to_url(title : str, base : str = "https://en.wikipedia.org") -> str:
+    """
+        Inverse of clean_wiki_link, given the title of a page will build its url (with the same percent encoding
+        the links found by the parsers use).
+
+        Args:
+            title (str): the title of the page
+            base (str, optional): the scheme and host of the wiki. Defaults to "https://en.wikipedia.org".
+
+        Returns:
+            str: the url of the page
+    """
+    return canonical_url(f"{base}/wiki/{title}")
+
 def clean_wiki_link(url : str) -> str:
     """
         Given a link to a wikipedia page will extract the relevant title of the page, if the link points 
@@ -0,0 +1,48 @@
+import pytest
+import sys
+import torch
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+from agent import ActorNN, pad_actions
+
+class TestActorNN:
+
+    @pytest.fixture
+    def actor(self) -> ActorNN:
+        torch.manual_seed(0)
+        return ActorNN(embedding_dim=8, hidden_dim=16)
+
+    def test_batched_matches_single(self, actor):
+        torch.manual_seed(1)
+        counts = [3, 7, 1, 5]
+        actions = [list(torch.randn(n, 8)) for n in counts]
+        target, current, path = torch.randn(4, 8), torch.randn(4, 8), torch.randn(4, 2, 8)
+
+        padded, mask = pad_actions(actions)
+        batched = actor(target, current, path, padded, mask)
+        assert batched.shape == (4, 7)
+
+        for i, n in enumerate(counts):
+            single = actor(target[i:i+1], current[i:i+1], path[i:i+1], actions[i])
+            assert torch.allclose(batched[i, :n], single[0], atol=1e-6)
+            assert torch.all(batched[i, n:] == 0)
+            assert batched[i].sum().item() == pytest.approx(1, abs=1e-5)
+
+    def test_padded_paths(self, actor):
+        torch.manual_seed(2)
+        paths = [torch.randn(3, 8), torch.randn(1, 8)]
+        padded_paths = torch.nn.utils.rnn.pad_sequence(paths, batch_first=True)
+        context = actor.encode_path(padded_paths, torch.tensor([3, 1]))
+        assert torch.allclose(context[1], actor.encode_path(paths[1].unsqueeze(0))[0], atol=1e-6)
+
+    def test_no_actions(self, actor):
+        padded, mask = pad_actions([[], [torch.randn(8)]])
+        probs = actor(torch.randn(2, 8), torch.randn(2, 8), torch.zeros(2, 0, 8), padded, mask)
+        assert torch.all(probs[0] == 0) and probs[1, 0].item() == pytest.approx(1)
+
+    def test_gradients_flow(self, actor):
+        padded, mask = pad_actions([list(torch.randn(4, 8)), list(torch.randn(2, 8))])
+        probs = actor(torch.randn(2, 8), torch.randn(2, 8), torch.randn(2, 3, 8), padded, mask)
+        torch.log(probs[mask]).sum().backward()
+        assert actor.score_action[0].weight.grad is not None
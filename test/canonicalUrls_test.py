@@ -0,0 +1,143 @@
+import pytest
+import sys
+import gzip
+import networkx as nx
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+import canonicalUrls
+import wikiLinkRetrieval as wiki
+from canonicalUrls import normalize_url, canonicalize, RedirectMap, UrlInterner
+from csrGraph import CSRGraph
+from mockWikiServer import MockWikiServer, render_page
+from wikiFetcher import WikiFetcher
+from graph import sprawl
+
+WIKI = "https://en.wikipedia.org"
+
+@pytest.fixture
+def redirects(monkeypatch) -> RedirectMap:
+    redirects = RedirectMap()
+    monkeypatch.setattr(canonicalUrls, "default_redirects", redirects)
+    return redirects
+
+class TestNormalization:
+
+    @pytest.mark.parametrize("variant", ["https://en.wikipedia.org/wiki/Caf%C3%A9_au_lait",
+                                         "https://en.wikipedia.org/wiki/café au lait",
+                                         "http://EN.m.wikipedia.org/wiki/Café__au_lait_#History",
+                                         "https://en.wikipedia.org/w/index.php?title=Caf%C3%A9_au_lait&oldid=1",
+                                         "/wiki/caf%c3%a9_au_lait"])
+    def test_variants(self, variant):
+        assert normalize_url(variant) == "https://en.wikipedia.org/wiki/Caf%C3%A9_au_lait"
+
+    def test_non_articles_untouched(self):
+        assert normalize_url("page_0") == "page_0"
+        assert normalize_url("https://en.wiktionary.org/wiki/cat") == "https://en.wiktionary.org/wiki/cat"
+
+class TestRedirectMap:
+
+    def test_chains_and_loops(self):
+        redirects = RedirectMap()
+        redirects.update([(f"{WIKI}/wiki/Kitty", f"{WIKI}/wiki/Cats"), (f"{WIKI}/wiki/cats", f"{WIKI}/wiki/Cat"),
+                          (f"{WIKI}/wiki/A", f"{WIKI}/wiki/B"), (f"{WIKI}/wiki/B", f"{WIKI}/wiki/A")])
+        assert redirects.resolve(f"{WIKI}/wiki/Kitty") == f"{WIKI}/wiki/Cat"
+        assert redirects.resolve(f"{WIKI}/wiki/Dog") == f"{WIKI}/wiki/Dog"
+        assert redirects.resolve(f"{WIKI}/wiki/A") in (f"{WIKI}/wiki/A", f"{WIKI}/wiki/B")
+
+    def test_persistent(self, tmp_path):
+        RedirectMap(str(tmp_path / "redirects.sqlite")).add(f"{WIKI}/wiki/Cats", f"{WIKI}/wiki/Cat")
+        redirects = RedirectMap(str(tmp_path / "redirects.sqlite"))
+        assert len(redirects) == 1 and f"{WIKI}/wiki/cats" in redirects
+
+    def test_learn_from_page(self):
+        redirects = RedirectMap()
+        page = render_page("Cat", [], canonical=f"{WIKI}/wiki/Cat")
+        assert redirects.learn(f"{WIKI}/wiki/Cats", page) == f"{WIKI}/wiki/Cat"
+        assert redirects.learn(f"{WIKI}/wiki/Cat", page) == f"{WIKI}/wiki/Cat"
+        # a page served by another host (a test server) teaches nothing
+        redirects.learn("http://127.0.0.1:8080/wiki/Kitten", page)
+        assert len(redirects) == 1
+
+    def test_import_dump(self, tmp_path):
+        def write(name, table, columns, rows):
+            values = ",".join("(" + ",".join(repr(v) for v in row) + ")" for row in rows)
+            with gzip.open(tmp_path / name, 'wt', encoding='utf-8') as f:
+                f.write(f"CREATE TABLE `{table}` (\n" + "".join(f"  `{c}` int,\n" for c in columns) + ") ENGINE=InnoDB;\n")
+                f.write(f"INSERT INTO `{table}` VALUES {values};\n")
+        write("page.sql.gz", "page", ["page_id", "page_namespace", "page_title", "page_is_redirect"],
+              [(1, 0, "Cat", 0), (2, 0, "Cats", 1), (3, 0, "Kitty", 1), (4, 2, "Cat", 1)])
+        write("redirect.sql.gz", "redirect", ["rd_from", "rd_namespace", "rd_title"], [(2, 0, "Cat"), (3, 0, "Cats"), (4, 0, "Cat")])
+
+        redirects = RedirectMap()
+        assert redirects.import_dump(str(tmp_path / "page.sql.gz"), str(tmp_path / "redirect.sql.gz")) == 2
+        assert redirects.resolve(f"{WIKI}/wiki/Kitty") == f"{WIKI}/wiki/Cat"
+
+class TestInterning:
+
+    def test_spellings_share_an_id(self, redirects):
+        redirects.add(f"{WIKI}/wiki/Cats", f"{WIKI}/wiki/Cat")
+        interner = UrlInterner()
+        node = interner.intern(f"{WIKI}/wiki/Cat")
+        assert interner.intern(f"{WIKI}/wiki/cat") == interner.intern(f"{WIKI}/wiki/Cats") == node
+        assert interner.intern(f"{WIKI}/wiki/Dog") == node + 1 and len(interner) == 2
+        assert interner.get(f"{WIKI}/wiki/Mouse") == -1 and len(interner) == 2
+
+    def test_save_load(self, tmp_path):
+        interner = UrlInterner([f"{WIKI}/wiki/Cat", f"{WIKI}/wiki/dog"])
+        interner.save(str(tmp_path / "urls.txt"))
+        loaded = UrlInterner.load(str(tmp_path / "urls.txt"))
+        assert loaded.urls == [f"{WIKI}/wiki/Cat", f"{WIKI}/wiki/Dog"] and loaded.get(f"{WIKI}/wiki/Dog") == 1
+
+    def test_graphs_share_interner_ids(self, redirects):
+        interner = UrlInterner()
+        first = CSRGraph.from_edges([(f"{WIKI}/wiki/A", [f"{WIKI}/wiki/B"])], interner=interner)
+        second = CSRGraph.from_edges([(f"{WIKI}/wiki/C", [f"{WIKI}/wiki/b"])], interner=interner)
+        assert first.id(f"{WIKI}/wiki/B") == second.id(f"{WIKI}/wiki/B") == interner.get(f"{WIKI}/wiki/B")
+        assert list(second.successors(f"{WIKI}/wiki/C")) == [f"{WIKI}/wiki/B"]
+
+    def test_csr_lookup_by_variant(self, redirects):
+        G = CSRGraph.from_edges([(f"{WIKI}/wiki/Cat", [f"{WIKI}/wiki/Dog"])])
+        redirects.add(f"{WIKI}/wiki/Kitty", f"{WIKI}/wiki/Cat")
+        assert G.has_node(f"{WIKI}/wiki/cat") and G.has_node(f"{WIKI}/wiki/Kitty")
+        assert list(G.successors(f"{WIKI}/wiki/Kitty")) == [f"{WIKI}/wiki/Dog"]
+        assert not G.has_node(f"{WIKI}/wiki/Mouse")
+
+class TestLearnedRedirects:
+
+    @pytest.fixture
+    def server(self, redirects, monkeypatch):
+        # Cats redirects to Cat, A links to both
+        G = nx.DiGraph([(f"{WIKI}/wiki/A", f"{WIKI}/wiki/Cats"), (f"{WIKI}/wiki/A", f"{WIKI}/wiki/B"),
+                        (f"{WIKI}/wiki/B", f"{WIKI}/wiki/Cat"), (f"{WIKI}/wiki/Cat", f"{WIKI}/wiki/A")])
+        with MockWikiServer(G, redirects={f"{WIKI}/wiki/Cats" : f"{WIKI}/wiki/Cat"}) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+            yield server
+
+    def test_fetch_learns_redirect(self, server, redirects):
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/A") == {f"{WIKI}/wiki/Cats", f"{WIKI}/wiki/B"}
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/Cats") == {f"{WIKI}/wiki/A"}
+        assert canonicalize(f"{WIKI}/wiki/Cats") == f"{WIKI}/wiki/Cat"
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/A") == {f"{WIKI}/wiki/Cat", f"{WIKI}/wiki/B"}
+
+    def test_sprawl_merges_redirects(self, server):
+        G = sprawl({f"{WIKI}/wiki/a"}, 2)
+        assert set(G.nodes) == {f"{WIKI}/wiki/A", f"{WIKI}/wiki/B", f"{WIKI}/wiki/Cat"}
+        assert set(G.successors(f"{WIKI}/wiki/A")) == {f"{WIKI}/wiki/B", f"{WIKI}/wiki/Cat"}
+
+    def test_cache_keeps_redirects(self, server, monkeypatch, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        wiki.use_cache(path)
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/Cats") == {f"{WIKI}/wiki/A"}
+        wiki.default_cache.close()
+        canonicalUrls.default_redirects.close()
+
+        # a new session knows Cats is Cat and finds it in the cache
+        monkeypatch.setattr(canonicalUrls, "default_redirects", RedirectMap())
+        wiki.use_cache(path)
+        requests = server.requests
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/Cats") == {f"{WIKI}/wiki/A"}
+        assert server.requests == requests
+        wiki.default_cache.close()
@@ -0,0 +1,44 @@
+import pytest
+import sys
+import pickle
+import networkx as nx
+import numpy as np
+sys.path.append("./src/")
+
+from csrGraph import CSRGraph
+from searchAlgorithms import bfs_paths, bfs_length
+
+class TestCSRGraph:
+
+    @pytest.fixture
+    def nx_graph(self) -> nx.DiGraph:
+        G = nx.gnp_random_graph(150, 0.03, seed=1, directed=True)
+        return nx.relabel_nodes(G, lambda n: f"https://en.wikipedia.org/wiki/Page_{n}")
+
+    def test_from_networkx_neighbours(self, nx_graph):
+        G = CSRGraph.from_networkx(nx_graph)
+        for url in nx_graph.nodes:
+            assert set(G.successors(url)) == set(nx_graph.successors(url))
+            assert set(G.predecessors(url)) == set(nx_graph.predecessors(url))
+            assert G.out_degree(url) == nx_graph.out_degree(url)
+
+    def test_from_edges(self, nx_graph):
+        G = CSRGraph.from_edges((url, nx_graph.successors(url)) for url in nx_graph.nodes)
+        assert set((u, v) for u in G.nodes for v in G.successors(u)) == set(nx_graph.edges)
+
+    def test_save_load_mmap(self, nx_graph, tmp_path):
+        with open(tmp_path / "graph.pickle", 'wb') as f:
+            pickle.dump(nx_graph, f)
+        CSRGraph.from_pickle(str(tmp_path / "graph.pickle")).save(str(tmp_path / "csr"))
+
+        G = CSRGraph.load(str(tmp_path / "csr"))
+        assert isinstance(G.targets, np.memmap)
+        assert G.number_of_edges() == nx_graph.number_of_edges()
+        assert set(G.predecessors("https://en.wikipedia.org/wiki/Page_0")) == set(nx_graph.predecessors("https://en.wikipedia.org/wiki/Page_0"))
+
+    def test_bfs_on_csr(self, nx_graph):
+        G = CSRGraph.from_networkx(nx_graph)
+        source, target = "https://en.wikipedia.org/wiki/Page_0", "https://en.wikipedia.org/wiki/Page_42"
+        assert sorted(bfs_paths(source, target, G)) == sorted(nx.all_shortest_paths(nx_graph, source, target))
+        assert bfs_length(source, target, G) == nx.shortest_path_length(nx_graph, source, target)
+        assert bfs_length(source, "https://en.wikipedia.org/wiki/Not_in_graph", G) == -1
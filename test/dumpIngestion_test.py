@@ -0,0 +1,146 @@
+import pytest
+import sys
+import bz2
+import gzip
+import random
+import numpy as np
+sys.path.append("./src/")
+
+from csrGraph import CSRGraph
+import dumpIngestion
+from dumpIngestion import ingest_sql, ingest_xml, iter_xml_pages, normalize_title, parse_rows, write_csr
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+# page_id, namespace, title, is_redirect
+PAGES = [(1, 0, "Apple", 0), (2, 0, "Banana", 0), (3, 0, "Cherry_(fruit)", 0), (4, 0, "O'Neill", 0),
+         (5, 0, "Fruit", 1), (6, 0, "Cherry", 1), (7, 14, "Fruits", 0), (9, 0, "Dragonfruit", 0)]
+# rd_from -> title, Fruit -> Cherry -> Cherry_(fruit) is a chain
+REDIRECTS = [(5, 0, "Cherry"), (6, 0, "Cherry_(fruit)")]
+# pl_from, namespace, title
+LINKS = [(1, 0, "Banana"), (1, 0, "Banana"), (1, 0, "Fruit"), (1, 0, "Apple"), (1, 14, "Fruits"),
+         (1, 0, "Missing_page"), (2, 0, "O'Neill"), (2, 0, "Cherry"), (4, 0, "Dragonfruit"), (5, 0, "Apple"),
+         (9, 0, "Apple"), (9, 0, "Cherry_(fruit)")]
+EXPECTED = {("Apple", "Banana"), ("Apple", "Cherry_(fruit)"), ("Banana", "O'Neill"), ("Banana", "Cherry_(fruit)"),
+            ("O'Neill", "Dragonfruit"), ("Dragonfruit", "Apple"), ("Dragonfruit", "Cherry_(fruit)")}
+
+def sql_value(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def write_sql(path, table, columns, rows, rows_per_insert=2):
+    lines = [f"-- MySQL dump\n", f"DROP TABLE IF EXISTS `{table}`;\n", f"CREATE TABLE `{table}` (\n"]
+    lines += [f"  `{column}` int(8) NOT NULL,\n" for column in columns]
+    lines += ["  PRIMARY KEY (`id`)\n", ") ENGINE=InnoDB;\n"]
+    for start in range(0, len(rows), rows_per_insert):
+        values = ",".join("(" + ",".join(sql_value(v) for v in row) + ")" for row in rows[start:start + rows_per_insert])
+        lines.append(f"INSERT INTO `{table}` VALUES {values};\n")
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+
+def graph_edges(directory) -> set:
+    G = CSRGraph.load(str(directory))
+    edges = {(u[len(WIKI):], v[len(WIKI):]) for u, v in G.edges}
+    assert {(u[len(WIKI):], v[len(WIKI):]) for v in G.nodes for u in G.predecessors(v)} == edges
+    return edges
+
+class TestDumpIngestion:
+
+    @pytest.fixture
+    def sql_dumps(self, tmp_path):
+        write_sql(tmp_path / "page.sql.gz", "page", ["page_id", "page_namespace", "page_title", "page_is_redirect"], PAGES)
+        write_sql(tmp_path / "redirect.sql.gz", "redirect", ["rd_from", "rd_namespace", "rd_title"], REDIRECTS)
+        return tmp_path
+
+    def test_normalize_title(self):
+        assert normalize_title("apple pie") == "Apple_pie"
+        assert normalize_title(":  new_York  City ") == "New_York_City"
+
+    def test_parse_rows(self):
+        statement = b"INSERT INTO `t` VALUES (1,'a\\'b',NULL,-2),(3,'(x),\\\\',0,1.5);\n"
+        assert list(parse_rows(statement)) == [(1, "a'b", None, -2), (3, "(x),\\", 0, 1.5)]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_sql_old_schema(self, sql_dumps, workers):
+        write_sql(sql_dumps / "pagelinks.sql.gz", "pagelinks", ["pl_from", "pl_namespace", "pl_title", "pl_from_namespace"],
+                  [link + (0,) for link in LINKS] + [(7, 0, "Apple", 14)])
+        stats = ingest_sql(str(sql_dumps / "page.sql.gz"), str(sql_dumps / "pagelinks.sql.gz"), str(sql_dumps / "redirect.sql.gz"),
+                           str(sql_dumps / "graph"), workers=workers)
+
+        assert stats == {'articles' : 5, 'redirects' : 2, 'edges' : len(EXPECTED)}
+        assert graph_edges(sql_dumps / "graph") == EXPECTED
+        assert sorted(p.name for p in (sql_dumps / "graph").iterdir()) == ["offsets.npy", "rev_offsets.npy", "rev_targets.npy", "targets.npy", "urls.txt"]
+
+    def test_sql_linktarget_schema(self, sql_dumps):
+        targets = sorted({(namespace, title) for _, namespace, title in LINKS})
+        target_ids = {target : i + 100 for i, target in enumerate(targets)}
+        write_sql(sql_dumps / "linktarget.sql.gz", "linktarget", ["lt_id", "lt_namespace", "lt_title"],
+                  [(i, namespace, title) for (namespace, title), i in target_ids.items()])
+        write_sql(sql_dumps / "pagelinks.sql.gz", "pagelinks", ["pl_from", "pl_from_namespace", "pl_target_id"],
+                  [(page, 0, target_ids[(namespace, title)]) for page, namespace, title in LINKS])
+
+        with pytest.raises(ValueError):
+            ingest_sql(str(sql_dumps / "page.sql.gz"), str(sql_dumps / "pagelinks.sql.gz"), str(sql_dumps / "redirect.sql.gz"),
+                       str(sql_dumps / "graph"), workers=1)
+        ingest_sql(str(sql_dumps / "page.sql.gz"), str(sql_dumps / "pagelinks.sql.gz"), str(sql_dumps / "redirect.sql.gz"),
+                   str(sql_dumps / "graph"), linktarget_path=str(sql_dumps / "linktarget.sql.gz"), workers=2)
+        assert graph_edges(sql_dumps / "graph") == EXPECTED
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_xml(self, tmp_path, workers):
+        def page(title, ns, text, redirect=None):
+            redirect = f'<redirect title="{redirect}" />' if redirect else ""
+            return (f"<page><title>{title}</title><ns>{ns}</ns><id>0</id>{redirect}"
+                    f'<revision><text xml:space="preserve">{text}</text></revision></page>')
+        pages = [page("Apple", 0, "An [[banana]] or two [[Banana|bananas]], a [[Fruit#Kinds|fruit]], [[Category:Fruits]], [[Apple]], [[Missing page]]"),
+                 page("Banana", 0, "[[O&apos;Neill]] and [[cherry]] {{Navbox|[[Dragonfruit]]}}"),
+                 page("Cherry (fruit)", 0, ""),
+                 page("O'Neill", 0, "[[:Dragonfruit]] [[fr:Pomme]]"),
+                 page("Fruit", 0, "#REDIRECT [[Cherry]]", redirect="Cherry"),
+                 page("Cherry", 0, "#REDIRECT [[Cherry (fruit)]]", redirect="Cherry (fruit)"),
+                 page("Category:Fruits", 14, "[[Apple]]"),
+                 page("Dragonfruit", 0, "[[Apple]], [[Cherry_(fruit)|cherries]]")]
+        with bz2.open(tmp_path / "pages-articles.xml.bz2", 'wt', encoding='utf-8') as f:
+            f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" xml:lang="en">\n' + "\n".join(pages) + "\n</mediawiki>\n")
+
+        stats = ingest_xml(str(tmp_path / "pages-articles.xml.bz2"), str(tmp_path / "graph"), workers=workers, batch_size=2)
+        assert stats['articles'] == 5 and stats['redirects'] == 2
+        # the navbox link is a template argument here, it's still in the wikitext
+        assert graph_edges(tmp_path / "graph") == EXPECTED | {("Banana", "Dragonfruit")}
+
+    def test_xml_pages_released(self, tmp_path, monkeypatch):
+        with open(tmp_path / "pages-articles.xml", 'w', encoding='utf-8') as f:
+            f.write("<mediawiki><siteinfo />" + "".join(f"<page><title>Page {i}</title><ns>0</ns><revision><text>[[Page {i + 1}]]</text></revision></page>"
+                                                        for i in range(5000)) + "</mediawiki>")
+        roots = []
+        iterparse = dumpIngestion.ET.iterparse
+        def recording(source, events):
+            # the first start event is the root's
+            for event, element in iterparse(source, tuple({"start", *events})):
+                if not roots:
+                    roots.append(element)
+                if event in events:
+                    yield event, element
+        monkeypatch.setattr(dumpIngestion.ET, "iterparse", recording)
+
+        children = []
+        for i, (title, namespace, redirect, text) in enumerate(iter_xml_pages(str(tmp_path / "pages-articles.xml"))):
+            assert title == f"Page {i}" and text == f"[[Page {i + 1}]]"
+            children.append(len(roots[0]))
+        # only the pages the parser read ahead hang off the root, not every page read so far
+        assert i == 4999 and max(children) < 500
+
+    def test_write_csr_blocks(self, tmp_path):
+        rng = random.Random(0)
+        edges = [(rng.randrange(50), rng.randrange(50)) for _ in range(2000)]
+        pairs = np.array(edges, dtype=np.int32)
+        blocks = lambda: ((pairs[i:i + 97, 0], pairs[i:i + 97, 1]) for i in range(0, len(pairs), 97))
+
+        total = write_csr(50, blocks, str(tmp_path), block_nodes=7)
+        offsets, targets = np.load(tmp_path / "offsets.npy"), np.load(tmp_path / "targets.npy")
+        expected = {(u, v) for u, v in edges if u != v}
+        assert total == len(expected) == len(targets)
+        for node in range(50):
+            row = targets[offsets[node]:offsets[node + 1]].tolist()
+            assert row == sorted({v for u, v in expected if u == node})
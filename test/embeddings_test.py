@@ -0,0 +1,149 @@
+import pytest
+import sys
+import numpy as np
+from gensim.models import KeyedVectors
+sys.path.append("./src/")
+
+import searchAlgorithms as search
+from embeddings import EmbeddingIndex, EncoderCache, PhraseEmbedder, phrase_to_vec, encoder_namespace
+from wikiLinkRetrieval import clean_wiki_link
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+class TestEmbeddingIndex:
+
+    @pytest.fixture
+    def model(self) -> KeyedVectors:
+        rng = np.random.default_rng(0)
+        words = ["Europe", "France", "Paris", "music", "Pop", "Germany", "Berlin", "Cat"]
+        model = KeyedVectors(vector_size=16)
+        model.add_vectors(words, rng.normal(size=(len(words), 16)).astype(np.float32))
+        return model
+
+    def test_similarities_match_cosine(self, model):
+        urls = [WIKI + title for title in ["France", "Pop_music", "Berlin", "Unknown_title"]]
+        index = EmbeddingIndex.from_keyed_vectors(model)
+        target_vec = phrase_to_vec("Paris", model)
+
+        for url, similarity in zip(urls, index.similarities(urls, WIKI + "Paris")):
+            vec = phrase_to_vec(clean_wiki_link(url), model)
+            norms = np.linalg.norm(vec) * np.linalg.norm(target_vec)
+            expected = np.dot(vec, target_vec) / norms if norms > 0 else 0
+            assert similarity == pytest.approx(expected, abs=1e-5)
+
+    def test_save_load_mmap(self, model, tmp_path):
+        urls = [WIKI + title for title in ["France", "Germany", "Cat"]]
+        EmbeddingIndex.from_keyed_vectors(model, urls).save(str(tmp_path))
+
+        index = EmbeddingIndex.load(str(tmp_path))
+        assert isinstance(index.vectors, np.memmap)
+        assert index.matrix(urls).shape == (3, 16)
+        with pytest.raises(KeyError):
+            index.vector(WIKI + "Paris")
+
+        # given a model the missing articles are appended
+        index = EmbeddingIndex.load(str(tmp_path), model=model)
+        assert np.linalg.norm(index.vector(WIKI + "Paris")) == pytest.approx(1, abs=1e-5)
+        assert len(index) == 4
+
+    def test_word2vec_search(self, monkeypatch):
+        # Germany points towards Berlin, Cat and France point away from it
+        model = KeyedVectors(vector_size=3)
+        model.add_vectors(["Europe", "Cat", "France", "Germany", "Berlin"],
+                          np.array([[0, 0, 1], [0, 1, 0], [-1, 0, 0], [0.9, 0.1, 0], [1, 0, 0]], dtype=np.float32))
+        links = {WIKI + "Europe" : {WIKI + "Cat", WIKI + "France", WIKI + "Germany"},
+                 WIKI + "Germany" : {WIKI + "Berlin", WIKI + "Cat"}}
+        monkeypatch.setattr(search.wiki, "get_adj_wiki", lambda url: links.get(url, set()))
+
+        path = search.word2vec_search(WIKI + "Europe", WIKI + "Berlin", model, EmbeddingIndex.from_keyed_vectors(model))
+        assert path == [WIKI + "Europe", WIKI + "Germany", WIKI + "Berlin"]
+
+class CountingEncoder:
+    """Stands in for a SentenceTransformer, embeds a title as its letter counts and records every encode call"""
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, titles, batch_size=32, convert_to_numpy=True):
+        self.calls.append(list(titles))
+        return np.array([[title.lower().count(c) for c in "abcdefghijklmnopqrstuvwxyz"] for title in titles], dtype=np.float32)
+
+class TestEncoderCache:
+
+    def test_batches_only_unseen_titles(self):
+        model = CountingEncoder()
+        cache = EncoderCache(model)
+        first = cache.encode(["France", "Germany", "France"])
+        cache.encode(["Germany", "Berlin"])
+        assert model.calls == [["France", "Germany"], ["Berlin"]]
+        assert np.array_equal(first[0], first[2])
+
+    def test_memory_lru_capacity(self):
+        model = CountingEncoder()
+        cache = EncoderCache(model, capacity=2)
+        cache.encode(["A", "B", "C"])
+        cache.encode(["A"])
+        assert model.calls[-1] == ["A"]
+
+    def test_disk_store_across_games(self, tmp_path):
+        path = str(tmp_path / "vectors.sqlite")
+        EncoderCache(CountingEncoder(), path, namespace="letters").encode(["France", "Germany"])
+
+        model = CountingEncoder()
+        cache = EncoderCache(model, path, namespace="letters")
+        vectors = cache.encode(["Germany", "France", "Spain"])
+        assert model.calls == [["Spain"]]
+        assert cache.stats() == {'memory_hits' : 0, 'disk_hits' : 2, 'encoded' : 1}
+        assert vectors[0][6] == 1 # the g of germany
+
+    def test_namespaces(self, tmp_path):
+        class NamedEncoder(CountingEncoder):
+            def __init__(self, name, dimension):
+                super().__init__()
+                self.model_card_data = type("ModelCardData", (), {'base_model' : name})()
+                self.dimension = dimension
+            def get_sentence_embedding_dimension(self):
+                return self.dimension
+
+        assert encoder_namespace(NamedEncoder("all-MiniLM-L6-v2", 384)) == "all-MiniLM-L6-v2:384"
+        assert encoder_namespace(NamedEncoder("all-MiniLM-L6-v2", 384)) != encoder_namespace(NamedEncoder("all-mpnet-base-v2", 768))
+        # two unnamed models would read each other's vectors
+        with pytest.raises(ValueError):
+            EncoderCache(CountingEncoder(), str(tmp_path / "vectors.sqlite"))
+        assert EncoderCache(CountingEncoder()).namespace is None
+
+    def test_transformer_search(self, monkeypatch):
+        links = {WIKI + "Europe" : {WIKI + "Xylophone", WIKI + "Paris"},
+                 WIKI + "Paris" : {WIKI + "Pairs", WIKI + "Zoo"}}
+        monkeypatch.setattr(search.wiki, "get_adj_wiki", lambda url: links.get(url, set()))
+        path = search.transformer_search(WIKI + "Europe", WIKI + "Pairs", CountingEncoder())
+        assert path == [WIKI + "Europe", WIKI + "Paris", WIKI + "Pairs"]
+
+class TestPhraseEmbedder:
+
+    @pytest.fixture
+    def model(self) -> KeyedVectors:
+        model = KeyedVectors(vector_size=2)
+        model.add_vectors(["New_York", "pop", "Music", "Europe"],
+                          np.array([[1, 1], [2, 0], [0, 4], [3, 3]], dtype=np.float32))
+        return model
+
+    def test_phrase_to_vec(self, model):
+        assert np.array_equal(phrase_to_vec("New_York", model), [1, 1])
+        assert np.array_equal(phrase_to_vec("Pop Music", model), [1, 2])  # lowercase fallback, averaged
+        assert np.array_equal(phrase_to_vec("Nothing here", model), [0, 0])
+
+    def test_embed_many_matches_phrase_to_vec(self, model):
+        embedder = PhraseEmbedder(model)
+        phrases = ["Pop Music", "Nothing", "Europe", "New_York", "Pop Music", "Europe Music"]
+        matrix = embedder.embed_many(phrases)
+        assert matrix.flags['C_CONTIGUOUS'] and matrix.dtype == np.float32
+        for phrase, row in zip(phrases, matrix):
+            assert np.allclose(row, phrase_to_vec(phrase, model))
+
+    def test_memoized(self, model):
+        embedder = PhraseEmbedder(model, clean_wiki_link, capacity=1)
+        embedder(WIKI + "Pop_music")
+        embedder(WIKI + "Pop_music")
+        embedder(WIKI + "Europe")
+        embedder(WIKI + "Pop_music")
+        assert (embedder.hits, embedder.misses) == (1, 3)
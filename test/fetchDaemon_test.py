@@ -0,0 +1,116 @@
+import pytest
+import sys
+import time
+import asyncio
+import aiohttp
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+import networkx as nx
+sys.path.append("./src/")
+
+import canonicalUrls
+import wikiLinkRetrieval as wiki
+from canonicalUrls import RedirectMap, canonicalize
+from fetchDaemon import FetchDaemon
+from wikiLinkRetrieval import FetchResult
+from mockWikiServer import MockWikiServer
+from wikiFetcher import WikiFetcher
+from searchAlgorithms import concurrent_bfs_length
+
+WIKI = "https://en.wikipedia.org"
+
+@pytest.fixture(scope="module")
+def web_graph() -> nx.DiGraph:
+    G = nx.gnp_random_graph(100, 0.05, seed=11, directed=True)
+    G = nx.relabel_nodes(G, lambda node: f"{WIKI}/wiki/Article_{node}")
+    # Article_Redirect redirects to Article_1
+    G.add_edge(f"{WIKI}/wiki/Article_0", f"{WIKI}/wiki/Article_Redirect")
+    return G
+
+@pytest.fixture
+def daemon(web_graph, monkeypatch):
+    monkeypatch.setattr(canonicalUrls, "default_redirects", RedirectMap())
+    with MockWikiServer(web_graph, latency=0.1, redirects={f"{WIKI}/wiki/Article_Redirect" : f"{WIKI}/wiki/Article_1"}) as server, \
+         FetchDaemon() as daemon, WikiFetcher(backoff_factor=0) as fetcher:
+        monkeypatch.setattr(wiki, "default_mirror", server.url)
+        monkeypatch.setattr(wiki, "default_cache", None)
+        monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+        monkeypatch.setattr(wiki, "default_daemon", daemon.url)
+        daemon.server = server
+        yield daemon
+
+class TestFetchDaemon:
+
+    def test_single_flight(self, daemon, web_graph):
+        url = f"{WIKI}/wiki/Article_3"
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: wiki.get_adj_wiki(url), range(8)))
+        assert all(links == set(web_graph.successors(url)) for links in results)
+        assert daemon.server.stats()['pages_served'] == 1
+        assert daemon.stats()['requests'] == 8 and daemon.stats()['coalesced'] == 7
+
+    def test_sync_and_async_helpers(self, daemon, web_graph):
+        urls = list(web_graph.nodes)[:20]
+        assert wiki.get_adj_wiki(urls[0]) == set(web_graph.successors(urls[0]))
+        assert wiki.get_adj_wiki_lists(set(urls)) == {url : set(web_graph.successors(url)) for url in urls}
+        # the lists went out as one batch
+        assert daemon.stats()['requests'] == 2 and daemon.stats()['fetches'] == 21
+
+        source, target = f"{WIKI}/wiki/Article_2", f"{WIKI}/wiki/Article_7"
+        expected = nx.shortest_path_length(web_graph, source, target) if nx.has_path(web_graph, source, target) else -1
+        assert concurrent_bfs_length(source, target) == expected
+
+    def test_failures(self, daemon):
+        with pytest.raises(ConnectionError):
+            wiki.get_adj_wiki(f"{WIKI}/wiki/Not_in_the_graph")
+        failures = {}
+        assert wiki.get_adj_wiki_lists({f"{WIKI}/wiki/Not_in_the_graph"}, failures=failures) == {}
+        assert failures[f"{WIKI}/wiki/Not_in_the_graph"].status == 404
+
+    def test_redirects_learned_by_clients(self, daemon, web_graph):
+        assert wiki.get_adj_wiki(f"{WIKI}/wiki/Article_Redirect") == set(web_graph.successors(f"{WIKI}/wiki/Article_1"))
+        assert canonicalize(f"{WIKI}/wiki/Article_Redirect") == f"{WIKI}/wiki/Article_1"
+
+    def test_stream_closed_early(self, daemon, web_graph):
+        urls = list(web_graph.nodes)[:40]
+        async def first():
+            async with aiohttp.ClientSession() as session:
+                start = time.monotonic()
+                async with aclosing(wiki.async_fetch_adj_wikis(urls, session)) as results:
+                    async for result in results:
+                        return result, time.monotonic() - start
+
+        result, elapsed = asyncio.run(first())
+        # the batch takes several round trips at the daemon's concurrency, its first result is streamed back alone
+        assert result.links == set(web_graph.successors(result.url)) and elapsed < 0.5
+        # closing the client cancelled the fetches the daemon still had queued
+        deadline = time.monotonic() + 1
+        while daemon.stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert daemon.stats()['in_flight'] == 0
+        requests = daemon.server.stats()['requests']
+        time.sleep(0.3)
+        assert daemon.server.stats()['requests'] == requests < len(urls)
+
+    def test_refetch_after_cancel(self):
+        url = f"{WIKI}/wiki/Article_1"
+        async def run():
+            daemon = FetchDaemon()
+            async def fetch(url):
+                try:
+                    await asyncio.sleep(0.05)
+                finally:
+                    # winding down takes a few loop iterations, like releasing the limiter
+                    await asyncio.sleep(0.01)
+                return FetchResult(url, set())
+            daemon._fetch = fetch
+
+            first = asyncio.ensure_future(daemon.fetch(url))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            # the fetch nobody waits on anymore is not joined
+            result = await daemon.fetch(url)
+            assert result.ok and daemon.stats()['coalesced'] == 0
+            await daemon.close()
+        asyncio.run(run())
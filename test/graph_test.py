@@ -0,0 +1,53 @@
+import pytest
+import sys
+import asyncio
+import networkx as nx
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+import graph
+from graph import StreamingCrawler, sprawl
+
+def graph_fetcher(G : nx.DiGraph, calls : list = None, hang_after : int = None):
+    """Stands in for the network, gives the successors of a node in G (hanging forever after hang_after calls
+    to simulate a crawl being interrupted)"""
+    async def fetch_links(url):
+        if calls is not None:
+            calls.append(url)
+            if hang_after is not None and len(calls) > hang_after:
+                await asyncio.Event().wait()
+        await asyncio.sleep(0)
+        return set(G.successors(url))
+    return fetch_links
+
+class TestStreamingCrawler:
+
+    @pytest.fixture
+    def web(self) -> nx.DiGraph:
+        return nx.relabel_nodes(nx.gnp_random_graph(400, 0.01, seed=3, directed=True), lambda n: f"page_{n}")
+
+    @pytest.fixture
+    def expected(self, web, monkeypatch) -> nx.DiGraph:
+        monkeypatch.setattr(graph.wiki, "get_adj_wiki_lists", lambda urls: {url : set(web.successors(url)) for url in urls})
+        return sprawl({"page_0", "page_1"}, 2)
+
+    def test_matches_sprawl(self, web, expected, tmp_path):
+        crawler = StreamingCrawler(str(tmp_path), concurrency=4, queue_size=8, fetch_links=graph_fetcher(web))
+        crawler.sprawl({"page_0", "page_1"}, 2)
+        G = crawler.load_graph()
+        assert set(G.edges) == set(expected.edges)
+
+    def test_resume_after_interruption(self, web, expected, tmp_path):
+        calls = []
+        crawler = StreamingCrawler(str(tmp_path), concurrency=4, queue_size=8, fetch_links=graph_fetcher(web, calls, hang_after=30))
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(crawler.async_sprawl({"page_0", "page_1"}, 2), timeout=0.5))
+        assert not crawler.load_state()['complete']
+
+        resumed = StreamingCrawler(str(tmp_path), concurrency=4, queue_size=8, fetch_links=graph_fetcher(web, calls))
+        resumed.sprawl(set(), 2)
+        assert resumed.load_state()['complete']
+        assert set(resumed.load_graph().edges) == set(expected.edges)
+
+        # no page is crawled twice apart from the ones in flight when the crawl was interrupted
+        assert len(calls) - len(set(calls)) <= 4
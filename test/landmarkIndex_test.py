@@ -0,0 +1,122 @@
+import pytest
+import sys
+import random
+import numpy as np
+import networkx as nx
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+from csrGraph import CSRGraph
+from landmarkIndex import LandmarkIndex, bfs_distances
+from searchAlgorithms import landmark_search, bfs_length
+from wikiGameEnvironment import WikiEnvironment, BatchedWikiEnvironment
+
+WIKI = "https://en.wikipedia.org/wiki/"
+
+class TestLandmarkIndex:
+
+    @pytest.fixture
+    def nx_graph(self) -> nx.DiGraph:
+        # two random components, so some pairs have no path at all
+        G = nx.gnp_random_graph(300, 0.012, seed=4, directed=True)
+        G.add_edges_from((u + 300, v + 300) for u, v in nx.gnp_random_graph(50, 0.08, seed=5, directed=True).edges)
+        return nx.relabel_nodes(G, lambda n: f"{WIKI}Page_{n}")
+
+    @pytest.fixture
+    def graph(self, nx_graph) -> CSRGraph:
+        return CSRGraph.from_networkx(nx_graph)
+
+    @pytest.fixture
+    def distances(self, nx_graph) -> dict:
+        return dict(nx.all_pairs_shortest_path_length(nx_graph))
+
+    def test_bfs_distances(self, nx_graph, graph):
+        source = graph.url(0)
+        expected = nx.single_source_shortest_path_length(nx_graph, source)
+        forward = bfs_distances(graph.offsets, graph.targets, 0)
+        assert {graph.url(node) : int(d) for node, d in enumerate(forward) if d >= 0} == expected
+        backward = bfs_distances(graph.rev_offsets, graph.rev_targets, 0)
+        assert {graph.url(node) : int(d) for node, d in enumerate(backward) if d >= 0} == nx.single_source_shortest_path_length(nx_graph.reverse(), source)
+
+    @pytest.mark.parametrize("strategy", ["degree", "farthest"])
+    def test_bounds_bracket_distance(self, graph, distances, strategy):
+        index = LandmarkIndex.build(graph, num_landmarks=6, strategy=strategy)
+        assert len(set(index.landmarks.tolist())) == 6 and index.from_landmarks.dtype == np.uint8
+
+        rng = random.Random(0)
+        for _ in range(500):
+            source, target = rng.choice(graph.urls), rng.choice(graph.urls)
+            true = distances[source].get(target, np.inf)
+            lower, upper = index.bounds(source, target)
+            assert lower <= true <= upper
+
+    def test_vectorized_queries(self, graph, distances):
+        index = LandmarkIndex.build(graph, num_landmarks=4)
+        target = graph.url(7)
+        lower = index.lower_bounds_to(7)
+        upper = index.upper_bounds(np.arange(len(graph)), 7)
+        true = np.array([distances[url].get(target, np.inf) for url in graph.urls])
+        assert np.all(lower <= true) and np.all(true <= upper)
+        # a landmark's own distances are exact
+        landmark = int(index.landmarks[0])
+        assert index.bounds(landmark, 7)[0] == index.bounds(landmark, 7)[1] == distances[graph.url(landmark)].get(target, np.inf)
+
+    def test_disconnected_pairs_are_proven(self, graph):
+        index = LandmarkIndex.build(graph, num_landmarks=4, strategy="degree")
+        # the landmarks all sit in the big component, nothing in it reaches the small one
+        assert np.all(index.landmarks < 300)
+        assert index.lower_bounds(0, 320) == np.inf
+
+    def test_save_load(self, graph, tmp_path):
+        index = LandmarkIndex.build(graph, num_landmarks=3)
+        index.save(str(tmp_path))
+        loaded = LandmarkIndex.load(str(tmp_path), graph)
+        assert isinstance(loaded.from_landmarks, np.memmap)
+        assert loaded.bounds(graph.url(1), graph.url(2)) == index.bounds(1, 2)
+
+    def test_bfs_length_and_landmark_search(self, graph, distances):
+        index = LandmarkIndex.build(graph, num_landmarks=6)
+        rng = random.Random(1)
+        for _ in range(100):
+            source, target = rng.choice(graph.urls), rng.choice(graph.urls)
+            true = distances[source].get(target)
+            assert bfs_length(source, target, graph, index) == (-1 if true is None else true)
+            path = landmark_search(source, target, graph, index)
+            assert path[0] == source
+            assert all(graph.id(v) in graph.out_neighbors(graph.id(u)) for u, v in zip(path, path[1:]))
+            lower, upper = index.bounds(source, target)
+            if np.isfinite(upper):
+                assert path[-1] == target and true <= len(path) - 1 <= upper
+            else:
+                assert path == [source]
+
+    def test_landmark_path(self, graph, distances):
+        index = LandmarkIndex.build(graph, num_landmarks=4)
+        for target in range(0, 300, 7):
+            route = index.path(3, target)
+            upper = index.bounds(3, target)[1]
+            assert len(route) - 1 == upper if np.isfinite(upper) else len(route) == 0
+            assert all(v in graph.out_neighbors(u) for u, v in zip(route, route[1:]))
+
+class TestDistanceReward:
+
+    @pytest.fixture
+    def line(self) -> CSRGraph:
+        # A -> B -> C -> D and a dead end branch B -> X
+        return CSRGraph.from_edges([("A", ["B"]), ("B", ["X", "C"]), ("C", ["D"]), ("X", [])])
+
+    def test_batched_rewards_progress(self, line):
+        index = LandmarkIndex.build(line, num_landmarks=4)
+        env = BatchedWikiEnvironment(line, num_envs=2, landmarks=index, distance_scale=3.0)
+        env.reset(starts=np.array([line.id("B"), line.id("B")]), targets=np.array([line.id("D"), line.id("D")]))
+        towards, away = line.out_neighbors(line.id("B")).tolist().index(line.id("C")), line.out_neighbors(line.id("B")).tolist().index(line.id("X"))
+        _, rewards, _ = env.step(np.array([towards, away]))
+        assert rewards[0] == pytest.approx(env.step_loss + 3.0)
+        assert rewards[1] < env.step_loss
+
+    def test_single_env_uses_distances(self, line):
+        index = LandmarkIndex.build(line, num_landmarks=4)
+        embedder = lambda node: np.array([1.0, float(node == "C")], dtype=np.float32)
+        env = WikiEnvironment(line, embedder, init_node="A", target_node="D", landmarks=index, distance_scale=1.5)
+        _, reward, done = env.step(np.ones(2))
+        assert not done and reward == pytest.approx(env.step_loss + 1.5)
@@ -0,0 +1,242 @@
+import pytest
+import sys
+import asyncio
+import aiohttp
+import networkx as nx
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+import canonicalUrls
+import wikiLinkRetrieval as wiki
+from canonicalUrls import RedirectMap, canonicalize
+from wikiCache import WikiCache
+from wikiFetcher import WikiFetcher
+from rateLimiter import HostLimiters
+from wikiLinkRetrieval import extract_links, stream_extract_links
+from mockWikiServer import MockWikiServer, render_page
+from searchAlgorithms import concurrent_bfs_length, async_bfs_paths, bfs_paths
+from csrGraph import CSRGraph
+from graph import StreamingCrawler
+
+WIKI = "https://en.wikipedia.org"
+
+@pytest.fixture(scope="module")
+def web_graph() -> nx.DiGraph:
+    G = nx.gnp_random_graph(150, 0.04, seed=9, directed=True)
+    return nx.relabel_nodes(G, lambda node: f"{WIKI}/wiki/Article_{node}")
+
+@pytest.fixture(scope="module")
+def server(web_graph):
+    with MockWikiServer(CSRGraph.from_networkx(web_graph)) as server:
+        yield server
+
+@pytest.fixture
+def mirrored(server, monkeypatch):
+    monkeypatch.setattr(wiki, "default_mirror", server.url)
+    monkeypatch.setattr(wiki, "default_cache", None)
+    with WikiFetcher(backoff_factor=0) as fetcher:
+        monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+        yield server
+
+class TestMockWikiServer:
+
+    def test_rendered_page_round_trips(self):
+        links = {f"{WIKI}/wiki/Caf%C3%A9", f"{WIKI}/wiki/Reed_(plant)", f"{WIKI}/wiki/Turkey"}
+        page = render_page("Sipsi", links)
+        assert extract_links(page) == links
+        assert stream_extract_links(page) == links
+
+    def test_pages_match_graph(self, mirrored, web_graph):
+        for url in list(web_graph.nodes)[:20]:
+            assert wiki.get_adj_wiki(url) == set(web_graph.successors(url))
+
+    def test_missing_page(self, mirrored):
+        with pytest.raises(ConnectionError):
+            wiki.get_adj_wiki(f"{WIKI}/wiki/Not_in_the_graph")
+
+    def test_backlinks_with_continuation(self, mirrored, web_graph):
+        url = max(web_graph.nodes, key=web_graph.in_degree)
+        assert wiki.get_backlinks(url, limit=2) == set(web_graph.predecessors(url))
+
+    def test_async_layer_and_bfs(self, mirrored, web_graph):
+        urls = list(web_graph.nodes)[:30]
+        assert wiki.get_adj_wiki_lists(set(urls)) == {url : set(web_graph.successors(url)) for url in urls}
+
+        source, target = list(web_graph.nodes)[0], list(web_graph.nodes)[-1]
+        expected = nx.shortest_path_length(web_graph, source, target) if nx.has_path(web_graph, source, target) else -1
+        assert concurrent_bfs_length(source, target) == expected
+        paths = bfs_paths(source, target)
+        assert (len(paths[0]) - 1 if paths else -1) == expected
+
+    def test_crawler(self, mirrored, web_graph, tmp_path):
+        start = list(web_graph.nodes)[0]
+        crawler = StreamingCrawler(str(tmp_path), concurrency=8)
+        crawler.sprawl({start}, 1)
+        crawled = crawler.load_graph()
+        assert set(crawled.successors(start)) == set(web_graph.successors(start))
+
+    def test_error_injection(self, web_graph):
+        async def fetch_all(server):
+            async with aiohttp.ClientSession() as session:
+                statuses = []
+                for url in list(web_graph.nodes)[:40]:
+                    async with session.get(server.url + url[len(WIKI):]) as response:
+                        statuses.append((response.status, response.headers.get("Retry-After")))
+                return statuses
+
+        async def run():
+            async with MockWikiServer(web_graph, error_rate=0.5, error_statuses=(429, 500), seed=1) as server:
+                return await fetch_all(server), server.stats()
+
+        statuses, stats = asyncio.run(run())
+        failed = [status for status in statuses if status[0] != 200]
+        assert 5 < len(failed) < 35 and stats['errors'] == len(failed)
+        assert all(retry_after == "1" for status, retry_after in failed if status == 429)
+
+    def test_latency(self, web_graph):
+        async def run():
+            async with MockWikiServer(web_graph, latency=0.05, seed=0) as server:
+                async with aiohttp.ClientSession() as session:
+                    async def fetch(url):
+                        async with session.get(server.url + url[len(WIKI):]) as response:
+                            return await response.read()
+                    loop = asyncio.get_running_loop()
+                    start = loop.time()
+                    await asyncio.gather(*(fetch(url) for url in list(web_graph.nodes)[:20]))
+                    return loop.time() - start
+        # the delays overlap, twenty concurrent requests take about one latency
+        assert 0.05 <= asyncio.run(run()) < 0.5
+
+class TestAdaptiveFetching:
+
+    @pytest.fixture
+    def limiters(self, monkeypatch) -> HostLimiters:
+        limiters = HostLimiters(rate=None)
+        monkeypatch.setattr(wiki, "default_limiters", limiters)
+        return limiters
+
+    def test_error_storm_loses_nothing(self, web_graph, limiters, monkeypatch):
+        urls = list(web_graph.nodes)[:40] + [f"{WIKI}/wiki/Not_in_the_graph"]
+
+        async def run(server):
+            async with aiohttp.ClientSession() as session:
+                return [result async for result in wiki.async_fetch_adj_wikis(urls, session, backoff_factor=0, max_retries=20)]
+
+        with MockWikiServer(web_graph, error_rate=0.4, retry_after=0, seed=3) as server:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            results = {result.url : result for result in asyncio.run(run(server))}
+            assert server.stats()['errors'] > 5
+
+        assert set(results) == set(urls)
+        missing = results.pop(f"{WIKI}/wiki/Not_in_the_graph")
+        assert not missing.ok and missing.status == 404 and not missing.retryable and missing.attempts == 1
+        assert all(result.links == set(web_graph.successors(url)) for url, result in results.items())
+        assert max(result.attempts for result in results.values()) > 1
+        limiter = limiters[server.url]
+        assert limiter.congestions == server.stats()['errors'] and limiter.in_flight == 0
+
+    def test_async_get_adj_wiki(self, mirrored, web_graph, limiters, tmp_path):
+        url = list(web_graph.nodes)[0]
+        cache = WikiCache(str(tmp_path / "cache.sqlite"))
+        async def run(url):
+            async with aiohttp.ClientSession() as session:
+                return await wiki.async_get_adj_wiki(url, session, cache=cache)
+        assert asyncio.run(run(url)) == {url : set(web_graph.successors(url))}
+        served = mirrored.stats()['pages_served']
+        assert asyncio.run(run(url)) == {url : set(web_graph.successors(url))}
+        assert mirrored.stats()['pages_served'] == served and cache.stats()['hits'] == 1
+        # an error page is neither parsed nor cached
+        with pytest.raises(ConnectionError):
+            asyncio.run(run(f"{WIKI}/wiki/Not_in_the_graph"))
+        assert not cache.contains(f"{WIKI}/wiki/Not_in_the_graph", "stream_extract_links")
+        cache.close()
+
+    def test_failures_reported(self, mirrored, web_graph, limiters):
+        failures = {}
+        urls = set(list(web_graph.nodes)[:5]) | {f"{WIKI}/wiki/Not_in_the_graph"}
+        mapping = wiki.get_adj_wiki_lists(urls, failures=failures)
+        assert set(mapping) == urls - {f"{WIKI}/wiki/Not_in_the_graph"}
+        assert failures[f"{WIKI}/wiki/Not_in_the_graph"].error == "HTTP 404"
+
+    def test_bfs_through_throttling(self, limiters, monkeypatch):
+        chain = nx.relabel_nodes(nx.path_graph(7, create_using=nx.DiGraph), lambda node: f"{WIKI}/wiki/P{node}")
+        with MockWikiServer(chain, error_rate=0.5, error_statuses=(429,), retry_after=0, seed=2) as server:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            assert concurrent_bfs_length(f"{WIKI}/wiki/P0", f"{WIKI}/wiki/P6") == 6
+            assert server.stats()['errors'] > 0
+
+    def test_incomplete_search(self, limiters, monkeypatch):
+        # Gone redirects to a deleted article
+        G = nx.DiGraph([(f"{WIKI}/wiki/S", f"{WIKI}/wiki/A"), (f"{WIKI}/wiki/S", f"{WIKI}/wiki/Gone")])
+        with MockWikiServer(G, redirects={f"{WIKI}/wiki/Gone" : f"{WIKI}/wiki/Deleted"}) as server:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            # the page that could not be fetched might have led to the target, that isn't "no path"
+            with pytest.raises(ConnectionError):
+                concurrent_bfs_length(f"{WIKI}/wiki/S", f"{WIKI}/wiki/T")
+            failures = {}
+            assert asyncio.run(async_bfs_paths(f"{WIKI}/wiki/S", f"{WIKI}/wiki/T", failures=failures)) == []
+            assert set(failures) == {f"{WIKI}/wiki/Gone"} and failures[f"{WIKI}/wiki/Gone"].status == 404
+
+class TestApiBackend:
+
+    def test_links_match_graph(self, mirrored, web_graph):
+        url = list(web_graph.nodes)[4]
+        served = mirrored.stats()['pages_served']
+        assert wiki.get_adj_wiki(url, backend="api") == set(web_graph.successors(url)) == wiki.get_adj_wiki(url)
+        assert mirrored.stats()['pages_served'] == served + 1
+
+    def test_batched_lists(self, web_graph, monkeypatch):
+        urls = set(list(web_graph.nodes)[:120]) | {f"{WIKI}/wiki/Not_in_the_graph"}
+        with MockWikiServer(web_graph) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+            failures = {}
+            mapping = wiki.get_adj_wiki_lists(urls, backend="api", failures=failures)
+            assert server.stats()['pages_served'] == 0 and server.stats()['api_calls'] == 3
+        assert mapping == {url : set(web_graph.successors(url)) for url in urls - {f"{WIKI}/wiki/Not_in_the_graph"}}
+        assert failures[f"{WIKI}/wiki/Not_in_the_graph"].status == 404
+
+    def test_continuation(self, mirrored, web_graph):
+        urls = list(web_graph.nodes)[:10]
+        query = wiki.LinksQuery(urls, limit=3)
+        responses = 1
+        while query.feed(wiki.default_fetcher.get(wiki.request_url(query.api), params=query.params).json()):
+            responses += 1
+        assert responses == -(-sum(web_graph.out_degree(url) for url in urls) // 3)
+        assert {result.url : result.links for result in query.results()} == {url : set(web_graph.successors(url)) for url in urls}
+
+    def test_redirects_and_normalization(self, web_graph, monkeypatch):
+        redirect, target = f"{WIKI}/wiki/Article_Redirect", f"{WIKI}/wiki/Article_1"
+        monkeypatch.setattr(canonicalUrls, "default_redirects", RedirectMap())
+        with MockWikiServer(web_graph, redirects={redirect : target}) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            query = wiki.LinksQuery([redirect, target])
+            assert query.params['titles'] == "Article Redirect|Article 1"
+            query.feed(fetcher.get(wiki.request_url(query.api), params=query.params).json())
+        assert [result.links for result in query.results()] == [set(web_graph.successors(target))] * 2
+        assert canonicalize(redirect) == target
+
+    def test_cached_separately(self, mirrored, web_graph, tmp_path, monkeypatch):
+        cache = WikiCache(str(tmp_path / "cache.sqlite"))
+        monkeypatch.setattr(wiki, "default_cache", cache)
+        url = list(web_graph.nodes)[6]
+        wiki.get_adj_wiki(url, backend="api")
+        calls = mirrored.stats()['api_calls']
+        assert wiki.get_adj_wiki(url, backend="api") == set(web_graph.successors(url))
+        assert mirrored.stats()['api_calls'] == calls
+        assert cache.get_links(url, wiki.API_LINKS) == set(web_graph.successors(url))
+
+    def test_bfs_with_api_backend(self, mirrored, web_graph, monkeypatch):
+        monkeypatch.setattr(wiki, "default_backend", "html")
+        wiki.use_backend("api")
+        source, target = f"{WIKI}/wiki/Article_2", f"{WIKI}/wiki/Article_9"
+        expected = nx.shortest_path_length(web_graph, source, target) if nx.has_path(web_graph, source, target) else -1
+        served = mirrored.stats()['pages_served']
+        assert concurrent_bfs_length(source, target) == expected
+        assert mirrored.stats()['pages_served'] == served
+        with pytest.raises(ValueError):
+            wiki.use_backend("rest")
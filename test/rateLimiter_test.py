@@ -0,0 +1,73 @@
+import sys
+import time
+import asyncio
+sys.path.append("./src/")
+
+from rateLimiter import AdaptiveLimiter, HostLimiters, parse_retry_after
+
+class TestAdaptiveLimiter:
+
+    def test_window_grows_on_success(self):
+        async def run():
+            limiter = AdaptiveLimiter(rate=None, concurrency=2, max_concurrency=5)
+            for _ in range(40):
+                await limiter.release(await limiter.acquire(), 200)
+            return limiter
+        limiter = asyncio.run(run())
+        assert limiter.concurrency == 5 and limiter.successes == 40
+
+    def test_window_halves_once_per_round_trip(self):
+        async def run():
+            limiter = AdaptiveLimiter(rate=None, concurrency=8)
+            # a storm of 429s for requests sent together only counts once
+            started = [await limiter.acquire() for _ in range(8)]
+            for start in started:
+                await limiter.release(start, 429)
+            after_storm = limiter.concurrency
+            await limiter.release(await limiter.acquire(), 503)
+            return after_storm, limiter
+        after_storm, limiter = asyncio.run(run())
+        assert after_storm == 4 and limiter.concurrency == 2 and limiter.congestions == 9
+
+    def test_window_caps_in_flight(self):
+        async def run():
+            limiter = AdaptiveLimiter(rate=None, concurrency=3, max_concurrency=3)
+            peak = 0
+            async def request():
+                nonlocal peak
+                started = await limiter.acquire()
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+                await limiter.release(started, 200)
+            await asyncio.gather(*(request() for _ in range(20)))
+            return peak
+        assert asyncio.run(run()) == 3
+
+    def test_token_bucket_rate(self):
+        async def run():
+            limiter = AdaptiveLimiter(rate=100, burst=5, concurrency=64)
+            start = time.monotonic()
+            for _ in range(25):
+                await limiter.release(await limiter.acquire(), 200)
+            return time.monotonic() - start
+        # the burst goes straight through, the other twenty wait for a token each
+        assert 0.18 <= asyncio.run(run()) < 1.0
+
+    def test_retry_after_pauses(self):
+        async def run():
+            limiter = AdaptiveLimiter(rate=None)
+            await limiter.release(await limiter.acquire(), 429, retry_after=0.2)
+            start = time.monotonic()
+            await limiter.acquire()
+            return time.monotonic() - start
+        assert asyncio.run(run()) >= 0.19
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after(None) is None and parse_retry_after("soon") is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+    def test_host_limiters(self):
+        limiters = HostLimiters(rate=None)
+        assert limiters["https://en.wikipedia.org/wiki/Cat"] is limiters["https://en.wikipedia.org/wiki/Dog"]
+        assert limiters["http://127.0.0.1:8080/wiki/Cat"] is not limiters["https://en.wikipedia.org/wiki/Cat"]
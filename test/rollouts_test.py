@@ -0,0 +1,116 @@
+import pytest
+import sys
+import numpy as np
+import networkx as nx
+import torch
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+from csrGraph import CSRGraph
+from embeddings import EmbeddingIndex
+from agent import ActorNN, CriticNN
+from rollouts import RolloutBuffer, EpisodeRunner, discounted_returns, neighbour_actions
+from wikiGameEnvironment import BatchedWikiEnvironment
+from train import train_distributed, train_agent
+
+class TestRollouts:
+
+    @pytest.fixture
+    def saved(self, tmp_path):
+        G = nx.gnp_random_graph(60, 0.08, seed=3, directed=True)
+        graph = CSRGraph.from_networkx(nx.relabel_nodes(G, lambda node: f"https://en.wikipedia.org/wiki/{node}"))
+        vectors = np.random.default_rng(0).normal(size=(len(graph), 8)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        graph.save(str(tmp_path / "graph"))
+        EmbeddingIndex(graph.nodes, vectors).save(str(tmp_path / "embeddings"))
+        return graph, vectors, str(tmp_path / "graph"), str(tmp_path / "embeddings")
+
+    def test_discounted_returns(self):
+        assert np.allclose(discounted_returns(np.array([1.0, 2.0, 3.0]), 0.5), [2.75, 3.5, 3.0])
+
+    def test_buffer_tensors_match_env(self, saved):
+        graph, vectors, _, _ = saved
+        env = BatchedWikiEnvironment(graph, num_envs=1, max_steps=4, seed=0)
+        expected_actions, actions = [], []
+        while not env.done[0]:
+            action_ids, mask = env.get_actions()
+            expected_actions.append(action_ids[0][mask[0]])
+            actions.append(int(mask[0].sum()) - 1)
+            env.step(np.array(actions[-1:]))
+        trajectory = {'path' : env.path[0, :env.length[0]].copy(), 'target' : int(env.target[0]),
+                      'actions' : np.array(actions, dtype=np.int32), 'rewards' : np.zeros(len(actions), dtype=np.float32),
+                      'log_probs' : np.zeros(len(actions), dtype=np.float32)}
+
+        buffer = RolloutBuffer(graph, vectors)
+        buffer.add(trajectory)
+        buffer._flatten()
+        batch = buffer.tensors(np.arange(len(buffer)))
+        assert batch['path_lengths'].tolist() == list(range(len(actions)))
+        for t, expected in enumerate(expected_actions):
+            assert batch['action_mask'][t].sum().item() == len(expected)
+            assert torch.allclose(batch['action_embs'][t, :len(expected)], torch.as_tensor(vectors[expected]))
+            assert torch.allclose(batch['path'][t, :t], torch.as_tensor(vectors[trajectory['path'][:t]]))
+
+    def test_gae_matches_loop(self, saved):
+        graph, vectors, _, _ = saved
+        env = BatchedWikiEnvironment(graph, num_envs=8, max_steps=6, embeddings=vectors, seed=4)
+        runner, buffer = EpisodeRunner(env, vectors), RolloutBuffer(graph, vectors)
+        actor, critic = ActorNN(8, 16), CriticNN(8, 16)
+        while len(buffer.trajectories) < 10:
+            for trajectory in runner.step(actor):
+                buffer.add(trajectory)
+        buffer.compute_advantages(critic, gamma=0.9, gae_lambda=0.8)
+
+        with torch.no_grad():
+            batch = buffer.tensors(np.arange(len(buffer)))
+            values = critic(batch['target'], batch['current'], batch['path'], path_lengths=batch['path_lengths']).squeeze(-1).numpy()
+        assert any(trajectory['truncated'] for trajectory in buffer.trajectories)
+        start = 0
+        for trajectory in buffer.trajectories:
+            n = len(trajectory['actions'])
+            # the games cut off by max_steps are bootstrapped with the value of their last article
+            bootstrap = 0.0
+            if trajectory['truncated']:
+                path = torch.as_tensor(vectors[trajectory['path'][None, :n]])
+                with torch.no_grad():
+                    bootstrap = critic(torch.as_tensor(vectors[trajectory['target']])[None], torch.as_tensor(vectors[trajectory['path'][n]])[None],
+                                       path, path_lengths=torch.as_tensor([n])).item()
+            episode_values = np.append(values[start:start + n], bootstrap)
+            advantage = 0.0
+            for t in reversed(range(n)):
+                delta = trajectory['rewards'][t] + 0.9 * episode_values[t + 1] - episode_values[t]
+                advantage = delta + 0.9 * 0.8 * advantage
+                assert buffer.advantages[start + t] == pytest.approx(advantage, rel=1e-4, abs=1e-3)
+            start += n
+        assert np.allclose(buffer.returns, buffer.advantages + values, atol=1e-4)
+
+    def test_neighbour_actions_cap(self, saved):
+        graph = saved[0]
+        action_ids, mask = neighbour_actions(graph, np.arange(len(graph)), max_actions=2)
+        assert mask.sum(axis=1).max() <= 2
+        assert np.all(mask.sum(axis=1) == np.minimum(graph.out_degrees(), 2))
+
+    def test_train_distributed(self, saved):
+        _, _, graph_directory, embedding_directory = saved
+        torch.manual_seed(0)
+        actor, critic = ActorNN(embedding_dim=8, hidden_dim=16), CriticNN(embedding_dim=8, hidden_dim=16)
+        before = [parameter.detach().clone() for parameter in actor.parameters()]
+
+        train_distributed(graph_directory, embedding_directory, actor, critic, num_workers=2, updates=3,
+                          episodes_per_update=4, broadcast_every=1, envs_per_worker=4, max_steps=5, seed=0)
+        assert any(not torch.equal(old, new) for old, new in zip(before, actor.parameters()))
+
+    def test_train_agent(self, saved):
+        graph, vectors, _, _ = saved
+        torch.manual_seed(0)
+        actor, critic = ActorNN(embedding_dim=8, hidden_dim=16), CriticNN(embedding_dim=8, hidden_dim=16)
+        before = [parameter.detach().clone() for parameter in critic.parameters()]
+        env = BatchedWikiEnvironment(graph, num_envs=8, max_steps=5, embeddings=vectors, seed=0)
+        train_agent(env, actor, critic, episodes=40, batch_steps=64, epochs=2, minibatch_size=16, seed=0)
+        assert any(not torch.equal(old, new) for old, new in zip(before, critic.parameters()))
+
+    def test_misaligned_embeddings(self, saved, tmp_path):
+        graph, vectors, graph_directory, _ = saved
+        EmbeddingIndex(list(reversed(graph.nodes)), vectors).save(str(tmp_path / "reversed"))
+        with pytest.raises(ValueError):
+            train_distributed(graph_directory, str(tmp_path / "reversed"), ActorNN(8, 16), CriticNN(8, 16))
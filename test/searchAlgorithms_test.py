@@ -0,0 +1,155 @@
+import pytest
+import sys
+import random
+import asyncio
+import networkx as nx
+sys.path.append("./src/")
+
+import wikiLinkRetrieval as wiki
+import canonicalUrls
+from canonicalUrls import canonicalize
+from searchAlgorithms import (
+    bidirectional_paths, graph_neighbours, live_neighbours, bfs_length, bfs_paths, async_bfs_paths
+)
+
+def graph_responses(G : nx.DiGraph, fetched : list, delay = lambda url: 0.001 * (hash(url) % 7)):
+    """Stands in for wiki.async_iter_adj_wikis, serves a layer from the graph with a per page delay
+    and records which pages were actually fetched"""
+    async def responses(urls):
+        async def fetch(url):
+            await asyncio.sleep(delay(url))
+            fetched.append(url)
+            return url, set(G.successors(url))
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return responses
+
+class TestBidirectionalBFS:
+
+    @pytest.fixture
+    def random_graph(self) -> nx.DiGraph:
+        return nx.gnp_random_graph(300, 0.015, seed=7, directed=True)
+
+    def test_matches_networkx_paths(self, random_graph):
+        successors, predecessors = graph_neighbours(random_graph)
+        rng = random.Random(3)
+        for _ in range(50):
+            source, target = rng.sample(list(random_graph.nodes), 2)
+            paths = bidirectional_paths(source, target, successors, predecessors)
+            try:
+                expected = sorted(nx.all_shortest_paths(random_graph, source, target))
+            except nx.NetworkXNoPath:
+                expected = []
+            assert sorted(paths) == expected
+
+    def test_single_path(self, random_graph):
+        successors, predecessors = graph_neighbours(random_graph)
+        paths = bidirectional_paths(0, 5, successors, predecessors, all_paths=False)
+        assert len(paths) == 1 and len(paths[0]) - 1 == nx.shortest_path_length(random_graph, 0, 5)
+
+    def test_no_path(self):
+        G = nx.DiGraph([("A", "B"), ("C", "A")])
+        assert bfs_length("A", "C", G) == -1
+        assert bfs_paths("A", "C", G) == []
+
+    def test_same_node(self):
+        G = nx.DiGraph([("A", "B")])
+        assert bfs_paths("A", "A", G) == [["A"]]
+        assert bfs_length("A", "A", G) == 0
+
+    def test_bfs_length_on_graph(self):
+        G = nx.DiGraph([("A", "B"), ("B", "C"), ("C", "D"), ("A", "E"), ("E", "D")])
+        assert bfs_length("A", "D", G) == 2
+        assert bfs_paths("A", "D", G) == [["A", "E", "D"]]
+
+    def test_max_depth(self):
+        G = nx.path_graph(10, create_using=nx.DiGraph)
+        successors, predecessors = graph_neighbours(G)
+        assert bidirectional_paths(0, 9, successors, predecessors, max_depth=5) == []
+        assert bidirectional_paths(0, 9, successors, predecessors, max_depth=9) == [list(range(10))]
+
+    def test_live_sides_meet(self, monkeypatch):
+        # the hrefs are percent encoded while the backlinks are built from titles
+        WIKI = "https://en.wikipedia.org/wiki"
+        hrefs = {f"{WIKI}/S" : {f"{WIKI}/A", f"{WIKI}/B"}, f"{WIKI}/A" : {f"{WIKI}/Rock_%26_roll"}, f"{WIKI}/B" : set()}
+        monkeypatch.setattr(wiki, "get_adj_wiki", lambda url: hrefs[url])
+        monkeypatch.setattr(wiki, "get_backlinks", lambda url: {source for source, links in hrefs.items()
+                                                                if url in {wiki.title_to_url(wiki.clean_wiki_link(link)) for link in links}})
+        successors, _ = live_neighbours()
+        assert successors(f"{WIKI}/A") == {canonicalize(f"{WIKI}/Rock_&_roll")}
+        # the backward side verifies the backlink A against A's (canonicalized) hrefs
+        assert bfs_paths(f"{WIKI}/S", f"{WIKI}/Rock_&_roll") == [[f"{WIKI}/S", f"{WIKI}/A", canonicalize(f"{WIKI}/Rock_&_roll")]]
+
+    def test_live_ids_per_search(self, monkeypatch):
+        WIKI = "https://en.wikipedia.org/wiki"
+        hrefs = {f"{WIKI}/S" : {f"{WIKI}/A"}, f"{WIKI}/A" : {f"{WIKI}/T"}, f"{WIKI}/T" : set()}
+        monkeypatch.setattr(wiki, "get_adj_wiki", lambda url: hrefs[url])
+        monkeypatch.setattr(wiki, "get_backlinks", lambda url: {source for source, links in hrefs.items() if url in links})
+        known = len(canonicalUrls.default_interner)
+        assert bfs_length(f"{WIKI}/S", f"{WIKI}/T") == 2
+        assert len(canonicalUrls.default_interner) == known
+
+    @pytest.fixture
+    def link_table(self, monkeypatch):
+        """S -> A -> T in the main text, S -> B -> C -> T too but B also links T from a navbox (only the backlinks see it)"""
+        WIKI = "https://en.wikipedia.org/wiki"
+        hrefs = {f"{WIKI}/S" : {f"{WIKI}/B"}, f"{WIKI}/B" : {f"{WIKI}/C"}, f"{WIKI}/C" : {f"{WIKI}/T"}, f"{WIKI}/T" : set()}
+        navboxes = {f"{WIKI}/T" : {f"{WIKI}/B"}}
+        fetched = []
+        def get_adj_wiki(url):
+            fetched.append(url)
+            return hrefs[url]
+        monkeypatch.setattr(wiki, "get_adj_wiki", get_adj_wiki)
+        monkeypatch.setattr(wiki, "get_backlinks", lambda url: {source for source, links in hrefs.items() if url in links}
+                                                               | navboxes.get(url, set()))
+        return WIKI, hrefs, fetched
+
+    def test_backlinks_unverified_by_default(self, link_table):
+        WIKI, _, fetched = link_table
+        successors, predecessors = live_neighbours()
+        assert predecessors(f"{WIKI}/T") == {f"{WIKI}/B", f"{WIKI}/C"} and fetched == []
+
+    def test_live_paths_verified(self, link_table):
+        WIKI, hrefs, fetched = link_table
+        # S -> B -> T only exists in the link table, the exact search finds the playable path
+        assert bfs_paths(f"{WIKI}/S", f"{WIKI}/T") == [[f"{WIKI}/S", f"{WIKI}/B", f"{WIKI}/C", f"{WIKI}/T"]]
+        # once a shortest path verifies, no other backlinker is fetched
+        hrefs[f"{WIKI}/S"].add(f"{WIKI}/A")
+        hrefs[f"{WIKI}/A"] = {f"{WIKI}/T"}
+        hrefs[f"{WIKI}/B"].add(f"{WIKI}/T")
+        fetched.clear()
+        assert sorted(bfs_paths(f"{WIKI}/S", f"{WIKI}/T")) == [[f"{WIKI}/S", f"{WIKI}/A", f"{WIKI}/T"],
+                                                              [f"{WIKI}/S", f"{WIKI}/B", f"{WIKI}/T"]]
+        assert bfs_length(f"{WIKI}/S", f"{WIKI}/T") == 2
+        assert f"{WIKI}/C" not in fetched
+
+class TestConcurrentBFS:
+
+    @pytest.fixture
+    def random_graph(self) -> nx.DiGraph:
+        return nx.gnp_random_graph(200, 0.02, seed=11, directed=True)
+
+    def test_matches_networkx_paths(self, random_graph):
+        rng = random.Random(5)
+        for _ in range(20):
+            source, target = rng.sample(list(random_graph.nodes), 2)
+            paths = asyncio.run(async_bfs_paths(source, target, all_paths=True, responses=graph_responses(random_graph, [])))
+            try:
+                expected = sorted(nx.all_shortest_paths(random_graph, source, target))
+            except nx.NetworkXNoPath:
+                expected = []
+            assert sorted(paths) == expected
+
+    def test_early_termination_cancels_layer(self):
+        # the target hangs off the first page of a wide layer, the rest of the layer should never finish
+        G = nx.DiGraph([("S", f"L{i}") for i in range(50)] + [("L0", "T")])
+        fetched = []
+        paths = asyncio.run(async_bfs_paths("S", "T", responses=graph_responses(G, fetched, delay=lambda url: 0 if url in ("S", "L0") else 0.05)))
+        assert paths == [["S", "L0", "T"]]
+        assert len(fetched) < 51
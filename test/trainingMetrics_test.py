@@ -0,0 +1,100 @@
+import pytest
+import sys
+import csv
+import json
+import time
+import pstats
+import numpy as np
+import networkx as nx
+import torch
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+from csrGraph import CSRGraph
+from agent import ActorNN, CriticNN
+from wikiGameEnvironment import BatchedWikiEnvironment
+from trainingMetrics import TrainingMetrics
+from train import train_agent
+
+class RecordingWriter:
+    """stands in for a TensorBoard SummaryWriter"""
+
+    def __init__(self):
+        self.scalars = []
+
+    def add_scalar(self, tag, value, step):
+        self.scalars.append((tag, value, step))
+
+class TestTrainingMetrics:
+
+    def test_window(self):
+        metrics = TrainingMetrics()
+        with metrics.phase("env"):
+            time.sleep(0.01)
+        metrics.count_steps(10, np.array([2, 4]))
+        metrics.count_episodes(2)
+        row = metrics.record(0, loss=1.5)
+        assert row['phase_env'] >= 0.01
+        assert row['steps'] == 10 and row['episodes'] == 2 and row['steps_per_s'] > 0
+        assert row['mean_actions'] == 3 and row['max_actions'] == 4
+        assert row['loss'] == 1.5
+        # the next window starts from zero but the totals carry on
+        metrics.count_steps(5)
+        row = metrics.record(1)
+        assert row['steps'] == 5 and row['total_steps'] == 15 and 'phase_env' not in row
+
+    @pytest.mark.parametrize("name", ["log.csv", "log.jsonl"])
+    def test_log_files(self, tmp_path, name):
+        path = str(tmp_path / name)
+        metrics = TrainingMetrics(log_path=path)
+        for update in range(3):
+            with metrics.phase("forward"):
+                pass
+            metrics.record(update, loss=float(update))
+
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f)) if name.endswith(".csv") else [json.loads(line) for line in f]
+        assert [float(row['loss']) for row in rows] == [0.0, 1.0, 2.0]
+        assert all('phase_forward' in row for row in rows)
+
+    def test_bad_log_extension(self, tmp_path):
+        with pytest.raises(ValueError):
+            TrainingMetrics(log_path=str(tmp_path / "log.txt"))
+
+    def test_writer(self):
+        writer = RecordingWriter()
+        metrics = TrainingMetrics(writer=writer)
+        metrics.record(7, loss=0.5)
+        assert ('loss', 0.5, 7) in writer.scalars
+        assert any(tag == 'rss_mb' for tag, _, _ in writer.scalars)
+
+    def test_profiling_stops_after_episodes(self, tmp_path):
+        path = str(tmp_path / "run.prof")
+        metrics = TrainingMetrics(profile_episodes=3, profile_path=path)
+        # nothing before the loop starts the first episode is profiled
+        assert metrics._profiler is None
+        metrics.start_profiling()
+        metrics.count_episodes(2)
+        assert metrics._profiler is not None
+        metrics.count_episodes(1)
+        assert metrics._profiler is None
+        assert pstats.Stats(path).total_calls > 0
+        metrics.start_profiling()
+        assert metrics._profiler is None
+
+    def test_train_agent_reports(self, tmp_path):
+        G = nx.gnp_random_graph(40, 0.1, seed=5, directed=True)
+        graph = CSRGraph.from_networkx(nx.relabel_nodes(G, str))
+        vectors = np.random.default_rng(1).normal(size=(len(graph), 8)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        env = BatchedWikiEnvironment(graph, num_envs=8, max_steps=5, embeddings=vectors, seed=0)
+
+        metrics = TrainingMetrics(log_path=str(tmp_path / "train.jsonl"), profile_episodes=5, profile_path=str(tmp_path / "train.prof"))
+        torch.manual_seed(0)
+        train_agent(env, ActorNN(8, 16), CriticNN(8, 16), episodes=30, batch_steps=32, epochs=1, minibatch_size=16, metrics=metrics)
+
+        assert metrics.rows and metrics.total_episodes >= 30
+        for phase in ("phase_env", "phase_embed", "phase_act_forward", "phase_value_forward", "phase_train_forward", "phase_backward"):
+            assert phase in metrics.rows[0]
+        assert metrics.rows[0]['mean_actions'] > 0 and 'actor_loss' in metrics.rows[0]
+        assert (tmp_path / "train.prof").exists()
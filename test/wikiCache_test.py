@@ -0,0 +1,134 @@
+import pytest
+import sys
+import networkx as nx
+sys.path.append("./src/")
+
+import wikiLinkRetrieval as wiki
+from wikiCache import WikiCache, canonical_url, extract_revision
+from wikiLinkRetrieval import stream_extract_links
+from wikiFetcher import WikiFetcher
+from mockWikiServer import MockWikiServer
+
+class TestWikiCache:
+
+    @pytest.fixture
+    def cache(self, tmp_path) -> WikiCache:
+        cache = WikiCache(str(tmp_path / "cache.sqlite"))
+        yield cache
+        cache.close()
+
+    @pytest.fixture
+    def sipsi(self) -> bytes:
+        with open("test/fixtures/Sipsi.html",'rb') as file:
+            return file.read()
+
+    ############################ Canonical Url Tests ############################
+
+    def test_canonical_url_encoding(self):
+        assert canonical_url("https://en.wikipedia.org/wiki/B%C3%BClban") == canonical_url("https://en.wikipedia.org/wiki/Bülban")
+
+    def test_canonical_url_fragment_and_spaces(self):
+        assert canonical_url("http://EN.wikipedia.org/wiki/Reed (plant)#Uses") == "https://en.wikipedia.org/wiki/Reed_(plant)"
+
+    ############################ Tier Tests ############################
+
+    def test_links_round_trip(self, cache):
+        links = {"https://en.wikipedia.org/wiki/Clarinet", "https://en.wikipedia.org/wiki/Turkey"}
+        cache.put_links("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links", links)
+        assert cache.lookup("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links) == links
+        assert cache.stats()['hits'] == 1
+
+    def test_html_tier_reparses(self, cache, sipsi):
+        cache.put_html("https://en.wikipedia.org/wiki/Sipsi", sipsi)
+        assert cache.lookup("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links) == stream_extract_links(sipsi)
+        # the reparsed links are written back to the adjacency tier
+        cache.lookup("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links)
+        assert cache.stats()['html_hits'] == 1 and cache.stats()['hits'] == 1
+
+    def test_miss(self, cache):
+        assert cache.lookup("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links) is None
+        assert cache.stats()['misses'] == 1
+
+    def test_contains_counts_nothing(self, cache, sipsi):
+        cache.put_html("https://en.wikipedia.org/wiki/Sipsi", sipsi)
+        assert cache.contains("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links")
+        assert not cache.contains("https://en.wikipedia.org/wiki/Cornet", "stream_extract_links")
+        assert cache.stats()['hits'] == cache.stats()['html_hits'] == cache.stats()['misses'] == 0
+
+    ############################ Invalidation Tests ############################
+
+    def test_ttl_expiry(self, tmp_path):
+        cache = WikiCache(str(tmp_path / "ttl.sqlite"), ttl=-1)
+        cache.put_links("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links", {"https://en.wikipedia.org/wiki/Turkey"})
+        assert cache.get_links("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links") is None
+        cache.close()
+
+    def test_revision_invalidation(self, cache, sipsi):
+        cache.store("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links, sipsi, stream_extract_links(sipsi))
+        revision = extract_revision(sipsi)
+        assert cache.get_links("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links", revision) is not None
+        assert cache.get_links("https://en.wikipedia.org/wiki/Sipsi", "stream_extract_links", "0") is None
+
+    def test_lru_eviction(self, tmp_path):
+        cache = WikiCache(str(tmp_path / "lru.sqlite"), max_bytes=150)
+        cache.put_links("https://en.wikipedia.org/wiki/A", "p", {"https://en.wikipedia.org/wiki/" + "a" * 40})
+        cache.put_links("https://en.wikipedia.org/wiki/B", "p", {"https://en.wikipedia.org/wiki/" + "b" * 40})
+        cache.get_links("https://en.wikipedia.org/wiki/A", "p")
+        cache.put_links("https://en.wikipedia.org/wiki/C", "p", {"https://en.wikipedia.org/wiki/" + "c" * 40})
+        assert cache.get_links("https://en.wikipedia.org/wiki/B", "p") is None
+        assert cache.get_links("https://en.wikipedia.org/wiki/A", "p") is not None
+        cache.close()
+
+    def test_running_size(self, cache, sipsi):
+        cache.put_links("https://en.wikipedia.org/wiki/A", "p", {"https://en.wikipedia.org/wiki/B"})
+        cache.put_links("https://en.wikipedia.org/wiki/A", "p", {"https://en.wikipedia.org/wiki/C", "https://en.wikipedia.org/wiki/D"})
+        cache.store("https://en.wikipedia.org/wiki/Sipsi", stream_extract_links, sipsi, stream_extract_links(sipsi))
+        cache.put_html("https://en.wikipedia.org/wiki/Sipsi", sipsi)
+        assert cache.size() == cache._scan_size()
+        cache.invalidate("https://en.wikipedia.org/wiki/Sipsi")
+        assert cache.size() == cache._scan_size() == len("https://en.wikipedia.org/wiki/C\nhttps://en.wikipedia.org/wiki/D")
+
+    def test_access_times_batched(self, tmp_path):
+        cache = WikiCache(str(tmp_path / "batched.sqlite"), access_batch=2)
+        last_access = lambda: cache.connection.execute("SELECT last_access FROM links").fetchone()[0]
+        cache.put_links("https://en.wikipedia.org/wiki/A", "p", {"https://en.wikipedia.org/wiki/B"})
+        cache.put_html("https://en.wikipedia.org/wiki/C", b"<html></html>")
+        stored = last_access()
+        cache.get_links("https://en.wikipedia.org/wiki/A", "p")
+        cache.get_links("https://en.wikipedia.org/wiki/A", "p")
+        assert last_access() == stored
+        # the second page accessed fills the batch
+        cache.get_html("https://en.wikipedia.org/wiki/C")
+        assert last_access() > stored
+        cache.close()
+
+    ############################ Fetch Integration Tests ############################
+
+    def test_get_adj_wiki_served_from_cache(self, cache, sipsi, monkeypatch):
+        cache.put_html("https://en.wikipedia.org/wiki/Sipsi", sipsi)
+
+        def no_network(*args, **kwargs):
+            raise AssertionError("the network should not be used on a cache hit")
+        monkeypatch.setattr(wiki.WikiFetcher, "get", no_network)
+
+        assert wiki.get_adj_wiki("https://en.wikipedia.org/wiki/Sipsi", cache=cache) == stream_extract_links(sipsi)
+
+    def test_revalidation(self, tmp_path, monkeypatch):
+        G = nx.DiGraph([("https://en.wikipedia.org/wiki/A", "https://en.wikipedia.org/wiki/B"),
+                        ("https://en.wikipedia.org/wiki/B", "https://en.wikipedia.org/wiki/A")])
+        cache = WikiCache(str(tmp_path / "revalidate.sqlite"), revalidate=True)
+        with MockWikiServer(G) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+            for backend in ("html", "api"):
+                assert wiki.get_adj_wiki("https://en.wikipedia.org/wiki/A", cache=cache, backend=backend) == {"https://en.wikipedia.org/wiki/B"}
+            assert wiki.get_adj_wiki_lists({"https://en.wikipedia.org/wiki/A"}, cache=cache) == {"https://en.wikipedia.org/wiki/A" : {"https://en.wikipedia.org/wiki/B"}}
+            # served from the cache while the article is unchanged
+            assert server.stats()['pages_served'] == 1 and cache.stats()['hits'] == 1
+
+            server.revisions["https://en.wikipedia.org/wiki/A"] = 2
+            assert wiki.get_adj_wiki("https://en.wikipedia.org/wiki/A", cache=cache) == {"https://en.wikipedia.org/wiki/B"}
+            assert wiki.get_adj_wiki_lists({"https://en.wikipedia.org/wiki/A"}, cache=cache, backend="api")
+            assert server.stats()['pages_served'] == 2
+            assert cache.get_links("https://en.wikipedia.org/wiki/A", wiki.API_LINKS, "2") is not None
+        cache.close()
@@ -0,0 +1,109 @@
+import pytest
+import sys
+import gzip
+import threading
+import asyncio
+import aiohttp
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+sys.path.append("./src/")
+
+import wikiLinkRetrieval as wiki
+from wikiFetcher import WikiFetcher
+from wikiLinkRetrieval import stream_extract_links
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    """Serves the fixture pages under /wiki/<name>, gzipped when asked to, and fails the first few requests
+    to /flaky/<name> with a 503"""
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    flaky_failures = 0
+
+    def setup(self):
+        super().setup()
+        StubWikiHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/flaky/") and StubWikiHandler.flaky_failures > 0:
+            StubWikiHandler.flaky_failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        name = unquote(self.path.split("/")[-1]).replace("_", " ")
+        try:
+            with open(f"test/fixtures/{name}.html", 'rb') as file:
+                body = file.read()
+        except FileNotFoundError:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture(scope="module")
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+class TestWikiFetcher:
+
+    @pytest.fixture
+    def fetcher(self):
+        with WikiFetcher(backoff_factor=0) as fetcher:
+            yield fetcher
+
+    def test_fetches_fixture(self, server, fetcher):
+        with open("test/fixtures/Sipsi.html",'rb') as file:
+            assert fetcher.fetch(f"{server}/wiki/Sipsi") == file.read()
+
+    def test_keep_alive_reuses_connection(self, server, fetcher):
+        StubWikiHandler.connections = 0
+        for name in ["Sipsi", "Cornet", "Rusty_breasted_nunlet", "Sipsi"]:
+            fetcher.fetch(f"{server}/wiki/{name}")
+        assert StubWikiHandler.connections == 1
+
+    def test_retries_on_503(self, server, fetcher):
+        StubWikiHandler.flaky_failures = 2
+        assert fetcher.get(f"{server}/flaky/Cornet").status_code == 200
+
+    def test_get_adj_wiki_uses_fetcher(self, server, fetcher):
+        with open("test/fixtures/Cornet.html",'rb') as file:
+            answer = stream_extract_links(file.read())
+        assert wiki.get_adj_wiki(f"{server}/wiki/Cornet", fetcher=fetcher) == answer
+
+    def test_get_adj_wiki_missing_page(self, server, fetcher):
+        with pytest.raises(ConnectionError):
+            wiki.get_adj_wiki(f"{server}/wiki/Does_not_exist", fetcher=fetcher)
+
+class TestAsyncFetch:
+
+    def test_iter_adj_wikis(self, server):
+        failures = {}
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return {url : links async for url, links in
+                        wiki.async_iter_adj_wikis([f"{server}/wiki/Sipsi", f"{server}/wiki/Cornet", f"{server}/wiki/Missing"],
+                                                  session, workers=2, failures=failures)}
+
+        results = asyncio.run(collect())
+        with open("test/fixtures/Cornet.html",'rb') as file:
+            assert results[f"{server}/wiki/Cornet"] == stream_extract_links(file.read())
+        assert set(results) == {f"{server}/wiki/Sipsi", f"{server}/wiki/Cornet"}
+        assert set(failures) == {f"{server}/wiki/Missing"}
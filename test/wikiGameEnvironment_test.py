@@ -0,0 +1,103 @@
+import pytest
+import sys
+import numpy as np
+import networkx as nx
+sys.path.append("./src/")
+sys.path.append("./src/RL agent/")
+
+from csrGraph import CSRGraph
+from wikiGameEnvironment import WikiEnvironment, BatchedWikiEnvironment
+
+class TestBatchedWikiEnvironment:
+
+    @pytest.fixture
+    def graph(self) -> CSRGraph:
+        G = nx.gnp_random_graph(100, 0.05, seed=2, directed=True)
+        return CSRGraph.from_networkx(nx.relabel_nodes(G, str))
+
+    def test_actions_are_neighbours(self, graph):
+        env = BatchedWikiEnvironment(graph, num_envs=64, seed=0)
+        action_ids, mask = env.get_actions()
+        for game in range(64):
+            assert sorted(action_ids[game][mask[game]]) == sorted(graph.out_neighbors(env.current[game]).tolist())
+            assert np.all(action_ids[game][~mask[game]] == -1)
+
+    def test_step_moves_and_records_path(self, graph):
+        env = BatchedWikiEnvironment(graph, num_envs=32, max_steps=5, seed=1)
+        rng = np.random.default_rng(0)
+        while not env.done.all():
+            action_ids, mask = env.get_actions()
+            before = env.done.copy()
+            actions = (rng.random(32) * np.maximum(mask.sum(axis=1), 1)).astype(int)
+            chosen = action_ids[np.arange(32), actions]
+            _, rewards, done = env.step(actions)
+            assert np.all(env.current[~before] == chosen[~before])
+            assert np.all(rewards[before] == 0)
+
+        for game in range(32):
+            path = env.path[game][:env.length[game]]
+            assert all(graph.out_neighbors(u).tolist().count(v) for u, v in zip(path, path[1:]))
+            assert env.length[game] <= 6
+            # only the games that ran out of steps short of the target and of a dead end are truncated
+            assert env.truncated[game] == (env.length[game] == 6 and env.current[game] != env.target[game]
+                                           and env.degrees[env.current[game]] > 0)
+
+    def test_success_reward(self, graph):
+        env = BatchedWikiEnvironment(graph, num_envs=1, seed=0)
+        start = int(env.start_candidates[0])
+        target = int(graph.out_neighbors(start)[0])
+        env.reset(starts=np.array([start]), targets=np.array([target]))
+        _, rewards, done = env.step(np.array([0]))
+        assert done[0] and rewards[0] == env.success_reward
+
+    def test_reset_done(self, graph):
+        env = BatchedWikiEnvironment(graph, num_envs=8, max_steps=1, seed=3)
+        env.step(np.zeros(8, dtype=int))
+        assert env.done.all()
+        assert len(env.reset_done()) == 8 and not env.done.any()
+
+    def test_single_node_graph(self):
+        with pytest.raises(ValueError):
+            BatchedWikiEnvironment(CSRGraph.from_networkx(nx.DiGraph([("0", "0")])), num_envs=1)
+
+    def test_invalid_action(self, graph):
+        env = BatchedWikiEnvironment(graph, num_envs=4, seed=0)
+        with pytest.raises(ValueError):
+            env.step(np.full(4, 10_000))
+
+class TestWikiEnvironmentState:
+
+    @pytest.fixture
+    def line_graph(self) -> nx.DiGraph:
+        return nx.DiGraph([("A", "B"), ("B", "C"), ("C", "D"), ("D", "E")])
+
+    @pytest.fixture
+    def embedder(self):
+        calls = []
+        def embed(node):
+            calls.append(node)
+            return np.array([ord(node), 1.0], dtype=np.float32)
+        embed.calls = calls
+        return embed
+
+    def test_state_is_incremental(self, line_graph, embedder):
+        env = WikiEnvironment(line_graph, embedder, init_node="A", target_node="E")
+        for _ in range(3):
+            env.step(np.ones(2))
+        embedder.calls.clear()
+
+        state = env.get_state()
+        assert embedder.calls == []
+        assert np.array_equal(state['path'], [embedder(node) for node in ["A", "B", "C"]])
+        assert np.array_equal(state['current article'], embedder("D"))
+        assert np.array_equal(state['target article'], embedder("E"))
+
+    def test_path_deltas(self, line_graph, embedder):
+        env = WikiEnvironment(line_graph, embedder, init_node="A", target_node="E", path_deltas=True)
+        assert env.get_state()['path delta'] == []
+        state, reward, done = env.step(np.ones(2))
+        assert state['path delta'] == ["A"]
+        state, reward, done = env.step(np.ones(2))
+        assert state['path delta'] == ["B"]
+        assert np.array_equal(state['path delta embeddings'], [embedder("B")])
+        assert env.get_state()['path delta'] == []
@@ -1,11 +1,21 @@
 import pytest
 import sys
+import time
+import numpy as np
+import networkx as nx
+from gensim.models import KeyedVectors
 from typing import Dict,Tuple,Set
 sys.path.append("./src/")
 
+import wikiLinkRetrieval as wiki
 from wikiLinkRetrieval import (
-    extract_links, clean_wiki_link, format_path
+    extract_links, stream_extract_links, clean_wiki_link, format_path
 )
+from wikiFetcher import WikiFetcher
+from mockWikiServer import MockWikiServer
+from embeddings import EncoderCache
+from wikiCache import WikiCache
+from searchAlgorithms import word2vec_search, transformer_search
 
 class TestExtractLinks:
 
@@ -76,6 +86,24 @@ class TestExtractLinks:
         rusty_info = load_htmls["Rusty breasted nunlet"]
         assert rusty_info[1] == extract_links(rusty_info[0])
 
+    ############################ Streaming Extractor Tests ############################
+
+    def test_stream_sipsi(self,load_htmls):
+        sipsi_info = load_htmls["Sipsi"]
+        assert sipsi_info[1] == stream_extract_links(sipsi_info[0])
+
+    def test_stream_cornet(self,load_htmls):
+        cornet_info = load_htmls["Cornet"]
+        assert cornet_info[1] == stream_extract_links(cornet_info[0])
+
+    def test_stream_rusty(self,load_htmls):
+        rusty_info = load_htmls["Rusty breasted nunlet"]
+        assert rusty_info[1] == stream_extract_links(rusty_info[0])
+
+    def test_stream_no_main_content(self):
+        with pytest.raises(RuntimeError):
+            stream_extract_links(b'<html><body><a href="/wiki/Europe">Europe</a></body></html>')
+
 class TestHelperFunc:
 
     ############################ Clean Link Tests ############################ 
@@ -110,7 +138,112 @@ class TestHelperFunc:
                             "https://en.wikipedia.org/wiki/Honorific_nicknames_in_popular_music",
                             "https://en.wikipedia.org/wiki/%C3%89tude",
                             "https://en.wikipedia.org/wiki/B%C3%BClban"]) == "Europe → Honorific nicknames in popular music → Étude → Bülban"
-                                   
+
+
+class TitleEncoder:
+    """stands in for a SentenceTransformer, records every batch it encodes"""
+
+    def __init__(self, events : list):
+        self.events = events
+
+    def encode(self, titles, batch_size = 32, convert_to_numpy = True):
+        self.events.append(("encode", list(titles)))
+        return np.stack([np.random.default_rng(abs(hash(title)) % 2**32).normal(size=8) for title in titles]).astype(np.float32)
+
+@pytest.fixture(scope="module")
+def web_graph() -> nx.DiGraph:
+    G = nx.gnp_random_graph(150, 0.04, seed=9, directed=True)
+    return nx.relabel_nodes(G, lambda node: f"https://en.wikipedia.org/wiki/Article_{node}")
+
+class TestPrefetching:
+
+    @pytest.fixture
+    def mirrored(self, web_graph, monkeypatch):
+        with MockWikiServer(web_graph) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            monkeypatch.setattr(wiki, "default_cache", None)
+            monkeypatch.setattr(wiki, "default_fetcher", fetcher)
+            yield server
+
+    def test_prefetched_pages(self, mirrored, web_graph):
+        urls = list(web_graph.nodes)[:4]
+        with wiki.LinkPrefetcher(max_pending=3) as prefetcher:
+            prefetcher.prefetch(urls[:3])
+            for future in list(prefetcher.pages.values()):
+                future.result()
+            assert [prefetcher.get_adj_wiki(url) for url in urls] == [set(web_graph.successors(url)) for url in urls]
+            assert prefetcher.hits == 3 and prefetcher.misses == 1 and not prefetcher.pages
+
+    def test_cache_stats_unchanged(self, mirrored, web_graph, tmp_path):
+        urls = list(web_graph.nodes)[:4]
+        cache = WikiCache(str(tmp_path / "cache.sqlite"))
+        wiki.get_adj_wiki(urls[0], cache=cache)
+        with wiki.LinkPrefetcher(max_pending=3, cache=cache) as prefetcher:
+            prefetcher.prefetch(urls)
+            assert list(prefetcher.pages) == urls[1:]
+            prefetcher.get_adj_wiki(urls[0])
+        # only the real fetches are counted
+        assert cache.stats()['hits'] == cache.stats()['misses'] == 1
+        cache.close()
+
+    def test_losers_cancelled(self, web_graph, monkeypatch):
+        urls = list(web_graph.nodes)
+        with MockWikiServer(web_graph, latency=0.05) as server, WikiFetcher(backoff_factor=0) as fetcher:
+            monkeypatch.setattr(wiki, "default_mirror", server.url)
+            with wiki.LinkPrefetcher(max_pending=1, cache=None, fetcher=fetcher) as prefetcher:
+                prefetcher.prefetch(urls[:5])
+                while not prefetcher.pages[urls[0]].running():
+                    time.sleep(0.001)
+                prefetcher.prefetch(urls[1:2])
+                # the first download had already started, the queued ones that lost are dropped
+                assert prefetcher.cancelled == 3 and list(prefetcher.pages) == [urls[0], urls[1]]
+                # the page still queued behind the first one is fetched right away instead
+                assert prefetcher.get_adj_wiki(urls[1]) == set(web_graph.successors(urls[1]))
+                assert prefetcher.misses == 1 and prefetcher.hits == 0
+
+    def test_api_backend_and_daemon_not_prefetched(self, mirrored, web_graph, monkeypatch):
+        url = list(web_graph.nodes)[0]
+        monkeypatch.setattr(wiki, "default_backend", "api")
+        with wiki.LinkPrefetcher(max_pending=3) as prefetcher:
+            prefetcher.prefetch([url])
+            assert not prefetcher.pages
+            # the links come from the api like every other hop of the game
+            assert prefetcher.get_adj_wiki(url) == set(web_graph.successors(url))
+            assert mirrored.stats()['pages_served'] == 0 and mirrored.stats()['api_calls'] > 0
+
+        monkeypatch.setattr(wiki, "default_backend", "html")
+        monkeypatch.setattr(wiki, "default_daemon", "http://127.0.0.1:1")
+        with wiki.LinkPrefetcher(max_pending=3) as prefetcher:
+            prefetcher.prefetch([url])
+            assert not prefetcher.pages
+
+    def test_search_unchanged(self, mirrored, web_graph):
+        titles = ["Article"] + [str(node) for node in range(150)]
+        model = KeyedVectors(vector_size=8)
+        model.add_vectors(titles, np.random.default_rng(0).normal(size=(len(titles), 8)).astype(np.float32))
+        source, target = list(web_graph.nodes)[0], list(web_graph.nodes)[-1]
+        assert word2vec_search(source, target, model, prefetch=3) == word2vec_search(source, target, model)
+
+    def test_prefetch_before_encoding(self, mirrored, web_graph, monkeypatch):
+        events = []
+        prefetch = wiki.LinkPrefetcher.prefetch
+        def record(prefetcher, urls):
+            events.append(("prefetch", list(urls)))
+            prefetch(prefetcher, urls)
+        monkeypatch.setattr(wiki.LinkPrefetcher, "prefetch", record)
+
+        source, target = list(web_graph.nodes)[0], list(web_graph.nodes)[-1]
+        model = TitleEncoder(events)
+        cache = EncoderCache(model)
+        # half the titles were encoded in earlier games
+        cache.encode([clean_wiki_link(url) for url in list(web_graph.nodes)[::2]] + [clean_wiki_link(target)])
+        expected = transformer_search(source, target, TitleEncoder([]))
+
+        events.clear()
+        assert transformer_search(source, target, model, cache, prefetch=3) == expected
+        # the best already encoded candidates start downloading before the model encodes the others
+        first = next(i for i, (kind, _) in enumerate(events) if kind == "encode")
+        assert first > 0 and events[first - 1][0] == "prefetch" and events[first - 1][1]
 
 
 if __name__ == "__main__":